@@ -1,24 +1,28 @@
 # app/app.py
 
 import os
+import asyncio
 import hashlib
+from contextlib import asynccontextmanager
+from typing import List
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from fastapi import FastAPI, Security, File, UploadFile, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .schema import (
-  MenuSchema, AddStaffSchema, UpdateStaffEmailSchema, UpdateMenuItemSchema,
-  MenuScanResponse, CreateOrderSchema, UpdateOrderStatusSchema,
-  UpdateUserProfileSchema, VerifyPickupSchema, VerifyPaymentSchema,
+  MenuSchema, AddStaffSchema, BulkAddStaffSchema, UpdateStaffEmailSchema, UpdateMenuItemSchema,
+  BulkMenuUpdateSchema, MenuScanResponse, CreateOrderSchema, UpdateOrderStatusSchema, BulkOrderStatusSchema,
+  UpdateUserProfileSchema, VerifyPickupSchema, PickupSyncSchema, VerifyPaymentSchema,
   UpdateStaffProfileSchema, UpdateResalePriceSchema
 )
 from .auth import authenticate_student, verify_staff_access
 from .staff import (
-  upload_menu, get_menu, scan_menu_image, update_menu_item, delete_menu_item,
-  add_staff_member, get_stall_orders, update_order_status_staff, get_staff_me,
-  verify_order_pickup, activate_staff, update_staff_profile,
+  upload_menu, get_menu, scan_menu_image, scan_menu_image_stream, update_menu_item, bulk_update_menu_items, delete_menu_item,
+  add_staff_member, add_staff_members_bulk, get_stall_orders, update_order_status_staff, bulk_update_order_status, get_staff_me, get_pickup_token_key,
+  verify_order_pickup, sync_pickups, activate_staff, update_staff_profile,
   get_stall_resale_items, update_resale_price
 )
 from .manager import (
@@ -31,6 +35,18 @@ from .user import (
   get_discounted_feed, buy_resale_item
 )
 from .webhook import router as webhook_router
+from .responses import JSONResponse
+from .compression import CompressionMiddleware
+from .negotiation import ContentNegotiationMiddleware
+from .mailer import start_mail_sender, stop_mail_sender
+from .warmup import start_warmup, stop_warmup, readiness
+from .colleges import start_college_refresh, stop_college_refresh
+from .sweeps import start_sweeps, stop_sweeps
+from .archive import (
+  ARCHIVE_CURSOR_HEADER, run_archive, is_archive_request_authorized, start_archive_schedule, stop_archive_schedule
+)
+from .tracing import TracingMiddleware, configure_tracing, shutdown_tracing
+from .metrics import MetricsMiddleware, instrument_clients, is_metrics_request_authorized, registry as metrics_registry
 
 def rate_limit_key(request: Request):
   """
@@ -51,12 +67,54 @@ def rate_limit_key(request: Request):
 
 limiter = Limiter(key_func=rate_limit_key)
 
-app = FastAPI(docs_url=None, redoc_url=None)
+instrument_clients()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  configure_tracing()
+  start_warmup()
+  start_college_refresh()
+  start_mail_sender()
+  start_archive_schedule()
+  start_sweeps()
+  yield
+  await stop_sweeps()
+  await stop_archive_schedule()
+  await stop_mail_sender()
+  await stop_college_refresh()
+  await stop_warmup()
+  shutdown_tracing()
+
+app = FastAPI(
+  docs_url=None,
+  redoc_url=None,
+  lifespan=lifespan,
+  default_response_class=JSONResponse
+)
 
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    excluded_paths=("/webhook/", "/stream"),
+    cached_paths=("/v1/user/menu",),
+    cache_bytes=int(os.getenv("COMPRESSION_CACHE_BYTES", str(8 * 1024 * 1024))),
+)
+
+app.add_middleware(
+    ContentNegotiationMiddleware,
+    msgpack_body_paths=(
+        "/v1/user/order/create",
+        "/v1/staff/add-members/bulk",
+        "/v1/staff/menu/bulk-update",
+        "/v1/staff/orders/pickup-sync",
+        "/v1/staff/orders/bulk-status",
+    ),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -73,22 +131,60 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[ARCHIVE_CURSOR_HEADER],
 )
 
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 security = HTTPBearer()
 
+# Built once: health checks answer from memory without touching any backend.
+HEALTH_PAYLOAD = {
+  "status": "ok",
+  "service": "greenplate-backend",
+  "environment": os.getenv("ENV", "development")
+}
+
 @app.get("/v1/health", tags=["health"])
-@limiter.limit("10/minute")
-def health_check(request: Request):
+@limiter.exempt
+async def health_check():
   """
-    Health check endpoint for monitoring service availability.
+    Liveness check: the process is up and serving. Not rate limited, so
+    frequent load balancer probes are never answered with 429.
   """
-  _ = request
-  return {
-      "status": "ok",
-      "service": "greenplate-backend",
-      "environment": os.getenv("ENV", "development")
-  }
+  return HEALTH_PAYLOAD
+
+@app.get("/v1/ready", tags=["health"])
+@limiter.exempt
+async def readiness_check():
+  """
+    Readiness check: 503 while the startup warm-up of Firestore, the Firebase
+    certs and Razorpay is running, then 200 with per-dependency timings.
+  """
+  ready, body = readiness()
+  return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+  """
+    Prometheus text exposition of request latency and backend call counts.
+  """
+  if not is_metrics_request_authorized(request.headers.get("authorization")):
+    return JSONResponse(status_code=401, content={"message": "Unauthorized"})
+  return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/internal/archive/orders", include_in_schema=False)
+@limiter.exempt
+async def archive_orders_endpoint(request: Request, max_orders: int = None, dry_run: bool = False):
+  """
+    Runs one order archive pass (for Cloud Scheduler). Requires
+    `Authorization: Bearer $ARCHIVE_TOKEN`.
+  """
+  if not is_archive_request_authorized(request.headers.get("authorization")):
+    return JSONResponse(status_code=401, content={"message": "Unauthorized"})
+  result = await asyncio.to_thread(run_archive, max_orders=max_orders, dry_run=dry_run)
+  return JSONResponse(status_code=409 if result["status"] == "already_running" else 200, content=result)
 
 app.include_router(webhook_router)
 
@@ -146,9 +242,11 @@ async def create_order_endpoint(
 @limiter.limit("20/minute")
 async def get_student_orders_endpoint(
     request: Request,
+    include_archive: bool = False,
+    before: str = None,
     credentials: HTTPAuthorizationCredentials = Security(security)
 ):
-    return await get_user_orders(credentials.credentials)
+    return await get_user_orders(credentials.credentials, include_archive=include_archive, before=before)
 
 @app.post("/v1/user/order/verify",tags=["user"])
 @limiter.limit("5/minute")
@@ -196,6 +294,15 @@ async def add_staff_endpoint(
 ):
     return await add_staff_member(staff_data, credentials.credentials)
 
+@app.post("/v1/staff/add-members/bulk", tags=["manager"])
+@limiter.limit("2/minute")
+async def add_staff_bulk_endpoint(
+    request: Request,
+    bulk_data: BulkAddStaffSchema,
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await add_staff_members_bulk(bulk_data, credentials.credentials)
+
 @app.get("/v1/staff/list", tags=["manager"])
 @limiter.limit("20/minute")
 async def get_staff_list_endpoint(
@@ -239,6 +346,14 @@ async def get_staff_me_endpoint(
 ):
     return await get_staff_me(credentials.credentials)
 
+@app.get("/v1/staff/pickup-token-key", tags=["staff", "manager"])
+@limiter.limit("5/minute")
+async def get_pickup_token_key_endpoint(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await get_pickup_token_key(credentials.credentials)
+
 @app.patch("/v1/staff/profile", tags=["staff", "manager"])
 @limiter.limit("10/minute")
 async def update_staff_profile_endpoint(
@@ -269,10 +384,28 @@ async def get_staff_menu(
 @limiter.limit("5/minute")
 async def scan_menu_endpoint(
     request: Request,
-    file: UploadFile = File(...),
+    files: List[UploadFile] = File(..., alias="file"),
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await scan_menu_image(files, credentials.credentials)
+
+@app.post("/v1/staff/menu/scan-image/stream", tags=["staff", "manager"])
+@limiter.limit("5/minute")
+async def scan_menu_stream_endpoint(
+    request: Request,
+    files: List[UploadFile] = File(..., alias="file"),
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await scan_menu_image_stream(files, credentials.credentials)
+
+@app.post("/v1/staff/menu/bulk-update", tags=["staff", "manager"])
+@limiter.limit("20/minute")
+async def bulk_update_menu_endpoint(
+    request: Request,
+    update_data: BulkMenuUpdateSchema,
     credentials: HTTPAuthorizationCredentials = Security(security)
 ):
-    return await scan_menu_image(file, credentials.credentials)
+    return await bulk_update_menu_items(update_data, credentials.credentials)
 
 @app.patch("/v1/staff/menu/{item_id}", tags=["staff", "manager"])
 @limiter.limit("20/minute")
@@ -298,9 +431,22 @@ async def delete_menu_item_endpoint(
 async def get_staff_orders_endpoint(
     request: Request,
     status: str = "PAID",
+    include_archive: bool = False,
+    before: str = None,
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await get_stall_orders(
+        credentials.credentials, status_filter=status, include_archive=include_archive, before=before
+    )
+
+@app.post("/v1/staff/orders/bulk-status", tags=["staff", "manager"])
+@limiter.limit("30/minute")
+async def bulk_update_order_status_endpoint(
+    request: Request,
+    bulk_data: BulkOrderStatusSchema,
     credentials: HTTPAuthorizationCredentials = Security(security)
 ):
-    return await get_stall_orders(credentials.credentials, status_filter=status)
+    return await bulk_update_order_status(bulk_data, credentials.credentials)
 
 @app.patch("/v1/staff/orders/{order_id}/status", tags=["staff", "manager"])
 @limiter.limit("30/minute")
@@ -321,6 +467,15 @@ async def verify_pickup_endpoint(
 ):
     return await verify_order_pickup(verify_data, credentials.credentials)
 
+@app.post("/v1/staff/orders/pickup-sync", tags=["staff", "manager"])
+@limiter.limit("20/minute")
+async def sync_pickups_endpoint(
+    request: Request,
+    sync_data: PickupSyncSchema,
+    credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    return await sync_pickups(sync_data, credentials.credentials)
+
 @app.get("/v1/staff/resale/items", tags=["staff"])
 @limiter.limit("30/minute")
 async def get_staff_resale_items_endpoint(
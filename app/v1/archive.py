@@ -0,0 +1,273 @@
+# app/archive.py
+
+import os
+import hmac
+import time
+import asyncio
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from .firebase_init import db
+from .storage import transactional
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+# Closed orders older than ARCHIVE_AFTER_DAYS move out of the hot `orders`
+# collection into a partition per month of creation:
+# order_archive/{YYYY-MM}/archived_orders/{order_id} = {...order, archived_at}
+# Each chunk is copied and deleted in one transaction together with the
+# run's checkpoint (archive_checkpoints/orders), so an interrupted run
+# resumes where it stopped and no order is lost or left in both places.
+ARCHIVE_COLLECTION = "order_archive"
+ARCHIVE_SUBCOLLECTION = "archived_orders"
+CHECKPOINT_REF_PATH = "archive_checkpoints/orders"
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVED_STATUSES = ("CLAIMED", "COMPLETED", "CANCELLED", "EXPIRED", "FAILED")
+# Two writes per order (archive copy + delete) and one for the checkpoint.
+ARCHIVE_CHUNK = int(os.getenv("ARCHIVE_CHUNK", "200"))
+# Keeps the job from competing with live traffic for Firestore write capacity.
+ARCHIVE_WRITES_PER_SECOND = float(os.getenv("ARCHIVE_WRITES_PER_SECOND", "200"))
+ARCHIVE_MAX_PER_RUN = int(os.getenv("ARCHIVE_MAX_PER_RUN", "5000"))
+# 0 disables the in-process schedule; use the trigger endpoint or the CLI.
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "0"))
+ARCHIVE_TOKEN = os.getenv("ARCHIVE_TOKEN")
+
+# Order lists read the archive only when the client asks for older history
+# (include_archive=true). Archived orders come newest first in pages of
+# ARCHIVE_PAGE_SIZE; the next page's cursor (the last order's created_at and
+# id, "<created_at>_<order_id>") is returned in the ARCHIVE_CURSOR_HEADER
+# response header and sent back as `before`.
+ARCHIVE_PAGE_SIZE = int(os.getenv("ARCHIVE_PAGE_SIZE", "50"))
+ARCHIVE_CURSOR_HEADER = "X-Archive-Cursor"
+ARCHIVE_CURSOR_SEPARATOR = "_"
+# google.cloud.firestore.FieldPath.document_id(): orders by document path.
+DOCUMENT_ID_FIELD = "__name__"
+
+_run_lock = threading.Lock()
+_archive_task = None
+
+def archive_month(created_at) -> str:
+  return created_at.strftime("%Y-%m")
+
+def archive_collection(month: str):
+  return db.collection(ARCHIVE_COLLECTION).document(month).collection(ARCHIVE_SUBCOLLECTION)
+
+def archived_orders():
+  """Query over every month's archive partition."""
+  return db.collection_group(ARCHIVE_SUBCOLLECTION)
+
+def archive_cutoff(now: datetime = None) -> datetime:
+  return (now or datetime.now(timezone.utc)) - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+def parse_archive_cursor(value: str):
+  """
+    The `before` cursor as (created_at, order_id), created_at an aware
+    datetime (naive ones are UTC) and order_id None for a bare timestamp;
+    raises ValueError.
+  """
+  if not value:
+    return None
+  timestamp, _, order_id = value.partition(ARCHIVE_CURSOR_SEPARATOR)
+  created_at = datetime.fromisoformat(timestamp)
+  if created_at.tzinfo is None:
+    created_at = created_at.replace(tzinfo=timezone.utc)
+  return created_at, order_id or None
+
+def _archive_cursor(snapshot) -> str:
+  # UTC with a "Z" suffix, so the cursor needs no escaping in a query string.
+  created_at = snapshot.to_dict()["created_at"].astimezone(timezone.utc)
+  return f"{created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}{ARCHIVE_CURSOR_SEPARATOR}{snapshot.id}"
+
+def archived_order_page(filters: list, before: tuple = None, limit: int = ARCHIVE_PAGE_SIZE):
+  """
+    One page of archived orders matching `filters` ([(field, op, value)]),
+    newest first (ties by order id), after the `before` cursor from
+    parse_archive_cursor. Returns (snapshots, cursor for the next page or None).
+  """
+  query = archived_orders()
+  for field, op, value in filters:
+    query = query.where(field, op, value)
+  query = (
+    query.order_by("created_at", direction=firestore.Query.DESCENDING)
+    .order_by(DOCUMENT_ID_FIELD, direction=firestore.Query.DESCENDING)
+  )
+
+  # Orders sharing created_at are told apart by their path, which is what
+  # the collection group sorts on; the month partition follows from the date.
+  if before is not None:
+    created_at, order_id = before
+    if order_id is None:
+      query = query.start_after({"created_at": created_at})
+    else:
+      order_ref = archive_collection(archive_month(created_at)).document(order_id)
+      query = query.start_after({"created_at": created_at, DOCUMENT_ID_FIELD: order_ref})
+
+  snapshots = list(query.limit(limit + 1).stream())
+  if len(snapshots) <= limit:
+    return snapshots, None
+  snapshots = snapshots[:limit]
+  return snapshots, _archive_cursor(snapshots[-1])
+
+def _checkpoint_ref():
+  return db.document(CHECKPOINT_REF_PATH)
+
+def _candidates(cutoff: datetime, after, limit: int) -> list:
+  query = (
+    db.collection("orders")
+    .where("status", "in", list(ARCHIVED_STATUSES))
+    .where("created_at", "<", cutoff)
+  )
+  if after is not None:
+    query = query.where("created_at", ">=", after)
+  return [snapshot.reference for snapshot in query.order_by("created_at").limit(limit).stream()]
+
+def _archive_chunk(refs: list, cutoff: datetime) -> tuple:
+  """
+    Moves one chunk in a transaction, re-checking each order so one that
+    changed since it was listed stays put. Returns (archived, last created_at).
+  """
+  transaction = db.transaction()
+
+  @transactional
+  def archive_in_transaction(transaction):
+    checkpoint = _checkpoint_ref().get(transaction=transaction)
+    progress = checkpoint.to_dict() if checkpoint.exists else {}
+
+    archived = 0
+    last_created_at = None
+    for snapshot in transaction.get_all(refs):
+      if not snapshot.exists:
+        continue
+      data = snapshot.to_dict()
+      created_at = data.get("created_at")
+      if created_at is None:
+        continue
+      last_created_at = created_at if last_created_at is None else max(last_created_at, created_at)
+      if data.get("status") not in ARCHIVED_STATUSES or created_at >= cutoff:
+        continue
+
+      transaction.set(archive_collection(archive_month(created_at)).document(snapshot.id), {
+        **data,
+        "archived_at": firestore.SERVER_TIMESTAMP,
+      })
+      transaction.delete(snapshot.reference)
+      archived += 1
+
+    transaction.set(_checkpoint_ref(), {
+      "last_created_at": last_created_at or progress.get("last_created_at"),
+      "archived_in_run": progress.get("archived_in_run", 0) + archived,
+      "archived_total": progress.get("archived_total", 0) + archived,
+      "updated_at": firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+    return archived, last_created_at
+
+  return archive_in_transaction(transaction)
+
+def run_archive(max_orders: int = None, dry_run: bool = False) -> dict:
+  """
+    Archives closed orders older than the cutoff, resuming from the last
+    checkpoint of an unfinished run. Stops after `max_orders` (default
+    ARCHIVE_MAX_PER_RUN); the next run continues from there. Writes are
+    paced at ARCHIVE_WRITES_PER_SECOND.
+  """
+  if not _run_lock.acquire(blocking=False):
+    return {"status": "already_running"}
+
+  try:
+    max_orders = max_orders or ARCHIVE_MAX_PER_RUN
+    checkpoint = _checkpoint_ref().get()
+    progress = checkpoint.to_dict() if checkpoint.exists else {}
+
+    resuming = bool(progress) and not progress.get("completed")
+    if resuming:
+      cutoff = progress["cutoff"]
+      after = progress.get("last_created_at")
+    else:
+      cutoff = archive_cutoff()
+      after = None
+
+    if dry_run:
+      return {"status": "dry_run", "cutoff": cutoff.isoformat(), "candidates": len(_candidates(cutoff, after, max_orders))}
+
+    if not resuming:
+      _checkpoint_ref().set({
+        "run_started_at": datetime.now(timezone.utc),
+        "cutoff": cutoff,
+        "last_created_at": None,
+        "archived_in_run": 0,
+        "completed": False,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+      }, merge=True)
+
+    archived = 0
+    scanned = 0
+
+    while scanned < max_orders:
+      refs = _candidates(cutoff, after, min(ARCHIVE_CHUNK, max_orders - scanned))
+      if not refs:
+        _checkpoint_ref().set({"completed": True, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+        return {"status": "completed", "cutoff": cutoff.isoformat(), "archived": archived, "scanned": scanned}
+
+      started = time.perf_counter()
+      moved, last_created_at = _archive_chunk(refs, cutoff)
+      archived += moved
+      scanned += len(refs)
+      if last_created_at is not None:
+        after = last_created_at
+
+      # Pace the next chunk so the run stays under the configured write rate.
+      budget = (2 * moved + 1) / ARCHIVE_WRITES_PER_SECOND if ARCHIVE_WRITES_PER_SECOND > 0 else 0
+      pause = budget - (time.perf_counter() - started)
+      if pause > 0:
+        time.sleep(pause)
+
+    return {"status": "partial", "cutoff": cutoff.isoformat(), "archived": archived, "scanned": scanned}
+
+  finally:
+    _run_lock.release()
+
+def is_archive_request_authorized(authorization: str) -> bool:
+  """The trigger endpoint is disabled unless ARCHIVE_TOKEN is set."""
+  if not ARCHIVE_TOKEN:
+    return False
+  return hmac.compare_digest(authorization or "", f"Bearer {ARCHIVE_TOKEN}")
+
+async def _run_archive_schedule():
+  while True:
+    await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+    try:
+      result = await asyncio.to_thread(run_archive)
+      print(f"Order archive run: {result}")
+    except Exception as e:
+      print(f"Order archive run failed: {e}")
+
+def start_archive_schedule():
+  global _archive_task
+  if _archive_task is not None or ARCHIVE_INTERVAL_HOURS <= 0:
+    return
+  _archive_task = asyncio.create_task(_run_archive_schedule())
+
+async def stop_archive_schedule():
+  global _archive_task
+  if _archive_task is None:
+    return
+
+  _archive_task.cancel()
+  try:
+    await _archive_task
+  except asyncio.CancelledError:
+    pass
+
+  _archive_task = None
+
+def main():
+  parser = argparse.ArgumentParser(description="Move closed orders older than ARCHIVE_AFTER_DAYS to order_archive.")
+  parser.add_argument("--max-orders", type=int, default=None, help=f"stop after this many (default {ARCHIVE_MAX_PER_RUN})")
+  parser.add_argument("--dry-run", action="store_true", help="only count the orders that would be archived")
+  args = parser.parse_args()
+  print(run_archive(max_orders=args.max_orders, dry_run=args.dry_run))
+
+if __name__ == "__main__":
+  main()
@@ -1,33 +1,19 @@
 # app/auth.py
 
-from fastapi.responses import JSONResponse
+from .responses import JSONResponse
 from starlette import status
-from firebase_admin import auth, firestore
 from .firebase_init import db
+from .colleges import CollegeLookupError, get_college_by_email
+from .lazy import lazy_import
+
+auth = lazy_import("firebase_admin.auth")
+firestore = lazy_import("firebase_admin.firestore")
 
 def _create_response(status_code: int, message: str, **kwargs):
   content = {"message": message}
   content.update(kwargs)
   return JSONResponse(status_code=status_code, content=content)
 
-def _get_college_by_domain(email: str):
-  try:
-    if not email: return None, None
-    domain = email.split("@")[-1]
-    query = (
-      db.collection("colleges")
-      .where("domains", "array_contains", domain)
-      .limit(1)
-    )
-    docs = query.stream()
-    for doc in docs:
-      return doc.id, doc.to_dict()
-    return None, None
-  except Exception as e:
-    print(f"College lookup error: {e}")
-    return None, None
-
-
 async def authenticate_student(token: str):
   try:
     try:
@@ -74,7 +60,13 @@ async def authenticate_student(token: str):
         college_id=user_data.get("college_id")
       )
 
-    college_id, college_data = _get_college_by_domain(email)
+    try:
+      college_id, college_data = get_college_by_email(email)
+    except CollegeLookupError:
+      return _create_response(
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        "Could not verify your college domain. Please try again."
+      )
 
     if not college_id:
       try:
@@ -130,7 +122,10 @@ async def verify_staff_access(token: str):
         role=data.get("role"),
       )
 
-    college_id, _ = _get_college_by_domain(email)
+    try:
+      college_id, _ = get_college_by_email(email)
+    except CollegeLookupError:
+      return _create_response(status.HTTP_503_SERVICE_UNAVAILABLE, "Could not verify college domain.")
 
     if not college_id:
       return _create_response(status.HTTP_403_FORBIDDEN, "Domain not registered.")
@@ -0,0 +1,50 @@
+# app/batching.py
+
+FIRESTORE_BATCH_LIMIT = 500
+
+def chunked(items, size: int):
+  items = list(items)
+  for start in range(0, len(items), size):
+    yield items[start:start + size]
+
+class ChunkedWriteBatch:
+  """
+    Write batch that commits on its own before going past Firestore's
+    500-writes-per-batch limit, so callers can queue any number of writes.
+  """
+
+  def __init__(self, db, limit: int = FIRESTORE_BATCH_LIMIT):
+    self._db = db
+    self._limit = limit
+    self._batch = db.batch()
+    self._pending = 0
+    self.commits = 0
+    self.writes = 0
+
+  def _before_write(self):
+    if self._pending >= self._limit:
+      self._flush()
+    self._pending += 1
+    self.writes += 1
+
+  def set(self, ref, data: dict, merge: bool = False):
+    self._before_write()
+    self._batch.set(ref, data, merge=merge)
+
+  def update(self, ref, data: dict):
+    self._before_write()
+    self._batch.update(ref, data)
+
+  def delete(self, ref):
+    self._before_write()
+    self._batch.delete(ref)
+
+  def _flush(self):
+    self._batch.commit()
+    self.commits += 1
+    self._batch = self._db.batch()
+    self._pending = 0
+
+  def commit(self):
+    if self._pending:
+      self._flush()
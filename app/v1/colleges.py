@@ -0,0 +1,120 @@
+# app/colleges.py
+
+import os
+import time
+import asyncio
+import threading
+from .firebase_init import db
+
+# Email domain -> college, for student sign-up and staff verification. The
+# colleges collection is small and rarely changes, so every instance keeps
+# the whole map in memory: loaded at startup, reloaded every
+# COLLEGE_REFRESH_SECONDS. Once loaded, a domain missing from the map is
+# unregistered and is answered without touching Firestore.
+#
+# Until the first load succeeds, lookups query Firestore for the domain and
+# cache the answer, a miss for COLLEGE_NEGATIVE_TTL_SECONDS.
+COLLEGE_REFRESH_SECONDS = float(os.getenv("COLLEGE_REFRESH_SECONDS", "300"))
+COLLEGE_NEGATIVE_TTL_SECONDS = float(os.getenv("COLLEGE_NEGATIVE_TTL_SECONDS", "60"))
+COLLEGE_FIELDS = ["name", "domains"]
+
+class CollegeLookupError(Exception):
+  """Firestore could not be asked about a domain the cache does not know yet."""
+
+class CollegeDomainCache:
+  def __init__(self):
+    self._domains = None
+    self._loaded_at = None
+    self._lookups = {}
+    self._lock = threading.Lock()
+
+  @property
+  def loaded(self) -> bool:
+    return self._domains is not None
+
+  @property
+  def loaded_at(self):
+    return self._loaded_at
+
+  def load(self):
+    """Reads every college and swaps in the new map; raises on failure and keeps the old one."""
+    domains = {}
+    for doc in db.collection("colleges").select(COLLEGE_FIELDS).stream():
+      data = doc.to_dict()
+      for domain in data.get("domains") or []:
+        domains.setdefault(normalize_domain(domain), (doc.id, data))
+
+    with self._lock:
+      self._domains = domains
+      self._loaded_at = time.time()
+      self._lookups.clear()
+
+  def lookup(self, domain: str):
+    """(college_id, college data) for the domain, or (None, None) if it is not registered."""
+    domain = normalize_domain(domain)
+    if not domain:
+      return None, None
+
+    domains = self._domains
+    if domains is not None:
+      return domains.get(domain, (None, None))
+
+    cached = self._lookups.get(domain)
+    if cached is not None and (cached[0] is not None or cached[1] > time.monotonic()):
+      return cached[0] or (None, None)
+
+    try:
+      query = db.collection("colleges").where("domains", "array_contains", domain).limit(1)
+      found = next(((doc.id, doc.to_dict()) for doc in query.stream()), None)
+    except Exception as e:
+      raise CollegeLookupError(str(e)) from e
+
+    with self._lock:
+      self._lookups[domain] = (found, time.monotonic() + COLLEGE_NEGATIVE_TTL_SECONDS)
+    return found or (None, None)
+
+  def clear(self):
+    with self._lock:
+      self._domains = None
+      self._loaded_at = None
+      self._lookups.clear()
+
+cache = CollegeDomainCache()
+
+_refresh_task = None
+
+def normalize_domain(domain: str) -> str:
+  return (domain or "").strip().lower()
+
+def get_college_by_email(email: str):
+  """(college_id, college data) for the email's domain; raises CollegeLookupError."""
+  if not email or "@" not in email:
+    return None, None
+  return cache.lookup(email.rsplit("@", 1)[-1])
+
+async def _run_college_refresh():
+  while True:
+    try:
+      await asyncio.to_thread(cache.load)
+    except Exception as e:
+      print(f"College cache refresh failed: {e}")
+    await asyncio.sleep(COLLEGE_REFRESH_SECONDS)
+
+def start_college_refresh():
+  global _refresh_task
+  if _refresh_task is not None:
+    return
+  _refresh_task = asyncio.create_task(_run_college_refresh())
+
+async def stop_college_refresh():
+  global _refresh_task
+  if _refresh_task is None:
+    return
+
+  _refresh_task.cancel()
+  try:
+    await _refresh_task
+  except asyncio.CancelledError:
+    pass
+
+  _refresh_task = None
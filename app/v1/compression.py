@@ -0,0 +1,189 @@
+# app/compression.py
+
+import gzip
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+  import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+  brotli = None
+
+SKIPPED_CONTENT_TYPES = ("text/event-stream", "image/", "application/octet-stream")
+
+def _parse_accept_encoding(header: str) -> dict:
+  accepted = {}
+  for part in header.split(","):
+    token, _, params = part.strip().partition(";")
+    token = token.strip().lower()
+    if not token:
+      continue
+
+    quality = 1.0
+    params = params.strip()
+    if params.startswith("q="):
+      try:
+        quality = float(params[2:])
+      except ValueError:
+        quality = 0.0
+    accepted[token] = quality
+  return accepted
+
+def negotiate_encoding(header: str):
+  accepted = _parse_accept_encoding(header or "")
+  wildcard = accepted.get("*", 0.0)
+
+  best, best_quality = None, 0.0
+  for encoding in (("br", "gzip") if brotli else ("gzip",)):
+    quality = accepted.get(encoding, wildcard)
+    if quality > best_quality:
+      best, best_quality = encoding, quality
+  return best
+
+class CompressedBodyCache:
+  """
+    LRU of compressed bodies keyed by the raw body, so identical
+    payloads (e.g. the same college menu served to every student) are only
+    compressed once. Bounded by the bytes held (raw + compressed), not the
+    entry count, so a few large bodies cannot grow it past `max_bytes`.
+  """
+
+  def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_body_size: int = 1024 * 1024):
+    self.max_bytes = max_bytes
+    self.max_body_size = min(max_body_size, max_bytes)
+    self._entries = OrderedDict()
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+
+  def get_or_compress(self, encoding: str, body: bytes, compress):
+    if len(body) > self.max_body_size or self.max_bytes <= 0:
+      return compress(body)
+
+    # hash() is much cheaper than a cryptographic digest; the stored raw body
+    # is compared on hit so a collision can never serve the wrong payload.
+    key = (encoding, len(body), hash(body))
+    cached = self._entries.get(key)
+    if cached is not None and cached[0] == body:
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return cached[1]
+
+    self.misses += 1
+    compressed = compress(body)
+    if cached is not None:
+      self.size -= len(cached[0]) + len(cached[1])
+    self._entries[key] = (body, compressed)
+    self.size += len(body) + len(compressed)
+    while self.size > self.max_bytes and self._entries:
+      _, (old_body, old_compressed) = self._entries.popitem(last=False)
+      self.size -= len(old_body) + len(old_compressed)
+    return compressed
+
+class CompressionMiddleware:
+  """
+    Compresses response bodies with brotli or gzip, depending on
+    Accept-Encoding. Streaming responses, excluded paths and bodies outside
+    [minimum_size, maximum_size] are passed through untouched.
+
+    Only `cached_paths` keep their compressed bodies in the cache: list
+    routes whose body is shared by many callers (the college menu), never
+    per-user responses, which would hold personal data and evict the shared
+    bodies without ever being hit.
+  """
+
+  def __init__(
+    self,
+    app,
+    minimum_size: int = 1024,
+    maximum_size: int = 4 * 1024 * 1024,
+    excluded_paths: tuple = (),
+    gzip_level: int = 6,
+    brotli_quality: int = 4,
+    cached_paths: tuple = (),
+    cache_bytes: int = 8 * 1024 * 1024,
+  ):
+    self.app = app
+    self.minimum_size = minimum_size
+    self.maximum_size = maximum_size
+    self.excluded_paths = tuple(excluded_paths)
+    self.gzip_level = gzip_level
+    self.brotli_quality = brotli_quality
+    self.cached_paths = tuple(cached_paths)
+    self.cache = CompressedBodyCache(max_bytes=cache_bytes)
+
+  @staticmethod
+  def _matches(path: str, patterns: tuple) -> bool:
+    return any(
+      path.startswith(pattern) if pattern.endswith("/") else (path == pattern or path.endswith(pattern))
+      for pattern in patterns
+    )
+
+  def _is_excluded(self, path: str) -> bool:
+    return self._matches(path, self.excluded_paths)
+
+  def compress(self, encoding: str, body: bytes) -> bytes:
+    if encoding == "br":
+      return brotli.compress(body, quality=self.brotli_quality)
+    return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or self._is_excluded(scope.get("path", "")):
+      await self.app(scope, receive, send)
+      return
+
+    encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+    if encoding is None:
+      await self.app(scope, receive, send)
+      return
+
+    cacheable = self._matches(scope.get("path", ""), self.cached_paths)
+    start_message = None
+    passthrough = False
+    chunks = []
+
+    async def send_wrapper(message):
+      nonlocal start_message, passthrough
+
+      if message["type"] == "http.response.start":
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "")
+        content_length = headers.get("content-length")
+
+        # Only bodies of known, bounded size are buffered and compressed;
+        # streaming responses (no Content-Length) go out as-is.
+        if (
+          "content-encoding" in headers
+          or content_type.startswith(SKIPPED_CONTENT_TYPES)
+          or content_length is None
+          or not self.minimum_size <= int(content_length) <= self.maximum_size
+        ):
+          passthrough = True
+          await send(message)
+        else:
+          start_message = message
+        return
+
+      if passthrough or message["type"] != "http.response.body" or start_message is None:
+        await send(message)
+        return
+
+      chunks.append(message.get("body", b""))
+      if message.get("more_body", False):
+        return
+
+      body = b"".join(chunks)
+      if cacheable:
+        compressed = self.cache.get_or_compress(encoding, body, lambda raw: self.compress(encoding, raw))
+      else:
+        compressed = self.compress(encoding, body)
+
+      headers = MutableHeaders(raw=start_message["headers"])
+      headers["Content-Encoding"] = encoding
+      headers["Content-Length"] = str(len(compressed))
+      headers.add_vary_header("Accept-Encoding")
+
+      await send(start_message)
+      await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    await self.app(scope, receive, send_wrapper)
@@ -1,21 +1,48 @@
 #app/firebase_init.py
 
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import threading
 from dotenv import load_dotenv
+from .lazy import lazy_import, when_imported
+from .storage import create_storage
 
 load_dotenv()
 
+firebase_admin = lazy_import("firebase_admin")
+credentials = lazy_import("firebase_admin.credentials")
+firestore = lazy_import("firebase_admin.firestore")
+
 IS_CI = os.environ.get("CI") == "true"
 
+# "firestore" (default) or "memory" for running the API offline in
+# development, load tests and CI.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "firestore").lower()
+
 firebase_credentials = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
 
-if not firebase_credentials and not IS_CI:
-    raise RuntimeError("FIREBASE_SERVICE_ACCOUNT env variable not set")
+_init_lock = threading.Lock()
+
+def init_firebase_app():
+  """Initializes the default Firebase app (used by Auth and Firestore) once."""
+  with _init_lock:
+    if firebase_admin._apps:
+      return firebase_admin.get_app()
+
+    if not firebase_credentials and not IS_CI:
+      raise RuntimeError("FIREBASE_SERVICE_ACCOUNT env variable not set")
 
-if not firebase_admin._apps:
     cred = credentials.Certificate(firebase_credentials)
-    firebase_admin.initialize_app(cred)
+    return firebase_admin.initialize_app(cred)
+
+def _init_for_auth(_module):
+  if firebase_credentials:
+    init_firebase_app()
+
+def _firestore_client():
+  init_firebase_app()
+  return firestore.client()
+
+# firebase_admin is only imported when Auth or Firestore is first used.
+when_imported("firebase_admin.auth", _init_for_auth)
 
-db = firestore.client()
+db = create_storage(STORAGE_BACKEND, client_factory=_firestore_client)
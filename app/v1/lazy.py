@@ -0,0 +1,85 @@
+# app/lazy.py
+
+import sys
+import time
+import importlib
+import threading
+
+# Heavy SDKs (Gemini, Firestore/gRPC, Firebase Auth, Razorpay, SendGrid) are
+# imported on first use rather than at startup, so a cold instance can start
+# serving sooner. Modules bind a LazyModule in place of the import:
+#
+#   auth = lazy_import("firebase_admin.auth")
+#   ...
+#   auth.verify_id_token(token)   # imports firebase_admin.auth here
+
+_lock = threading.RLock()
+_proxies = {}
+_import_hooks = {}
+
+# {module name: seconds spent importing it on first use}
+import_timings = {}
+
+class LazyModule:
+  """Stands in for a module and imports it on first attribute access."""
+
+  __slots__ = ("_name", "_module")
+
+  def __init__(self, name: str):
+    object.__setattr__(self, "_name", name)
+    object.__setattr__(self, "_module", None)
+
+  def _load(self):
+    module = self._module
+    if module is not None:
+      return module
+
+    with _lock:
+      if self._module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(self._name)
+        import_timings[self._name] = time.perf_counter() - start
+        object.__setattr__(self, "_module", module)
+        for hook in _import_hooks.pop(self._name, []):
+          hook(module)
+      return self._module
+
+  def __getattr__(self, attr: str):
+    return getattr(self._load(), attr)
+
+  def __setattr__(self, attr: str, value):
+    setattr(self._load(), attr, value)
+
+  def __repr__(self):
+    state = "loaded" if self._module is not None else "not loaded"
+    return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+  """Returns the shared LazyModule for `name`."""
+  with _lock:
+    proxy = _proxies.get(name)
+    if proxy is None:
+      proxy = _proxies[name] = LazyModule(name)
+    return proxy
+
+def when_imported(name: str, hook):
+  """
+    Calls hook(module) once `name` is first loaded through lazy_import(), or
+    right away if that has already happened.
+  """
+  with _lock:
+    proxy = _proxies.get(name)
+    if proxy is not None and proxy._module is not None:
+      module = proxy._module
+    else:
+      _import_hooks.setdefault(name, []).append(hook)
+      return
+  hook(module)
+
+def is_loaded(name: str) -> bool:
+  proxy = _proxies.get(name)
+  return proxy is not None and proxy._module is not None
+
+def loaded_heavy_modules(names=("google.generativeai", "google.cloud.firestore", "firebase_admin", "razorpay", "sendgrid")) -> dict:
+  """Which heavy SDKs are currently in sys.modules; used by the startup benchmark."""
+  return {name: name in sys.modules for name in names}
@@ -1,15 +1,37 @@
 #app/mailer.py
 
 import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-
-def send_staff_password_setup_email(to_email: str, reset_link: str):
-    message = Mail(
-        from_email=os.getenv("SENDGRID_FROM_EMAIL"),
-        to_emails=to_email,
-        subject="Set your GreenPlate password",
-        html_content=f"""
+import uuid
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from .firebase_init import db
+from .storage import transactional
+from .metrics import track
+from .lazy import lazy_import
+
+sendgrid = lazy_import("sendgrid")
+http_client_exceptions = lazy_import("python_http_client.exceptions")
+firestore = lazy_import("firebase_admin.firestore")
+
+# Outbox documents live in Firestore so queued mail survives restarts:
+# mail_outbox/{id} = {template, to_email, substitutions, status, attempts, next_attempt_at}
+OUTBOX_COLLECTION = "mail_outbox"
+
+SENDGRID_API_HOST = os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com")
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "100"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_POLL_INTERVAL_SECONDS = float(os.getenv("MAIL_POLL_INTERVAL_SECONDS", "30"))
+# The first poll (which loads the Firestore SDK) waits this long after startup
+# unless mail is queued sooner, so it does not compete with cold-start requests.
+MAIL_START_DELAY_SECONDS = float(os.getenv("MAIL_START_DELAY_SECONDS", "5"))
+MAIL_LEASE_SECONDS = 120
+MAIL_BACKOFF_BASE_SECONDS = 30
+MAIL_BACKOFF_MAX_SECONDS = 3600
+
+WORKER_ID = uuid.uuid4().hex
+
+STAFF_PASSWORD_SETUP_HTML = """
         <html>
           <body style="font-family: Arial, sans-serif;">
             <p>You have been added as a staff member on <b>GreenPlate</b>.</p>
@@ -19,7 +41,7 @@ def send_staff_password_setup_email(to_email: str, reset_link: str):
             </p>
 
             <p>
-              <a href="{reset_link}"
+              <a href="-reset_link-"
                  style="
                    display:inline-block;
                    padding:10px 16px;
@@ -35,12 +57,233 @@ def send_staff_password_setup_email(to_email: str, reset_link: str):
             <p style="font-size:12px;color:#666;">
               If the button does not work, copy and paste this link into your browser:
               <br />
-              <span>{reset_link}</span>
+              <span>-reset_link-</span>
             </p>
           </body>
         </html>
         """
-    )
 
-    sg = SendGridAPIClient(os.getenv("SENDGRID_API_KEY"))
-    sg.send(message)
+# Templates use SendGrid substitution tags so that one API request can carry
+# many recipients, each with their own values, as separate personalizations.
+MAIL_TEMPLATES = {
+  "staff_password_setup": {
+    "subject": "Set your GreenPlate password",
+    "html": STAFF_PASSWORD_SETUP_HTML,
+  },
+}
+
+_sendgrid_client = None
+_sender_task = None
+_sender_loop = None
+_wake_event = None
+
+def _get_sendgrid_client():
+  global _sendgrid_client
+  if _sendgrid_client is None:
+    _sendgrid_client = sendgrid.SendGridAPIClient(os.getenv("SENDGRID_API_KEY"), host=SENDGRID_API_HOST)
+  return _sendgrid_client
+
+def _utcnow():
+  return datetime.now(timezone.utc)
+
+def queue_email(template: str, to_email: str, substitutions: dict, batch=None):
+  """
+    Adds an email to the outbox. When a batch is given the outbox write joins it
+    and the caller must call notify_mail_sender() after committing.
+  """
+  if template not in MAIL_TEMPLATES:
+    raise ValueError(f"Unknown mail template: {template}")
+
+  ref = db.collection(OUTBOX_COLLECTION).document()
+  data = {
+    "template": template,
+    "to_email": to_email,
+    "substitutions": substitutions,
+    "status": "PENDING",
+    "attempts": 0,
+    "next_attempt_at": _utcnow(),
+    "created_at": firestore.SERVER_TIMESTAMP,
+  }
+
+  if batch is not None:
+    batch.set(ref, data)
+  else:
+    ref.set(data)
+    notify_mail_sender()
+
+  return ref.id
+
+def queue_staff_password_setup_email(to_email: str, reset_link: str, batch=None):
+  return queue_email(
+    "staff_password_setup",
+    to_email,
+    {"-reset_link-": reset_link},
+    batch=batch
+  )
+
+def notify_mail_sender():
+  if _sender_loop is not None and _wake_event is not None:
+    _sender_loop.call_soon_threadsafe(_wake_event.set)
+
+def _claim_due_messages(limit: int):
+  now = _utcnow()
+  lease_until = now + timedelta(seconds=MAIL_LEASE_SECONDS)
+
+  query = (
+    db.collection(OUTBOX_COLLECTION)
+    .where("status", "==", "PENDING")
+    .where("next_attempt_at", "<=", now)
+    .order_by("next_attempt_at")
+    .limit(limit)
+  )
+
+  transaction = db.transaction()
+
+  # Claiming pushes next_attempt_at past the lease so other instances skip these
+  # messages; if this worker dies they become due again once the lease expires.
+  @transactional
+  def claim_in_transaction(transaction):
+    claimed = []
+    for doc in transaction.get(query):
+      transaction.update(doc.reference, {
+        "next_attempt_at": lease_until,
+        "claimed_by": WORKER_ID,
+      })
+      claimed.append((doc.reference, doc.to_dict()))
+    return claimed
+
+  return claim_in_transaction(transaction)
+
+def _build_request_body(template: str, messages: list):
+  spec = MAIL_TEMPLATES[template]
+  return {
+    "from": {"email": os.getenv("SENDGRID_FROM_EMAIL")},
+    "subject": spec["subject"],
+    "content": [{"type": "text/html", "value": spec["html"]}],
+    "personalizations": [
+      {
+        "to": [{"email": data["to_email"]}],
+        "substitutions": data.get("substitutions", {}),
+      }
+      for _, data in messages
+    ],
+  }
+
+def _send(template: str, messages: list):
+  body = _build_request_body(template, messages)
+  with track("sendgrid", "mail_send"):
+    _get_sendgrid_client().client.mail.send.post(request_body=body)
+
+def _is_permanent_failure(error: Exception) -> bool:
+  status_code = getattr(error, "status_code", None)
+  return status_code is not None and 400 <= status_code < 500 and status_code != 429
+
+def _backoff_delay(attempts: int) -> float:
+  delay = min(MAIL_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), MAIL_BACKOFF_MAX_SECONDS)
+  return delay * random.uniform(0.8, 1.2)
+
+def _record_results(sent: list, failed: list):
+  batch = db.batch()
+  writes = 0
+  now = _utcnow()
+
+  for ref, data in sent:
+    batch.update(ref, {
+      "status": "SENT",
+      "attempts": data.get("attempts", 0) + 1,
+      "sent_at": firestore.SERVER_TIMESTAMP,
+    })
+    writes += 1
+
+  for ref, data, error in failed:
+    attempts = data.get("attempts", 0) + 1
+    updates = {"attempts": attempts, "last_error": str(error)[:500]}
+    # A 4xx (other than 429) is SendGrid rejecting this message; retrying
+    # it would only be rejected again.
+    if attempts >= MAIL_MAX_ATTEMPTS or _is_permanent_failure(error):
+      updates["status"] = "FAILED"
+    else:
+      updates["next_attempt_at"] = now + timedelta(seconds=_backoff_delay(attempts))
+    batch.update(ref, updates)
+    writes += 1
+
+  if writes:
+    batch.commit()
+
+def process_outbox_once(limit: int = MAIL_BATCH_SIZE) -> int:
+  """
+    Claims due outbox messages, sends them grouped per template and records
+    the outcome. Returns the number of messages claimed.
+  """
+  claimed = _claim_due_messages(limit)
+  if not claimed:
+    return 0
+
+  by_template = {}
+  for ref, data in claimed:
+    by_template.setdefault(data.get("template"), []).append((ref, data))
+
+  sent, failed = [], []
+
+  for template, messages in by_template.items():
+    try:
+      _send(template, messages)
+      sent.extend(messages)
+    except Exception as e:
+      if len(messages) > 1 and isinstance(e, http_client_exceptions.HTTPError) and _is_permanent_failure(e):
+        # One bad recipient rejects the whole request; isolate it.
+        for message in messages:
+          try:
+            _send(template, [message])
+            sent.append(message)
+          except Exception as single_error:
+            failed.append((*message, single_error))
+      else:
+        failed.extend((ref, data, e) for ref, data in messages)
+
+  _record_results(sent, failed)
+  return len(claimed)
+
+async def _wait_for_wake(timeout: float):
+  try:
+    await asyncio.wait_for(_wake_event.wait(), timeout=timeout)
+  except asyncio.TimeoutError:
+    pass
+  _wake_event.clear()
+
+async def _run_mail_sender():
+  await _wait_for_wake(MAIL_START_DELAY_SECONDS)
+
+  while True:
+    try:
+      claimed = await asyncio.to_thread(process_outbox_once)
+      if claimed >= MAIL_BATCH_SIZE:
+        continue
+    except Exception as e:
+      print(f"Mail outbox error: {e}")
+
+    await _wait_for_wake(MAIL_POLL_INTERVAL_SECONDS)
+
+def start_mail_sender():
+  global _sender_task, _sender_loop, _wake_event
+  if _sender_task is not None:
+    return
+
+  _sender_loop = asyncio.get_running_loop()
+  _wake_event = asyncio.Event()
+  _sender_task = asyncio.create_task(_run_mail_sender())
+
+async def stop_mail_sender():
+  global _sender_task, _sender_loop, _wake_event
+  if _sender_task is None:
+    return
+
+  _sender_task.cancel()
+  try:
+    await _sender_task
+  except asyncio.CancelledError:
+    pass
+
+  _sender_task = None
+  _sender_loop = None
+  _wake_event = None
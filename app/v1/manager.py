@@ -1,16 +1,18 @@
 # app/manager.py
 
-from fastapi.responses import JSONResponse
+from .responses import JSONResponse
 from starlette import status
-from .staff import (
-  get_staff_details,
-  serialize_firestore_data
-)
-from firebase_admin import firestore, auth
+from .staff import get_staff_details
 from .firebase_init import db
-from datetime import datetime, time
+from .lazy import lazy_import
+from .archive import archive_cutoff, archived_orders
+from datetime import datetime, time, timezone
+from itertools import chain
 import calendar
 
+firestore = lazy_import("firebase_admin.firestore")
+auth = lazy_import("firebase_admin.auth")
+
 async def get_my_staff(id_token: str):
   try:
     requester_data, _ = await get_staff_details(id_token)
@@ -34,8 +36,6 @@ async def get_my_staff(id_token: str):
         "added_at": data.get("created_at")
       })
 
-    staff_list = [serialize_firestore_data(s) for s in staff_list]
-
     return JSONResponse(status_code=status.HTTP_200_OK, content={"staff": staff_list})
 
   except Exception as e:
@@ -152,17 +152,22 @@ async def get_stall_performance_overview(month: int, year: int, id_token: str):
           "last_active": None
         }
 
-    orders_query = (
-      db.collection("orders")
+    order_sources = [db.collection("orders")]
+    # Months that reach past the archive cutoff may have orders archived.
+    if month_start.replace(tzinfo=timezone.utc) < archive_cutoff():
+      order_sources.append(archived_orders())
+
+    order_docs = chain.from_iterable(
+      source
       .where("stall_id", "==", stall_id)
       .where("status", "==", "CLAIMED")
       .where("picked_up_at", ">=", month_start)
       .where("picked_up_at", "<=", month_end)
       .select(["handled_by", "picked_up_at"])
+      .stream()
+      for source in order_sources
     )
 
-    order_docs = orders_query.stream()
-
     for doc in order_docs:
       data = doc.to_dict()
       handler_email = data.get("handled_by")
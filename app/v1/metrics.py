@@ -0,0 +1,363 @@
+# app/metrics.py
+
+import os
+import hmac
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from .tracing import start_span, start_detached_span, tracing_enabled
+from .lazy import when_imported
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEPENDENCIES = ("firestore", "firebase_auth", "razorpay", "gemini", "sendgrid")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+# Calls made outside of a request (mail sender, startup) are reported under
+# this route label.
+BACKGROUND_ROUTE = "background"
+
+# Per-request {(dependency, operation): count}. to_thread/threadpool calls
+# copy the context, so they share the same dict as the request.
+_request_calls = contextvars.ContextVar("request_calls", default=None)
+
+class Histogram:
+  __slots__ = ("buckets", "counts", "sum", "count")
+
+  def __init__(self, buckets: tuple):
+    self.buckets = buckets
+    self.counts = [0] * len(buckets)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value: float):
+    for index, bound in enumerate(self.buckets):
+      if value <= bound:
+        self.counts[index] += 1
+        break
+    self.sum += value
+    self.count += 1
+
+def _format_labels(labels: dict) -> str:
+  parts = []
+  for name, value in labels.items():
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    parts.append(f'{name}="{value}"')
+  return "{" + ",".join(parts) + "}"
+
+def _format_bound(bound) -> str:
+  return "+Inf" if bound == float("inf") else repr(float(bound))
+
+class MetricsRegistry:
+  """
+    In-process counters and histograms rendered in the Prometheus text
+    format. Updates are a dict lookup and a few additions under one lock.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.request_latency = {}
+    self.dependency_calls = {}
+    self.dependency_latency = {}
+    self.calls_per_request = {}
+
+  def observe_request(self, method: str, route: str, status: int, seconds: float, calls: dict):
+    per_dependency = dict.fromkeys(DEPENDENCIES, 0)
+    for (dependency, _), count in calls.items():
+      per_dependency[dependency] = per_dependency.get(dependency, 0) + count
+
+    with self._lock:
+      key = (method, route, str(status))
+      histogram = self.request_latency.get(key)
+      if histogram is None:
+        histogram = self.request_latency[key] = Histogram(LATENCY_BUCKETS)
+      histogram.observe(seconds)
+
+      for (dependency, operation), count in calls.items():
+        key = (route, dependency, operation)
+        self.dependency_calls[key] = self.dependency_calls.get(key, 0) + count
+
+      for dependency, count in per_dependency.items():
+        key = (route, dependency)
+        histogram = self.calls_per_request.get(key)
+        if histogram is None:
+          histogram = self.calls_per_request[key] = Histogram(CALL_COUNT_BUCKETS)
+        histogram.observe(count)
+
+  def observe_dependency(self, dependency: str, operation: str, seconds: float, route: str = None):
+    with self._lock:
+      key = (dependency, operation)
+      histogram = self.dependency_latency.get(key)
+      if histogram is None:
+        histogram = self.dependency_latency[key] = Histogram(LATENCY_BUCKETS)
+      histogram.observe(seconds)
+
+      if route is not None:
+        key = (route, dependency, operation)
+        self.dependency_calls[key] = self.dependency_calls.get(key, 0) + 1
+
+  def count_background(self, dependency: str, operation: str):
+    with self._lock:
+      key = (BACKGROUND_ROUTE, dependency, operation)
+      self.dependency_calls[key] = self.dependency_calls.get(key, 0) + 1
+
+  def reset(self):
+    with self._lock:
+      self.request_latency.clear()
+      self.dependency_calls.clear()
+      self.dependency_latency.clear()
+      self.calls_per_request.clear()
+
+  def _render_histograms(self, lines: list, name: str, help_text: str, histograms: dict, label_names: tuple):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+      labels = dict(zip(label_names, key))
+      cumulative = 0
+      for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_bound(bound)})} {cumulative}")
+      lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+      lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+      lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+  def render(self) -> str:
+    lines = []
+    with self._lock:
+      self._render_histograms(
+        lines,
+        "greenplate_request_duration_seconds",
+        "Request latency by route template.",
+        self.request_latency,
+        ("method", "route", "status"),
+      )
+
+      lines.append("# HELP greenplate_dependency_calls_total Backend calls by route, dependency and operation.")
+      lines.append("# TYPE greenplate_dependency_calls_total counter")
+      for (route, dependency, operation), count in sorted(self.dependency_calls.items()):
+        labels = _format_labels({"route": route, "dependency": dependency, "operation": operation})
+        lines.append(f"greenplate_dependency_calls_total{labels} {count}")
+
+      self._render_histograms(
+        lines,
+        "greenplate_request_dependency_calls",
+        "Backend calls made by a single request, per dependency.",
+        self.calls_per_request,
+        ("route", "dependency"),
+      )
+
+      self._render_histograms(
+        lines,
+        "greenplate_dependency_duration_seconds",
+        "Latency of individual backend calls.",
+        self.dependency_latency,
+        ("dependency", "operation"),
+      )
+    return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def _count_call(dependency: str, operation: str):
+  calls = _request_calls.get()
+  if calls is None:
+    return False
+  key = (dependency, operation)
+  calls[key] = calls.get(key, 0) + 1
+  return True
+
+@contextmanager
+def track(dependency: str, operation: str, attributes: dict = None):
+  """
+    Counts one backend call against the current request (or the background
+    bucket), records how long it took and, when tracing, wraps it in a span.
+  """
+  in_request = _count_call(dependency, operation)
+  start = time.perf_counter()
+  try:
+    with start_span(
+      f"{dependency} {operation}",
+      {"dependency": dependency, "operation": operation, **(attributes or {})},
+      kind="client"
+    ):
+      yield
+  finally:
+    registry.observe_dependency(
+      dependency,
+      operation,
+      time.perf_counter() - start,
+      route=None if in_request else BACKGROUND_ROUTE
+    )
+
+def record_call(dependency: str, operation: str, seconds: float):
+  """
+    Counts one backend call and records a latency the caller measured
+    itself, e.g. a stream's time waiting on the backend without the time
+    its consumer held it.
+  """
+  in_request = _count_call(dependency, operation)
+  registry.observe_dependency(
+    dependency,
+    operation,
+    seconds,
+    route=None if in_request else BACKGROUND_ROUTE
+  )
+
+def observe_latency(dependency: str, operation: str, seconds: float):
+  """Records a latency (e.g. time to a stream's first chunk) without counting a call."""
+  registry.observe_dependency(dependency, operation, seconds)
+
+def count(dependency: str, operation: str):
+  """Counts a call whose latency cannot be measured at the call site."""
+  if not _count_call(dependency, operation):
+    registry.count_background(dependency, operation)
+
+def _traced_iteration(iterator, span):
+  try:
+    yield from iterator
+  except Exception as e:
+    span.record_exception(e)
+    raise
+  finally:
+    span.end()
+
+def _tracked(function, dependency: str, operation: str, timed: bool = True, describe=None):
+  if getattr(function, "__metrics_tracked__", False):
+    return function
+
+  def span_attributes(args):
+    if describe is None or not tracing_enabled():
+      return None
+    try:
+      return describe(*args)
+    except Exception:
+      return None
+
+  if timed:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with track(dependency, operation, span_attributes(args)):
+        return function(*args, **kwargs)
+  else:
+    # The call returns a lazy iterator, so the span (if any) covers
+    # consuming it rather than the call itself.
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      count(dependency, operation)
+      result = function(*args, **kwargs)
+      span = start_detached_span(
+        f"{dependency} {operation}",
+        {"dependency": dependency, "operation": operation, **(span_attributes(args) or {})},
+        kind="client"
+      )
+      return result if span is None else _traced_iteration(result, span)
+
+  wrapper.__metrics_tracked__ = True
+  return wrapper
+
+def _instrument_firestore(_module):
+  from google.cloud.firestore_v1 import batch, client, document, query, transaction
+
+  def document_path(ref, *_):
+    return {"db.path": ref.path}
+
+  def query_collection(query_ref, *_):
+    return {"db.collection": query_ref._parent.id}
+
+  # Query.get, CollectionReference.get/stream and Transaction.get(query) all
+  # go through Query.stream; Transaction.get(ref) goes through Client.get_all.
+  # Streams and get_all return lazy generators, so they are counted, not timed.
+  patches = [
+    (document.DocumentReference, "get", "read", True, document_path),
+    (document.DocumentReference, "create", "write", True, document_path),
+    (document.DocumentReference, "set", "write", True, document_path),
+    (document.DocumentReference, "update", "write", True, document_path),
+    (document.DocumentReference, "delete", "write", True, document_path),
+    (query.Query, "stream", "query", False, query_collection),
+    (client.Client, "get_all", "batch_get", False, None),
+    (batch.WriteBatch, "commit", "batch_commit", True, None),
+    (transaction.Transaction, "_commit", "transaction_commit", True, None),
+  ]
+  for cls, name, operation, timed, describe in patches:
+    setattr(cls, name, _tracked(getattr(cls, name), "firestore", operation, timed=timed, describe=describe))
+
+def _instrument_auth(auth):
+  # Call sites use auth.<function>, so patching the module attributes is enough.
+  for name in (
+    "verify_id_token", "get_user_by_email", "get_users", "create_user",
+    "update_user", "delete_user", "generate_password_reset_link"
+  ):
+    setattr(auth, name, _tracked(getattr(auth, name), "firebase_auth", name))
+
+def _instrument_razorpay(razorpay):
+  razorpay.Client.request = _tracked(
+    razorpay.Client.request,
+    "razorpay",
+    "request",
+    describe=lambda client, method, path, *_: {"http.method": method.upper(), "razorpay.path": path}
+  )
+
+_instrumented = False
+
+def instrument_clients():
+  """
+    Wraps the Firestore, Firebase Auth and Razorpay client methods that hit
+    the network so every call site is counted (and traced) without touching
+    it. The SDKs are imported lazily, so each is patched when first loaded.
+    Idempotent.
+  """
+  global _instrumented
+  if _instrumented:
+    return
+  _instrumented = True
+
+  when_imported("firebase_admin.firestore", _instrument_firestore)
+  when_imported("firebase_admin.auth", _instrument_auth)
+  when_imported("razorpay", _instrument_razorpay)
+
+class MetricsMiddleware:
+  """
+    Times each HTTP request and attributes the backend calls it made to its
+    route template (e.g. /v1/staff/menu/{item_id}).
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    calls = {}
+    status_code = 500
+    start = time.perf_counter()
+
+    async def send_wrapper(message):
+      nonlocal status_code
+      if message["type"] == "http.response.start":
+        status_code = message["status"]
+      await send(message)
+
+    token = _request_calls.set(calls)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      _request_calls.reset(token)
+      route = scope.get("route")
+      registry.observe_request(
+        scope["method"],
+        getattr(route, "path", "unmatched"),
+        status_code,
+        time.perf_counter() - start,
+        calls
+      )
+
+def is_metrics_request_authorized(authorization: str) -> bool:
+  """/metrics is open unless METRICS_TOKEN is set, then it needs that bearer token."""
+  if not METRICS_TOKEN:
+    return True
+  return hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}")
@@ -0,0 +1,112 @@
+# app/negotiation.py
+
+import msgpack
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from .responses import JSONResponse, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, response_media_type
+
+MSGPACK_MEDIA_TYPES = frozenset((MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"))
+
+def _media_type(value: str) -> str:
+  return value.split(";", 1)[0].strip().lower()
+
+def prefers_msgpack(accept: str) -> bool:
+  if not accept or "msgpack" not in accept:
+    return False
+
+  msgpack_quality, json_quality = 0.0, 0.0
+  for part in accept.split(","):
+    media_type, _, params = part.partition(";")
+    media_type = media_type.strip().lower()
+
+    quality = 1.0
+    for param in params.split(";"):
+      name, _, value = param.strip().partition("=")
+      if name == "q":
+        try:
+          quality = float(value)
+        except ValueError:
+          quality = 0.0
+
+    if media_type in MSGPACK_MEDIA_TYPES:
+      msgpack_quality = max(msgpack_quality, quality)
+    elif media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+      json_quality = max(json_quality, quality)
+
+  return msgpack_quality > 0 and msgpack_quality >= json_quality
+
+class ContentNegotiationMiddleware:
+  """
+    Serves application/msgpack when the client's Accept header prefers it, and
+    accepts application/msgpack request bodies on `msgpack_body_paths` by
+    decoding them to JSON before FastAPI validates the body.
+  """
+
+  def __init__(self, app, msgpack_body_paths: tuple = ()):
+    self.app = app
+    self.msgpack_body_paths = frozenset(msgpack_body_paths)
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    headers = Headers(scope=scope)
+    media_type = MSGPACK_MEDIA_TYPE if prefers_msgpack(headers.get("accept", "")) else JSON_MEDIA_TYPE
+
+    if _media_type(headers.get("content-type", "")) in MSGPACK_MEDIA_TYPES:
+      if scope["path"] not in self.msgpack_body_paths:
+        response = JSONResponse(
+          status_code=415,
+          content={"message": "application/msgpack bodies are not accepted on this endpoint."}
+        )
+        await response(scope, receive, send)
+        return
+
+      decoded_receive = await self._decode_msgpack_body(scope, receive)
+      if decoded_receive is None:
+        response = JSONResponse(status_code=400, content={"message": "Invalid msgpack body."})
+        await response(scope, receive, send)
+        return
+      receive = decoded_receive
+
+    async def send_wrapper(message):
+      if message["type"] == "http.response.start":
+        MutableHeaders(scope=message).add_vary_header("Accept")
+      await send(message)
+
+    token = response_media_type.set(media_type)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      response_media_type.reset(token)
+
+  async def _decode_msgpack_body(self, scope, receive):
+    chunks = []
+    more_body = True
+    while more_body:
+      message = await receive()
+      if message["type"] != "http.request":
+        return None
+      chunks.append(message.get("body", b""))
+      more_body = message.get("more_body", False)
+
+    try:
+      body = orjson.dumps(msgpack.unpackb(b"".join(chunks), raw=False), option=orjson.OPT_NON_STR_KEYS)
+    except (ValueError, TypeError):
+      return None
+
+    headers = MutableHeaders(scope=scope)
+    headers["content-type"] = JSON_MEDIA_TYPE
+    headers["content-length"] = str(len(body))
+
+    sent = False
+
+    async def replay_receive():
+      nonlocal sent
+      if not sent:
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+      return await receive()
+
+    return replay_receive
@@ -0,0 +1,129 @@
+# app/order_summary.py
+
+import os
+from .firebase_init import db
+from .storage import transactional
+from .pickup import ACTIVE_ORDER_STATUSES
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+# Each student's orders screen is served from one document holding the
+# display fields of their last ORDER_SUMMARY_SIZE orders:
+# user_order_summaries/{user_id} = {orders: {order_id: entry}, complete, updated_at}
+# Every write to an order also writes its entry, in the same batch or
+# transaction (see orders.apply_transition). `complete` is set once the
+# document has been filled from the orders query; until then readers
+# fall back to the query and backfill it.
+SUMMARY_COLLECTION = "user_order_summaries"
+ORDER_SUMMARY_SIZE = int(os.getenv("ORDER_SUMMARY_SIZE", "20"))
+
+def _summary_ref(user_id: str):
+  return db.collection(SUMMARY_COLLECTION).document(user_id)
+
+def summary_entry(data: dict) -> dict:
+  """Display fields of an order; the pickup code and token only while it can be picked up."""
+  is_active = data.get("status") in ACTIVE_ORDER_STATUSES
+  return {
+    "items": data.get("items", []),
+    "stall_name": data.get("stall_name", "Unknown Stall"),
+    "status": data.get("status"),
+    "pickup_code": data.get("pickup_code") if is_active else None,
+    "pickup_token": data.get("pickup_token") if is_active else None,
+    "total_amount": data.get("total_amount", 0),
+    "refund": data.get("refund"),
+    "refund_policy": data.get("refund_policy"),
+    "created_at": data.get("created_at"),
+  }
+
+def with_changes(data: dict, changes: dict) -> dict:
+  """The order as it is after `changes` (update() field paths) are applied."""
+  merged = {**data}
+  for field_path, value in changes.items():
+    target = merged
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+      target[part] = {**(target.get(part) or {})}
+      target = target[part]
+    target[parts[-1]] = value
+  return merged
+
+def record_order(writer, order_id: str, data: dict):
+  """
+    Queues the order's entry on a batch or transaction; `data` is the order
+    after the write. A blind merge, so the transition needs no extra read;
+    an entry written back for an order the summary had already dropped
+    (e.g. a late refund webhook) sorts past ORDER_SUMMARY_SIZE and is cut
+    by recent_orders, then evicted by the next record_new_order.
+  """
+  user_id = data.get("user_id")
+  if not user_id:
+    return
+  writer.set(_summary_ref(user_id), {
+    "orders": {order_id: summary_entry(data)},
+    "updated_at": firestore.SERVER_TIMESTAMP,
+  }, merge=True)
+
+def record_new_order(writer, order_id: str, data: dict):
+  """
+    Queues a new order's entry and drops the oldest entries past
+    ORDER_SUMMARY_SIZE. Reads the summary outside the writer, so two orders
+    created at once may both keep an extra entry; the next one trims it.
+  """
+  user_id = data.get("user_id")
+  if not user_id:
+    return
+
+  snapshot = _summary_ref(user_id).get()
+  entries = (snapshot.to_dict() or {}).get("orders", {}) if snapshot.exists else {}
+  evicted = _by_recency(entries)[ORDER_SUMMARY_SIZE - 1:]
+
+  writer.set(_summary_ref(user_id), {
+    "orders": {
+      order_id: summary_entry(data),
+      **{old_id: firestore.DELETE_FIELD for old_id, _ in evicted},
+    },
+    "updated_at": firestore.SERVER_TIMESTAMP,
+  }, merge=True)
+
+def _by_recency(entries: dict) -> list:
+  """[(order_id, entry)] newest first; entries without created_at sort last."""
+  dated = [(order_id, entry) for order_id, entry in entries.items() if entry.get("created_at") is not None]
+  undated = [(order_id, entry) for order_id, entry in entries.items() if entry.get("created_at") is None]
+  dated.sort(key=lambda item: item[1]["created_at"], reverse=True)
+  return dated + undated
+
+def recent_orders(user_id: str) -> list:
+  """
+    The user's last ORDER_SUMMARY_SIZE orders as [(order_id, entry)], newest
+    first: one document read, or the orders query the first time.
+  """
+  snapshot = _summary_ref(user_id).get()
+  if snapshot.exists and snapshot.to_dict().get("complete"):
+    return _by_recency(snapshot.to_dict().get("orders", {}))[:ORDER_SUMMARY_SIZE]
+  return _backfill(user_id)
+
+def _backfill(user_id: str) -> list:
+  transaction = db.transaction()
+
+  @transactional
+  def backfill_in_transaction(transaction):
+    snapshot = _summary_ref(user_id).get(transaction=transaction)
+    if snapshot.exists and snapshot.to_dict().get("complete"):
+      return snapshot.to_dict().get("orders", {})
+
+    query = (
+      db.collection("orders")
+      .where("user_id", "==", user_id)
+      .order_by("created_at", direction=firestore.Query.DESCENDING)
+      .limit(ORDER_SUMMARY_SIZE)
+    )
+    entries = {doc.id: summary_entry(doc.to_dict()) for doc in transaction.get(query)}
+    transaction.set(_summary_ref(user_id), {
+      "orders": entries,
+      "complete": True,
+      "updated_at": firestore.SERVER_TIMESTAMP,
+    })
+    return entries
+
+  return _by_recency(backfill_in_transaction(transaction))[:ORDER_SUMMARY_SIZE]
@@ -0,0 +1,129 @@
+# app/orders.py
+
+from .firebase_init import db
+from .storage import transactional
+from .pickup import ACTIVE_ORDER_STATUSES, release_pickup_code
+from .order_summary import record_order, with_changes
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+# Order status machine. Every status change goes through transition_order()
+# (or apply_transition() inside a caller's transaction), which reads the
+# order and writes the change in one transaction, so two staff tapping at
+# once, or the webhook racing the client, cannot both apply a change.
+ORDER_TRANSITIONS = {
+  "PENDING": {"PAID", "FAILED", "EXPIRED", "CANCELLED"},
+  "PAID": {"READY", "CLAIMED", "CANCELLED"},
+  "READY": {"CLAIMED", "CANCELLED"},
+  "CLAIMED": {"COMPLETED"},
+  "RESERVED": {"CANCELLED"},
+}
+
+# The moves staff may make by hand. Paying, cancelling and expiring an order
+# go through the payment and cancellation paths, which also handle the
+# pickup code, stock and refund.
+STAFF_ORDER_TRANSITIONS = {
+  "PAID": {"READY", "CLAIMED"},
+  "READY": {"CLAIMED"},
+  "CLAIMED": {"COMPLETED"},
+}
+STAFF_ORDER_TARGETS = frozenset().union(*STAFF_ORDER_TRANSITIONS.values())
+
+# refund.status on an order. NOT_APPLICABLE covers orders without a refund
+# record, e.g. refunds issued from the Razorpay dashboard.
+REFUND_TRANSITIONS = {
+  "NOT_APPLICABLE": {"INITIATED", "COMPLETED", "FAILED"},
+  "PENDING": {"INITIATED", "COMPLETED", "FAILED"},
+  "INITIATED": {"COMPLETED", "FAILED"},
+  "FAILED": {"INITIATED", "COMPLETED"},
+}
+
+class OrderTransitionError(Exception):
+  """
+    A transition that was not applied. `reason` is one of not_found,
+    unchanged (already in the target status), invalid_transition or
+    rejected (a caller's check failed); `status_code` is the HTTP status to
+    answer with.
+  """
+
+  def __init__(self, message: str, reason: str, status_code: int = 400):
+    super().__init__(message)
+    self.reason = reason
+    self.status_code = status_code
+
+def check_transition(current: str, target: str, transitions: dict = ORDER_TRANSITIONS, label: str = "order"):
+  if current == target:
+    raise OrderTransitionError(f"The {label} is already {target}.", "unchanged")
+  if target not in transitions.get(current, ()):
+    raise OrderTransitionError(f"Cannot change {label} status from {current} to {target}.", "invalid_transition")
+
+def apply_transition(transaction, order_ref, data: dict, target: str, updates: dict = None, transitions: dict = ORDER_TRANSITIONS) -> dict:
+  """
+    Validates `target` against the order's current status (in `transitions`)
+    and queues the write on `transaction` (a transaction or batch whose
+    reads are done).
+    Leaving PAID/READY also releases the pickup code, and the user's order
+    summary is updated in the same write. Returns the fields written.
+  """
+  current = data.get("status")
+  check_transition(current, target, transitions)
+
+  if current in ACTIVE_ORDER_STATUSES and target not in ACTIVE_ORDER_STATUSES:
+    release_pickup_code(transaction, data, order_ref.id)
+
+  changes = {**(updates or {}), "status": target, "updated_at": firestore.SERVER_TIMESTAMP}
+  transaction.update(order_ref, changes)
+  record_order(transaction, order_ref.id, with_changes(data, changes))
+  return changes
+
+def transition_order(order_ref, target: str, updates: dict = None, check=None, before_write=None, transitions: dict = ORDER_TRANSITIONS):
+  """
+    Moves the order to `target` in one transaction (retried by the backend
+    on contention) and returns (order data before the change, fields
+    written). check(data) may raise OrderTransitionError to refuse, e.g. on
+    stall ownership; before_write(transaction, data) may do further reads
+    and writes and returns extra fields for the order.
+  """
+  transaction = db.transaction()
+
+  @transactional
+  def transition_in_transaction(transaction):
+    snapshot = order_ref.get(transaction=transaction)
+    if not snapshot.exists:
+      raise OrderTransitionError("Order not found", "not_found", status_code=404)
+
+    data = snapshot.to_dict()
+    if check is not None:
+      check(data)
+    check_transition(data.get("status"), target, transitions)
+
+    extra = before_write(transaction, data) if before_write is not None else {}
+    return data, apply_transition(transaction, order_ref, data, target, {**(updates or {}), **(extra or {})}, transitions)
+
+  return transition_in_transaction(transaction)
+
+def transition_refund(order_ref, target: str, updates: dict = None):
+  """Moves the order's refund.status to `target`; same guarantees as transition_order."""
+  transaction = db.transaction()
+
+  @transactional
+  def transition_in_transaction(transaction):
+    snapshot = order_ref.get(transaction=transaction)
+    if not snapshot.exists:
+      raise OrderTransitionError("Order not found", "not_found", status_code=404)
+
+    data = snapshot.to_dict()
+    current = (data.get("refund") or {}).get("status", "NOT_APPLICABLE")
+    check_transition(current, target, REFUND_TRANSITIONS, label="refund")
+
+    changes = {
+      **{f"refund.{field}": value for field, value in (updates or {}).items()},
+      "refund.status": target,
+      "updated_at": firestore.SERVER_TIMESTAMP,
+    }
+    transaction.update(order_ref, changes)
+    record_order(transaction, order_ref.id, with_changes(data, changes))
+    return data, changes
+
+  return transition_in_transaction(transaction)
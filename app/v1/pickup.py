@@ -0,0 +1,236 @@
+# app/pickup.py
+
+import os
+import hmac
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from .firebase_init import db
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+# Pickup codes are 4 digits and unique among a stall's active orders. Each
+# code in use is reserved by a document written in the same transaction that
+# marks the order PAID:
+# pickup_codes/{stall_id}_{code} = {stall_id, code, order_id, created_at}
+# The reservation is deleted in the same write that moves the order out of
+# PAID/READY, and doubles as the Firestore index from code to order.
+PICKUP_CODES_COLLECTION = "pickup_codes"
+ACTIVE_ORDER_STATUSES = ("PAID", "READY")
+
+CODE_MIN = 1000
+CODE_MAX = 9999
+CANDIDATES_PER_ROUND = 8
+MAX_ROUNDS = 16
+
+# Signed pickup tokens let the staff app check a student's pickup QR without
+# a connection: "v1.<payload>.<signature>", both base64url, where the payload
+# is {"o": order_id, "s": stall_id, "c": pickup_code, "e": expiry (unix s)}
+# and the signature is HMAC-SHA256 with the stall's key. Stall keys are
+# derived from PICKUP_TOKEN_SECRET, so one stall's key cannot sign for another.
+PICKUP_TOKEN_SECRET = os.getenv("PICKUP_TOKEN_SECRET")
+PICKUP_TOKEN_TTL_SECONDS = int(os.getenv("PICKUP_TOKEN_TTL_HOURS", "24")) * 3600
+PICKUP_TOKEN_VERSION = "v1"
+
+class PickupTokenError(Exception):
+  def __init__(self, reason: str):
+    super().__init__(f"Invalid pickup token: {reason}")
+    self.reason = reason
+
+class PickupCodesExhaustedError(Exception):
+  def __init__(self, stall_id: str):
+    super().__init__(f"No free pickup code for stall {stall_id}")
+    self.stall_id = stall_id
+
+def _reservation_ref(stall_id: str, code: str):
+  return db.collection(PICKUP_CODES_COLLECTION).document(f"{stall_id}_{code}")
+
+class PickupCodeIndex:
+  """
+    This instance's view of {stall_id: {pickup_code: order_id}} for active
+    orders, filled from the orders it marks PAID or looks up. Other instances
+    claim orders too, so every hit is checked against the order document.
+  """
+
+  def __init__(self):
+    self._stalls = {}
+    self._lock = threading.Lock()
+
+  def add(self, stall_id: str, code: str, order_id: str):
+    with self._lock:
+      self._stalls.setdefault(stall_id, {})[code] = order_id
+
+  def get(self, stall_id: str, code: str):
+    return self._stalls.get(stall_id, {}).get(code)
+
+  def discard(self, stall_id: str, code: str, order_id: str = None):
+    with self._lock:
+      codes = self._stalls.get(stall_id)
+      if codes is None or code not in codes:
+        return
+      if order_id is None or codes[code] == order_id:
+        del codes[code]
+
+  def clear(self):
+    with self._lock:
+      self._stalls.clear()
+
+index = PickupCodeIndex()
+
+def allocate_pickup_code(transaction, stall_id: str, order_id: str) -> str:
+  """
+    Picks a code no other active order of the stall holds and queues its
+    reservation on `transaction`. Only reads, then one write, so call it after
+    the transaction's other reads and before its writes. A reservation whose
+    order is no longer active (e.g. left behind by a manual edit) is reused.
+  """
+  for _ in range(MAX_ROUNDS):
+    codes = [str(code) for code in random.sample(range(CODE_MIN, CODE_MAX + 1), CANDIDATES_PER_ROUND)]
+    refs = [_reservation_ref(stall_id, code) for code in codes]
+    reservations = {snapshot.reference.id: snapshot for snapshot in transaction.get_all(refs)}
+
+    stale = {}
+    for code, ref in zip(codes, refs):
+      snapshot = reservations.get(ref.id)
+      holder = snapshot.to_dict().get("order_id") if snapshot is not None and snapshot.exists else None
+      if holder is None or holder == order_id:
+        return _reserve(transaction, ref, stall_id, code, order_id)
+      stale[holder] = (code, ref)
+
+    holders = transaction.get_all([db.collection("orders").document(holder) for holder in stale])
+    for holder in holders:
+      data = holder.to_dict() if holder.exists else {}
+      if data.get("status") not in ACTIVE_ORDER_STATUSES:
+        code, ref = stale[holder.id]
+        return _reserve(transaction, ref, stall_id, code, order_id)
+
+  raise PickupCodesExhaustedError(stall_id)
+
+def _reserve(transaction, ref, stall_id: str, code: str, order_id: str) -> str:
+  transaction.set(ref, {
+    "stall_id": stall_id,
+    "code": code,
+    "order_id": order_id,
+    "created_at": firestore.SERVER_TIMESTAMP,
+  })
+  return code
+
+def release_pickup_code(writer, order_data: dict, order_id: str):
+  """
+    Queues deletion of the order's code reservation on a batch or transaction
+    (the one that moves the order out of PAID/READY) and drops it from the
+    local index.
+  """
+  stall_id = order_data.get("stall_id")
+  code = order_data.get("pickup_code")
+  if not stall_id or not code:
+    return
+  writer.delete(_reservation_ref(stall_id, code))
+  index.discard(stall_id, code, order_id)
+
+def find_active_order_id(stall_id: str, code: str, use_index: bool = True):
+  """
+    Returns (order_id, from_index) for the stall's active order holding
+    `code`, or (None, False). A hit in the local index is returned without a
+    read, so the caller must check the order (transition_order does) and
+    retry with use_index=False if it no longer holds the code. Otherwise the
+    reservation document is read, then orders are queried (for orders paid
+    before codes were reserved).
+  """
+  if use_index:
+    order_id = index.get(stall_id, code)
+    if order_id:
+      return order_id, True
+
+  reservation = _reservation_ref(stall_id, code).get()
+  if reservation.exists:
+    order_id = reservation.to_dict().get("order_id")
+    snapshot = db.collection("orders").document(order_id).get()
+    if _is_active_holder(snapshot, stall_id, code):
+      index.add(stall_id, code, order_id)
+      return order_id, False
+
+  query = (
+    db.collection("orders")
+    .where("stall_id", "==", stall_id)
+    .where("pickup_code", "==", code)
+    .where("status", "in", list(ACTIVE_ORDER_STATUSES))
+    .limit(1)
+  )
+  for snapshot in query.stream():
+    index.add(stall_id, code, snapshot.id)
+    return snapshot.id, False
+
+  return None, False
+
+def _is_active_holder(snapshot, stall_id: str, code: str) -> bool:
+  if not snapshot.exists:
+    return False
+  data = snapshot.to_dict()
+  return (
+    data.get("stall_id") == stall_id
+    and data.get("pickup_code") == code
+    and data.get("status") in ACTIVE_ORDER_STATUSES
+  )
+
+def _b64encode(data: bytes) -> str:
+  return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(value: str) -> bytes:
+  return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+def stall_token_key(stall_id: str):
+  """The stall's signing key, shared with its staff app; None when tokens are disabled."""
+  if not PICKUP_TOKEN_SECRET:
+    return None
+  return hmac.new(PICKUP_TOKEN_SECRET.encode(), f"pickup-token:{stall_id}".encode(), hashlib.sha256).digest()
+
+def issue_pickup_token(order_id: str, stall_id: str, code: str, now: float = None):
+  key = stall_token_key(stall_id)
+  if key is None:
+    return None
+
+  expires_at = int((now or time.time()) + PICKUP_TOKEN_TTL_SECONDS)
+  payload = json.dumps({"o": order_id, "s": stall_id, "c": code, "e": expires_at}, separators=(",", ":"))
+  message = f"{PICKUP_TOKEN_VERSION}.{_b64encode(payload.encode())}"
+  signature = hmac.new(key, message.encode(), hashlib.sha256).digest()
+  return f"{message}.{_b64encode(signature)}"
+
+def verify_pickup_token(token: str, stall_id: str, at: float = None) -> dict:
+  """
+    Checks the token's signature with `stall_id`'s key and that it had not
+    expired at `at` (default now). Returns {"order_id", "stall_id", "code",
+    "expires_at"} or raises PickupTokenError.
+  """
+  key = stall_token_key(stall_id)
+  if key is None:
+    raise PickupTokenError("pickup tokens are not enabled")
+
+  try:
+    version, encoded_payload, encoded_signature = token.split(".")
+    signature = _b64decode(encoded_signature)
+  except ValueError:
+    raise PickupTokenError("malformed")
+
+  if version != PICKUP_TOKEN_VERSION:
+    raise PickupTokenError("unsupported version")
+
+  expected = hmac.new(key, f"{version}.{encoded_payload}".encode(), hashlib.sha256).digest()
+  if not hmac.compare_digest(expected, signature):
+    raise PickupTokenError("bad signature")
+
+  try:
+    payload = json.loads(_b64decode(encoded_payload))
+  except ValueError:
+    raise PickupTokenError("malformed")
+
+  if payload.get("s") != stall_id:
+    raise PickupTokenError("wrong stall")
+  if payload.get("e", 0) < (at if at is not None else time.time()):
+    raise PickupTokenError("expired")
+
+  return {"order_id": payload.get("o"), "stall_id": payload.get("s"), "code": payload.get("c"), "expires_at": payload.get("e")}
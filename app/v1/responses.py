@@ -0,0 +1,34 @@
+# app/responses.py
+
+import contextvars
+import msgpack
+import orjson
+from fastapi.responses import JSONResponse as _StarletteJSONResponse
+from .serializers import json_default
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Set per request by negotiation.ContentNegotiationMiddleware from the
+# Accept header.
+response_media_type = contextvars.ContextVar("response_media_type", default=JSON_MEDIA_TYPE)
+
+def dumps(content) -> bytes:
+  return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def packb(content) -> bytes:
+  return msgpack.packb(content, default=json_default, use_bin_type=True)
+
+class JSONResponse(_StarletteJSONResponse):
+  """
+    Drop-in replacement for fastapi.responses.JSONResponse that encodes with
+    orjson, or straight to msgpack when the client negotiated it. Values
+    neither can encode natively (e.g. Firestore timestamps) go through the
+    shared Firestore serializer.
+  """
+
+  def render(self, content) -> bytes:
+    if response_media_type.get() == MSGPACK_MEDIA_TYPE:
+      self.media_type = MSGPACK_MEDIA_TYPE
+      return packb(content)
+    return dumps(content)
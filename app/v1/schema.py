@@ -1,11 +1,19 @@
 # app/schemas.py
 
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Union
 
 class AddStaffSchema(BaseModel):
     email: EmailStr
 
+class BulkAddStaffSchema(BaseModel):
+    emails: List[str] = Field(default_factory=list)
+    csv: Optional[str] = Field(
+      None,
+      description="CSV text or newline separated emails; every cell containing an email is used"
+    )
+
 class StaffAuthResponse(BaseModel):
     message: str
     role: str
@@ -33,10 +41,19 @@ class MenuItemSchema(BaseModel):
       description="Reference to menu image (URL, CDN key, or placeholder id)"
     )
     is_available: bool = True
+    stock: Optional[int] = Field(
+      None,
+      ge=0,
+      description="Units available; when set, checkouts reserve stock and the item sells out at zero"
+    )
 
 class MenuSchema(BaseModel):
     stall_id: str
     items: List[MenuItemSchema]
+    mode: Literal["append", "upsert", "replace"] = Field(
+      "append",
+      description="append: always add; upsert: match by name, write only changes; replace: upsert and remove items not in the upload"
+    )
 
 class UpdateMenuItemSchema(BaseModel):
     name: Optional[str] = None
@@ -44,6 +61,17 @@ class UpdateMenuItemSchema(BaseModel):
     description: Optional[str] = None
     image_ref: Optional[str] = None
     is_available: Optional[bool] = None
+    stock: Optional[int] = Field(None, ge=0)
+
+class BulkMenuItemUpdateSchema(BaseModel):
+    is_available: Optional[bool] = None
+    price: Optional[float] = Field(None, gt=0)
+
+class BulkMenuUpdateSchema(BaseModel):
+    items: Dict[str, Union[bool, BulkMenuItemUpdateSchema]] = Field(
+      ...,
+      description="Map of item_id to is_available, or to {is_available, price}"
+    )
 
 class ExtractedMenuItem(BaseModel):
     name: str = Field(..., description="The name of the food item")
@@ -53,6 +81,7 @@ class ExtractedMenuItem(BaseModel):
 class MenuScanResponse(BaseModel):
     detected_items: List[ExtractedMenuItem]
     count: int
+    images_scanned: int = 1
     message: str = "Scan complete. Please verify items before saving."
 
 class CartItemSchema(BaseModel):
@@ -79,6 +108,10 @@ class OrderResponseSchema(BaseModel):
 class UpdateOrderStatusSchema(BaseModel):
     status: str
 
+class BulkOrderStatusSchema(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=200)
+    status: str
+
 class VerifyPaymentSchema(BaseModel):
     razorpay_order_id: str
     razorpay_payment_id: str
@@ -86,9 +119,18 @@ class VerifyPaymentSchema(BaseModel):
     internal_order_id: str
 
 class VerifyPickupSchema(BaseModel):
-    order_id: str
+    order_id: Optional[str] = Field(None, description="Optional; the pickup code alone identifies an active order of the stall")
     pickup_code: str = Field(..., min_length=4, max_length=4, description="4-digit pickup code")
 
+class PickupSyncEntrySchema(BaseModel):
+    token: Optional[str] = Field(None, description="Signed pickup token scanned from the student's app")
+    order_id: Optional[str] = None
+    pickup_code: Optional[str] = Field(None, min_length=4, max_length=4)
+    picked_up_at: Optional[datetime] = Field(None, description="When the counter handed the order over")
+
+class PickupSyncSchema(BaseModel):
+    pickups: List[PickupSyncEntrySchema] = Field(..., min_length=1, max_length=500)
+
 class StaffStats(BaseModel):
     uid: str
     name: str
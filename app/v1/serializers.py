@@ -0,0 +1,61 @@
+# app/serializers.py
+
+import base64
+from datetime import date, datetime, time
+from decimal import Decimal
+
+_PASSTHROUGH_TYPES = frozenset((str, int, float, bool, type(None)))
+
+def _convert(value):
+  if isinstance(value, (datetime, date, time)):
+    return value.isoformat()
+
+  if isinstance(value, bytes):
+    return base64.b64encode(value).decode()
+
+  if isinstance(value, Decimal):
+    return float(value)
+
+  if hasattr(value, "latitude") and hasattr(value, "longitude"):
+    return {"latitude": value.latitude, "longitude": value.longitude}
+
+  # DocumentReference
+  if hasattr(value, "path") and hasattr(value, "id"):
+    return value.path
+
+  if isinstance(value, dict):
+    return serialize_firestore_data(value)
+
+  if isinstance(value, (list, tuple)):
+    return [serialize_firestore_data(item) for item in value]
+
+  return str(value)
+
+def serialize_firestore_data(value):
+  """
+    Recursively converts Firestore values into JSON-safe types in a single pass.
+    Handles DatetimeWithNanoseconds (a datetime subclass), dates, bytes,
+    Decimals, GeoPoints and DocumentReferences at any nesting depth.
+  """
+  value_type = type(value)
+
+  if value_type is dict:
+    return {
+      key: item if type(item) in _PASSTHROUGH_TYPES else serialize_firestore_data(item)
+      for key, item in value.items()
+    }
+
+  if value_type is list:
+    return [
+      item if type(item) in _PASSTHROUGH_TYPES else serialize_firestore_data(item)
+      for item in value
+    ]
+
+  if value_type in _PASSTHROUGH_TYPES:
+    return value
+
+  return _convert(value)
+
+def json_default(value):
+  """`default` hook for orjson/msgpack: only called for types they cannot encode."""
+  return _convert(value)
@@ -1,23 +1,47 @@
 # app/staff.py
 
 import os
+import io
+import csv
+import base64
+import time
+import asyncio
 from dotenv import load_dotenv
 import json
-import google.generativeai as genai
+from typing import List
+from datetime import datetime, timezone
 from fastapi import UploadFile
-from .schema import MenuSchema, UpdateMenuItemSchema, AddStaffSchema, UpdateOrderStatusSchema, VerifyPickupSchema, UpdateStaffProfileSchema, UpdateResalePriceSchema
-from fastapi.responses import JSONResponse
+from .schema import MenuSchema, UpdateMenuItemSchema, BulkMenuUpdateSchema, BulkMenuItemUpdateSchema, AddStaffSchema, BulkAddStaffSchema, UpdateOrderStatusSchema, BulkOrderStatusSchema, VerifyPickupSchema, PickupSyncSchema, UpdateStaffProfileSchema, UpdateResalePriceSchema
+from fastapi.responses import StreamingResponse
+from .responses import JSONResponse
 from starlette import status
 from .firebase_init import db
-from firebase_admin import auth, firestore
-from datetime import datetime
-from .mailer import send_staff_password_setup_email
-from firebase_admin.auth import ActionCodeSettings
+from .mailer import queue_staff_password_setup_email, notify_mail_sender
+from email_validator import validate_email, EmailNotValidError
+from .batching import FIRESTORE_BATCH_LIMIT, ChunkedWriteBatch, chunked
+from .storage import transactional
+from .stock import STOCK_SHARDS, get_stock, get_stocks, set_stock, stock_changed
+from .pickup import (
+  ACTIVE_ORDER_STATUSES, PICKUP_TOKEN_TTL_SECONDS, PickupTokenError, find_active_order_id,
+  stall_token_key, verify_pickup_token, index as pickup_index
+)
+from .orders import OrderTransitionError, STAFF_ORDER_TARGETS, STAFF_ORDER_TRANSITIONS, apply_transition, transition_order
+from .archive import ARCHIVED_STATUSES, archived_order_page, parse_archive_cursor
+from .metrics import observe_latency, record_call, track
+from .tracing import start_detached_span
+from .lazy import lazy_import, when_imported
 
 load_dotenv()
 
-if os.environ.get("GEMINI_API_KEY"):
-  genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+auth = lazy_import("firebase_admin.auth")
+firestore = lazy_import("firebase_admin.firestore")
+genai = lazy_import("google.generativeai")
+
+def _configure_gemini(module):
+  if os.environ.get("GEMINI_API_KEY"):
+    module.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+
+when_imported("google.generativeai", _configure_gemini)
 
 async def get_staff_details(id_token: str):
   try:
@@ -45,12 +69,6 @@ async def get_staff_details(id_token: str):
     print(f"Auth Error: {e}")
     return None, None
 
-def serialize_firestore_data(data: dict):
-  for key, value in data.items():
-    if isinstance(value, datetime):
-      data[key] = value.isoformat()
-  return data
-
 def validate_extracted_items(items):
   if not isinstance(items, list):
     raise ValueError("AI output is not a list")
@@ -85,6 +103,12 @@ def validate_extracted_items(items):
 
   return validated
 
+def _password_setup_action_settings():
+  return auth.ActionCodeSettings(
+    url=os.getenv("FRONTEND_BASE_URL") + "/set-password",
+    handle_code_in_app=True
+  )
+
 async def add_staff_member(staff_data: AddStaffSchema, id_token: str):
   try:
     requester_data, requester_uid = await get_staff_details(id_token)
@@ -110,18 +134,13 @@ async def add_staff_member(staff_data: AddStaffSchema, id_token: str):
     except auth.UserNotFoundError:
       user = auth.create_user(email=email)
 
-    action_settings = ActionCodeSettings(
-        url=os.getenv("FRONTEND_BASE_URL") + "/set-password",
-        handle_code_in_app=True
-    )
     reset_link = auth.generate_password_reset_link(
       email,
-      action_settings
+      _password_setup_action_settings()
     )
 
-    send_staff_password_setup_email(email, reset_link)
-
-    db.collection("staffs").document(user.uid).set({
+    batch = db.batch()
+    batch.set(db.collection("staffs").document(user.uid), {
       "email": email,
       "stall_id": stall_id,
       "college_id": college_id,
@@ -130,6 +149,10 @@ async def add_staff_member(staff_data: AddStaffSchema, id_token: str):
       "added_by": requester_data["email"],
       "created_at": firestore.SERVER_TIMESTAMP
     })
+    queue_staff_password_setup_email(email, reset_link, batch=batch)
+    batch.commit()
+
+    notify_mail_sender()
     return JSONResponse(
       status_code=status.HTTP_201_CREATED,
       content={"message": f"Staff {email} added successfully."
@@ -139,6 +162,170 @@ async def add_staff_member(staff_data: AddStaffSchema, id_token: str):
   except Exception as e:
     return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": str(e)})
   
+MAX_BULK_STAFF = 200
+AUTH_LOOKUP_CHUNK = 100
+FIRESTORE_IN_QUERY_LIMIT = 30
+BULK_STAFF_CONCURRENCY = 5
+# Each staff member is two writes: the staff doc and its outbox entry.
+STAFF_PER_BATCH = FIRESTORE_BATCH_LIMIT // 2
+
+def _parse_bulk_staff_emails(bulk_data: BulkAddStaffSchema):
+  raw_emails = list(bulk_data.emails)
+
+  if bulk_data.csv:
+    for row in csv.reader(io.StringIO(bulk_data.csv)):
+      for cell in row:
+        for value in cell.split():
+          if "@" in value:
+            raw_emails.append(value)
+
+  emails, invalid, seen = [], [], set()
+  for raw in raw_emails:
+    raw = raw.strip()
+    try:
+      email = validate_email(raw, check_deliverability=False).normalized.lower()
+    except EmailNotValidError:
+      invalid.append(raw)
+      continue
+
+    if email not in seen:
+      seen.add(email)
+      emails.append(email)
+
+  return emails, invalid
+
+def _get_existing_staff_by_email(emails: list) -> dict:
+  existing = {}
+  for chunk in chunked(emails, FIRESTORE_IN_QUERY_LIMIT):
+    for doc in db.collection("staffs").where("email", "in", chunk).stream():
+      existing[doc.to_dict().get("email")] = doc
+  return existing
+
+def _get_auth_users_by_email(emails: list) -> dict:
+  users = {}
+  for chunk in chunked(emails, AUTH_LOOKUP_CHUNK):
+    result = auth.get_users([auth.EmailIdentifier(email) for email in chunk])
+    for user in result.users:
+      if user.email:
+        users[user.email.lower()] = user
+  return users
+
+def _save_staff_chunk(chunk: list, stall_id: str, college_id: str, added_by: str):
+  """Commits the staff docs and outbox entries of [(email, uid, reset_link)] in one batch."""
+  batch = db.batch()
+  for email, uid, reset_link in chunk:
+    batch.set(db.collection("staffs").document(uid), {
+      "email": email,
+      "stall_id": stall_id,
+      "college_id": college_id,
+      "role": "staff",
+      "status": "inactive",
+      "added_by": added_by,
+      "created_at": firestore.SERVER_TIMESTAMP
+    })
+    queue_staff_password_setup_email(email, reset_link, batch=batch)
+  batch.commit()
+
+async def _create_user_and_reset_link(email: str, user, semaphore: asyncio.Semaphore):
+  async with semaphore:
+    if user is None:
+      user = await asyncio.to_thread(auth.create_user, email=email)
+
+    reset_link = await asyncio.to_thread(
+      auth.generate_password_reset_link,
+      email,
+      _password_setup_action_settings()
+    )
+    return user, reset_link
+
+async def add_staff_members_bulk(bulk_data: BulkAddStaffSchema, id_token: str):
+  try:
+    requester_data, requester_uid = await get_staff_details(id_token)
+
+    if not requester_data:
+      return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Invalid credentials"})
+
+    if requester_data["role"] != "manager":
+      return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"message": "Only Managers can add staff."})
+
+    emails, invalid = _parse_bulk_staff_emails(bulk_data)
+
+    if not emails and not invalid:
+      return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"message": "No emails provided."})
+
+    if len(emails) > MAX_BULK_STAFF:
+      return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"message": f"Too many emails. Max {MAX_BULK_STAFF} per request."}
+      )
+
+    stall_id = requester_data["stall_id"]
+    college_id = requester_data["college_id"]
+
+    results = {raw: {"email": raw, "status": "invalid_email"} for raw in invalid}
+
+    existing_staff = await asyncio.to_thread(_get_existing_staff_by_email, emails)
+
+    to_add = []
+    for email in emails:
+      doc = existing_staff.get(email)
+      if doc and doc.to_dict().get("status") == "active":
+        results[email] = {"email": email, "status": "already_staff"}
+      else:
+        to_add.append(email)
+
+    auth_users = await asyncio.to_thread(_get_auth_users_by_email, to_add) if to_add else {}
+
+    semaphore = asyncio.Semaphore(BULK_STAFF_CONCURRENCY)
+    outcomes = await asyncio.gather(
+      *(_create_user_and_reset_link(email, auth_users.get(email), semaphore) for email in to_add),
+      return_exceptions=True
+    )
+
+    created = []
+    for email, outcome in zip(to_add, outcomes):
+      if isinstance(outcome, Exception):
+        results[email] = {"email": email, "status": "failed", "message": str(outcome)}
+        continue
+      user, reset_link = outcome
+      created.append((email, user.uid, reset_link))
+
+    # Each chunk is its own commit; a failed one is reported per email and
+    # the chunks before it stay saved. Re-sending the failed emails is safe:
+    # their Auth users already exist and are reused.
+    added = []
+    for chunk in chunked(created, STAFF_PER_BATCH):
+      try:
+        await asyncio.to_thread(_save_staff_chunk, chunk, stall_id, college_id, requester_data["email"])
+      except Exception as e:
+        for email, _, _ in chunk:
+          results[email] = {"email": email, "status": "failed", "message": f"Saving staff failed: {str(e)}"}
+        continue
+      added.extend((email, uid) for email, uid, _ in chunk)
+
+    if added:
+      notify_mail_sender()
+
+    for email, uid in added:
+      results[email] = {"email": email, "status": "added", "uid": uid}
+
+    report = [results[email] for email in invalid + emails]
+    summary = {}
+    for result in report:
+      summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+    return JSONResponse(
+      status_code=status.HTTP_200_OK,
+      content={
+        "message": f"Added {len(added)} of {len(report)} staff members.",
+        "summary": summary,
+        "results": report
+      }
+    )
+
+  except Exception as e:
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": str(e)})
+
 async def get_my_staff_profile(id_token:str):
   staff_data, uid = await get_staff_details(id_token)
 
@@ -193,6 +380,38 @@ async def get_staff_me(id_token: str):
     }
   )
 
+async def get_pickup_token_key(id_token: str):
+  """Key and lifetime the offline-verify client needs to check pickup tokens.
+
+  Kept off the profile response: anyone holding the key can sign tokens for
+  the stall, so it is only handed out here, rate limited and never cached.
+  """
+  staff_data, _ = await get_staff_details(id_token)
+
+  if not staff_data:
+    return JSONResponse(
+      status_code=status.HTTP_401_UNAUTHORIZED,
+      content={"message": "Unauthorized"}
+    )
+
+  stall_id = staff_data.get("stall_id")
+  key = stall_token_key(stall_id) if stall_id else None
+  if key is None:
+    return JSONResponse(
+      status_code=status.HTTP_404_NOT_FOUND,
+      content={"message": "Offline pickup tokens are not enabled."}
+    )
+
+  return JSONResponse(
+    status_code=status.HTTP_200_OK,
+    content={
+      "stall_id": stall_id,
+      "pickup_token_key": base64.urlsafe_b64encode(key).rstrip(b"=").decode(),
+      "pickup_token_ttl_seconds": PICKUP_TOKEN_TTL_SECONDS,
+    },
+    headers={"Cache-Control": "no-store"}
+  )
+
 async def activate_staff(id_token: str):
   decoded = auth.verify_id_token(id_token)
   uid = decoded["uid"]
@@ -246,6 +465,85 @@ async def update_staff_profile(profile_data: UpdateStaffProfileSchema, id_token:
   except Exception as e:
     return JSONResponse(status_code=500, content={"message": str(e)})
 
+def _stock_fields(batch, item_ref, item, current_shards: int = 0) -> dict:
+  fields = set_stock(batch, item_ref, item.stock, current_shards)
+  if "is_available" in item.model_fields_set:
+    fields["is_available"] = item.is_available and item.stock > 0
+  return fields
+
+def _queue_new_menu_item(batch, menu_items_ref, item):
+  item_ref = menu_items_ref.document()
+  fields = item.model_dump(exclude={"stock"})
+
+  if item.stock is not None:
+    fields.update(_stock_fields(batch, item_ref, item))
+
+  batch.set(item_ref, {
+    **fields,
+    "created_at": firestore.SERVER_TIMESTAMP,
+    "updated_at": firestore.SERVER_TIMESTAMP
+  })
+
+def _apply_menu_diff(batch: ChunkedWriteBatch, menu_items_ref, menu_data: MenuSchema) -> dict:
+  """
+    Matches incoming items to the stored menu by normalized name and queues
+    writes only for added, changed and (in replace mode) removed items.
+  """
+  existing = {}
+  stale_refs = []
+  for doc in menu_items_ref.stream():
+    key = normalize_item_name(doc.to_dict().get("name", ""))
+    if key in existing:
+      stale_refs.append(doc.reference)
+    else:
+      existing[key] = doc
+
+  incoming = {}
+  for item in menu_data.items:
+    incoming[normalize_item_name(item.name)] = item
+
+  diff = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+  for key, item in incoming.items():
+    doc = existing.pop(key, None)
+
+    if doc is None:
+      _queue_new_menu_item(batch, menu_items_ref, item)
+      diff["added"] += 1
+      continue
+
+    # Fields left out of the upload (e.g. image_ref after a scan) keep their
+    # stored value, and the stored spelling of the name wins.
+    stored = doc.to_dict()
+    changes = {
+      field: value
+      for field, value in item.model_dump(exclude_unset=True, exclude={"name", "stock"}).items()
+      if stored.get(field) != value
+    }
+
+    # Rewriting the shards resets live counts under in-flight reservations,
+    # so only do it when the upload actually sets a different stock.
+    if (
+      item.stock is not None
+      and "stock" in item.model_fields_set
+      and stock_changed(doc.reference, stored, item.stock)
+    ):
+      changes = {**_stock_fields(batch, doc.reference, item, stored.get("stock_shards", 0)), **changes}
+
+    if changes:
+      changes["updated_at"] = firestore.SERVER_TIMESTAMP
+      batch.update(doc.reference, changes)
+      diff["updated"] += 1
+    else:
+      diff["unchanged"] += 1
+
+  if menu_data.mode == "replace":
+    for ref in stale_refs + [doc.reference for doc in existing.values()]:
+      batch.delete(ref)
+      diff["removed"] += 1
+
+  return diff
+
 async def upload_menu(menu_data: MenuSchema, id_token: str):
   try:
     staff_data, staff_uid = await get_staff_details(id_token)
@@ -288,24 +586,24 @@ async def upload_menu(menu_data: MenuSchema, id_token: str):
 
     menu_items_ref = stall_ref.collection("menu_items")
 
-    batch = db.batch()
-
-    for item in menu_data.items:
-      item_ref = menu_items_ref.document()
-      batch.set(item_ref, {
-        **item.model_dump(),
-        "created_at": firestore.SERVER_TIMESTAMP,
-        "updated_at": firestore.SERVER_TIMESTAMP
-      })
-
-    batch.set(
-      stall_ref,
-      {
-        "last_updated_by": staff_uid,
-        "last_updated_at": firestore.SERVER_TIMESTAMP
-      },
-      merge=True
-    )
+    batch = ChunkedWriteBatch(db)
+
+    if menu_data.mode == "append":
+      diff = {"added": len(menu_data.items), "updated": 0, "removed": 0, "unchanged": 0}
+      for item in menu_data.items:
+        _queue_new_menu_item(batch, menu_items_ref, item)
+    else:
+      diff = _apply_menu_diff(batch, menu_items_ref, menu_data)
+
+    if batch.writes:
+      batch.set(
+        stall_ref,
+        {
+          "last_updated_by": staff_uid,
+          "last_updated_at": firestore.SERVER_TIMESTAMP
+        },
+        merge=True
+      )
 
     batch.commit()
 
@@ -314,7 +612,12 @@ async def upload_menu(menu_data: MenuSchema, id_token: str):
       content={
         "message": "Menu uploaded successfully",
         "stall_id": staff_stall_id,
-        "items_added": len(menu_data.items)
+        "mode": menu_data.mode,
+        "items_added": diff["added"],
+        "items_updated": diff["updated"],
+        "items_removed": diff["removed"],
+        "items_unchanged": diff["unchanged"],
+        "writes": batch.writes
       }
     )
 
@@ -362,7 +665,6 @@ async def get_menu(id_token: str):
     for doc in menu_items_docs:
       item = doc.to_dict()
       item["item_id"] = doc.id
-      item = serialize_firestore_data(item)
       menu_items.append(item)
 
     return JSONResponse(
@@ -414,19 +716,40 @@ async def update_menu_item(
 
     updates = {
       key: value
-      for key, value in update_data.model_dump().items()
+      for key, value in update_data.model_dump(exclude={"stock"}).items()
       if value is not None
     }
 
-    if not updates:
+    if not updates and update_data.stock is None:
       return JSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content={"message": "No valid fields provided for update."}
       )
 
+    stored = item_doc.to_dict()
+
+    # Same rule as the bulk update: a stock-tracked item only comes back on
+    # while it has units left, unless this request also sets new stock.
+    if update_data.stock is None and updates.get("is_available") and stored.get("stock_tracked"):
+      if get_stock(item_ref, stored.get("stock_shards") or STOCK_SHARDS) == 0:
+        return JSONResponse(
+          status_code=status.HTTP_409_CONFLICT,
+          content={"message": "Item is out of stock. Set stock to make it available."}
+        )
+      updates["stock_sold_out"] = False
+
+    batch = db.batch()
+
+    if update_data.stock is not None:
+      stock_fields = set_stock(batch, item_ref, update_data.stock, stored.get("stock_shards", 0))
+      updates = {**stock_fields, **updates}
+      if update_data.stock == 0:
+        updates["is_available"] = False
+
     updates["updated_at"] = firestore.SERVER_TIMESTAMP
 
-    item_ref.update(updates)
+    batch.update(item_ref, updates)
+    batch.commit()
 
     return JSONResponse(
       status_code=status.HTTP_200_OK,
@@ -442,6 +765,126 @@ async def update_menu_item(
       content={"message": str(e)}
     )
 
+MAX_BULK_MENU_UPDATES = 200
+
+def _is_valid_document_id(document_id: str) -> bool:
+  """Whether Firestore accepts `document_id` as a single path segment."""
+  return (
+    bool(document_id)
+    and "/" not in document_id
+    and document_id not in (".", "..")
+    and not (document_id.startswith("__") and document_id.endswith("__"))
+  )
+
+async def bulk_update_menu_items(update_data: BulkMenuUpdateSchema, id_token: str):
+  try:
+    staff_data, staff_uid = await get_staff_details(id_token)
+
+    if not staff_data:
+      return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"message": "Invalid or expired token."}
+      )
+
+    if not update_data.items:
+      return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"message": "No items provided."}
+      )
+
+    if len(update_data.items) > MAX_BULK_MENU_UPDATES:
+      return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"message": f"Too many items. Max {MAX_BULK_MENU_UPDATES} per request."}
+      )
+
+    # Items are only looked up under the staff's own stall, so a foreign
+    # item id simply comes back as not found.
+    menu_items_ref = (
+      db.collection("colleges")
+      .document(staff_data.get("college_id"))
+      .collection("stalls")
+      .document(staff_data.get("stall_id"))
+      .collection("menu_items")
+    )
+
+    requested = {}
+    results = {}
+    for item_id, change in update_data.items.items():
+      if not _is_valid_document_id(item_id):
+        results[item_id] = "invalid_id"
+        continue
+      if isinstance(change, bool):
+        change = BulkMenuItemUpdateSchema(is_available=change)
+      requested[item_id] = {
+        key: value
+        for key, value in change.model_dump().items()
+        if value is not None
+      }
+
+    refs = [menu_items_ref.document(item_id) for item_id in requested]
+    snapshots = {doc.id: doc for doc in db.get_all(refs)}
+
+    # A stock-tracked item only comes back on while it has units left;
+    # reserve_stock turns it off again at zero, restore_availability on.
+    # The shards of every item being turned on are read in one go.
+    reenabled = [
+      (doc.reference, doc.to_dict().get("stock_shards") or STOCK_SHARDS)
+      for item_id, doc in snapshots.items()
+      if doc.exists
+      and requested.get(item_id, {}).get("is_available")
+      and doc.to_dict().get("stock_tracked")
+      and not doc.to_dict().get("is_available")
+    ]
+    stock_left = get_stocks(reenabled) if reenabled else {}
+
+    batch = ChunkedWriteBatch(db)
+
+    for item_id, changes in requested.items():
+      doc = snapshots.get(item_id)
+
+      if doc is None or not doc.exists:
+        results[item_id] = "not_found"
+        continue
+
+      if not changes:
+        results[item_id] = "no_fields"
+        continue
+
+      stored = doc.to_dict()
+      changes = {key: value for key, value in changes.items() if stored.get(key) != value}
+
+      if not changes:
+        results[item_id] = "unchanged"
+        continue
+
+      if changes.get("is_available") and stored.get("stock_tracked"):
+        if stock_left.get(doc.reference.path, 0) == 0:
+          results[item_id] = "out_of_stock"
+          continue
+        changes["stock_sold_out"] = False
+
+      changes["updated_at"] = firestore.SERVER_TIMESTAMP
+      batch.update(doc.reference, changes)
+      results[item_id] = "updated"
+
+    batch.commit()
+
+    return JSONResponse(
+      status_code=status.HTTP_200_OK,
+      content={
+        "message": "Menu items updated",
+        "updated": sum(1 for result in results.values() if result == "updated"),
+        "results": results
+      }
+    )
+
+  except Exception as e:
+    return JSONResponse(
+      status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+      content={"message": str(e)}
+    )
+
 async def delete_menu_item(item_id: str, id_token: str):
   try:
     staff_data, staff_uid = await get_staff_details(id_token)
@@ -486,13 +929,10 @@ async def delete_menu_item(item_id: str, id_token: str):
       content={"message": str(e)}
     )
 
-def _extract_menu_from_image(image_bytes: bytes, mime_type: str) -> list:
-  if not os.environ.get("GEMINI_API_KEY"):
-    raise Exception("GEMINI_API_KEY is missing from environment variables!")
-
-  model = genai.GenerativeModel('gemini-2.5-flash')
+MAX_SCAN_IMAGES = int(os.environ.get("MAX_SCAN_IMAGES", "3"))
+MAX_SCAN_IMAGE_BYTES = 5 * 1024 * 1024
 
-  prompt = """
+MENU_EXTRACTION_PROMPT = """
 You are an API that extracts food menu information from images.
 
 Rules:
@@ -501,7 +941,8 @@ Rules:
 3. If a price is missing or unclear, set it to null.
 4. For each food item, generate a short description (6–7 words max) based only on the item name.
 5. Do NOT hallucinate exotic ingredients. Keep descriptions simple and generic.
-6. Return ONLY a valid JSON array. No extra text.
+6. The menu may be split across several images. Treat all images as ONE menu and list each item only once.
+7. Return ONLY a valid JSON array. No extra text.
 
 Output format:
 [
@@ -518,13 +959,45 @@ Output format:
 ]
 """
 
-  response = model.generate_content([
-    prompt,
-    {
+def normalize_item_name(name: str) -> str:
+  return " ".join(name.lower().split())
+
+def dedupe_extracted_items(items: list) -> list:
+  unique = {}
+  for item in items:
+    key = normalize_item_name(item["name"])
+    if not key:
+      continue
+
+    existing = unique.get(key)
+    if existing is None:
+      unique[key] = item
+    elif existing["price"] is None and item["price"] is not None:
+      # The same dish can appear on two boards; keep the copy that has a price.
+      unique[key] = {**existing, "price": item["price"]}
+
+  return list(unique.values())
+
+def _menu_extraction_request(images: list):
+  """The Gemini model and the prompt + image parts for one scan of `images`."""
+  if not os.environ.get("GEMINI_API_KEY"):
+    raise Exception("GEMINI_API_KEY is missing from environment variables!")
+
+  model = genai.GenerativeModel('gemini-2.5-flash')
+
+  contents = [MENU_EXTRACTION_PROMPT]
+  for image_bytes, mime_type in images:
+    contents.append({
       "mime_type": mime_type,
       "data": image_bytes
-    }
-  ])
+    })
+  return model, contents
+
+def _extract_menu_from_images(images: list) -> list:
+  model, contents = _menu_extraction_request(images)
+
+  with track("gemini", "generate_content"):
+    response = model.generate_content(contents)
 
   cleaned_text = response.text.strip()
   if cleaned_text.startswith("```json"):
@@ -533,32 +1006,182 @@ Output format:
     cleaned_text = cleaned_text[:-3]
 
   raw_items = json.loads(cleaned_text)
-  return validate_extracted_items(raw_items)
+  return dedupe_extracted_items(validate_extracted_items(raw_items))
+
+class JsonArrayStreamParser:
+  """
+    Incrementally parses a JSON array of objects from text chunks.
+    Each top-level object is returned as soon as its closing brace arrives;
+    anything outside the array (e.g. markdown fences) is ignored.
+  """
+
+  def __init__(self):
+    self._in_array = False
+    self._finished = False
+    self._depth = 0
+    self._in_string = False
+    self._escaped = False
+    self._current = []
+
+  def feed(self, chunk: str) -> list:
+    completed = []
+
+    for char in chunk:
+      if self._finished:
+        break
+
+      if not self._in_array:
+        if char == "[":
+          self._in_array = True
+        continue
+
+      if self._depth == 0:
+        if char == "{":
+          self._depth = 1
+          self._current = [char]
+        elif char == "]":
+          self._finished = True
+        continue
+
+      self._current.append(char)
+
+      if self._in_string:
+        if self._escaped:
+          self._escaped = False
+        elif char == "\\":
+          self._escaped = True
+        elif char == '"':
+          self._in_string = False
+        continue
+
+      if char == '"':
+        self._in_string = True
+      elif char in "{[":
+        self._depth += 1
+      elif char in "}]":
+        self._depth -= 1
+        if self._depth == 0:
+          try:
+            completed.append(json.loads("".join(self._current)))
+          except ValueError:
+            pass
+          self._current = []
+
+    return completed
+
+def _sse_event(event: str, data) -> str:
+  return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_menu_from_images(images: list):
+  seen_names = set()
+  count = 0
 
-async def scan_menu_image(file: UploadFile, id_token: str):
   try:
-    staff_data, staff_uid = await get_staff_details(id_token)
+    model, contents = _menu_extraction_request(images)
+    parser = JsonArrayStreamParser()
+
+    # Only time spent waiting on Gemini is recorded, not the SSE client
+    # reading between chunks. The span covers the call up to the first chunk
+    # and is closed before anything is yielded.
+    span = start_detached_span(
+      "gemini generate_content_stream",
+      {"dependency": "gemini", "operation": "generate_content_stream"},
+      kind="client"
+    )
+    model_seconds = 0.0
+    first_chunk = True
 
-    if not staff_data:
-      return JSONResponse(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        content={"message": "Invalid or expired token."}
-      )
+    started = time.perf_counter()
+    try:
+      chunks = iter(model.generate_content(contents, stream=True))
+      while True:
+        try:
+          chunk = next(chunks)
+        except StopIteration:
+          break
+        finally:
+          model_seconds += time.perf_counter() - started
+
+        if first_chunk:
+          first_chunk = False
+          observe_latency("gemini", "generate_content_stream_first_chunk", model_seconds)
+          if span is not None:
+            span.set_attribute("time_to_first_chunk_ms", round(model_seconds * 1000, 1))
+            span.end()
+            span = None
+
+        for raw_item in parser.feed(chunk.text):
+          for item in validate_extracted_items([raw_item]):
+            key = normalize_item_name(item["name"])
+            if not key or key in seen_names:
+              continue
+
+            seen_names.add(key)
+            count += 1
+            yield _sse_event("item", item)
+
+        started = time.perf_counter()
+    except Exception as e:
+      if span is not None:
+        span.record_exception(e)
+      raise
+    finally:
+      if span is not None:
+        span.end()
+      record_call("gemini", "generate_content_stream", model_seconds)
+
+    yield _sse_event("done", {"count": count, "images_scanned": len(images)})
+
+  except Exception as e:
+    yield _sse_event("error", {"message": f"Internal Server Error: {str(e)}", "count": count})
+
+async def _read_scan_images(files: List[UploadFile]):
+  if not files:
+    return None, JSONResponse(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      content={"message": "At least one image is required."}
+    )
 
+  if len(files) > MAX_SCAN_IMAGES:
+    return None, JSONResponse(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      content={"message": f"Too many images. Max {MAX_SCAN_IMAGES} per scan."}
+    )
+
+  images = []
+  for file in files:
     if file.content_type not in ["image/jpeg", "image/png"]:
-      return JSONResponse(
+      return None, JSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content={"message": "Invalid file type. Only JPEG and PNG allowed."}
       )
 
     contents = await file.read()
-    if len(contents) > 5 * 1024 * 1024:
-      return JSONResponse(
+    if len(contents) > MAX_SCAN_IMAGE_BYTES:
+      return None, JSONResponse(
         status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-        content={"message": "File too large. Max 5MB."}
+        content={"message": f"File {file.filename} too large. Max 5MB."}
       )
 
-    extracted_items = _extract_menu_from_image(contents, file.content_type)
+    images.append((contents, file.content_type))
+
+  return images, None
+
+async def scan_menu_image(files: List[UploadFile], id_token: str):
+  try:
+    staff_data, staff_uid = await get_staff_details(id_token)
+
+    if not staff_data:
+      return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"message": "Invalid or expired token."}
+      )
+
+    images, error_response = await _read_scan_images(files)
+    if error_response:
+      return error_response
+
+    extracted_items = _extract_menu_from_images(images)
 
     if not extracted_items:
       return JSONResponse(
@@ -571,7 +1194,8 @@ async def scan_menu_image(file: UploadFile, id_token: str):
       content={
         "message": "Scan complete. Please verify items.",
         "detected_items": extracted_items,
-        "count": len(extracted_items)
+        "count": len(extracted_items),
+        "images_scanned": len(images)
       }
     )
 
@@ -581,7 +1205,33 @@ async def scan_menu_image(file: UploadFile, id_token: str):
       content={"message": f"Internal Server Error: {str(e)}"}
     )
 
-async def get_stall_orders(id_token: str, status_filter: str = "PAID"):
+async def scan_menu_image_stream(files: List[UploadFile], id_token: str):
+  try:
+    staff_data, staff_uid = await get_staff_details(id_token)
+
+    if not staff_data:
+      return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"message": "Invalid or expired token."}
+      )
+
+    images, error_response = await _read_scan_images(files)
+    if error_response:
+      return error_response
+
+    return StreamingResponse(
+      _stream_menu_from_images(images),
+      media_type="text/event-stream",
+      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+  except Exception as e:
+    return JSONResponse(
+      status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+      content={"message": f"Internal Server Error: {str(e)}"}
+    )
+
+async def get_stall_orders(id_token: str, status_filter: str = "PAID", include_archive: bool = False, before: str = None):
   try:
     staff_data, _ = await get_staff_details(id_token)
 
@@ -591,24 +1241,39 @@ async def get_stall_orders(id_token: str, status_filter: str = "PAID"):
         content={"message": "Invalid or expired token."}
       )
 
+    try:
+      cursor = parse_archive_cursor(before)
+    except ValueError:
+      return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"message": "Invalid archive cursor."}
+      )
+
     stall_id = staff_data.get("stall_id")
 
-    orders_ref = (
-      db.collection("orders")
-      .where("stall_id", "==", stall_id)
-      .where("status", "==", status_filter)
-      .order_by("created_at", direction=firestore.Query.DESCENDING)
-    )
+    docs = []
+    if cursor is None:
+      orders_ref = (
+        db.collection("orders")
+        .where("stall_id", "==", stall_id)
+        .where("status", "==", status_filter)
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+      )
+      docs = [(doc, False) for doc in orders_ref.stream()]
 
-    docs = orders_ref.stream()
+    # Only closed orders are archived, so active statuses never reach it.
+    next_cursor = None
+    if (include_archive or cursor is not None) and status_filter in ARCHIVED_STATUSES:
+      archived, next_cursor = await asyncio.to_thread(
+        archived_order_page, [("stall_id", "==", stall_id), ("status", "==", status_filter)], before=cursor
+      )
+      docs.extend((doc, True) for doc in archived)
 
     orders_list = []
-    for doc in docs:
+    for doc, is_archived in docs:
       data = doc.to_dict()
       data['order_id'] = doc.id
-
-      data = serialize_firestore_data(data)
-
+      data['archived'] = is_archived
       orders_list.append(data)
 
     return JSONResponse(
@@ -616,7 +1281,8 @@ async def get_stall_orders(id_token: str, status_filter: str = "PAID"):
       content={
         "stall_id": stall_id,
         "count": len(orders_list),
-        "orders": orders_list
+        "orders": orders_list,
+        "next_archive_cursor": next_cursor
       }
     )
 
@@ -626,76 +1292,350 @@ async def get_stall_orders(id_token: str, status_filter: str = "PAID"):
       content={"message": str(e)}
     )
 
+def _order_status_updates(target: str, staff_email: str) -> dict:
+  """Fields staff status changes write besides the status itself."""
+  updates = {"updated_by": staff_email}
+  if target == "CLAIMED":
+    updates.update({"picked_up_at": firestore.SERVER_TIMESTAMP, "handled_by": staff_email})
+  return updates
+
+def _staff_target_error(target: str):
+  """400 for targets staff cannot set by hand, checked before any read or write."""
+  if target in STAFF_ORDER_TARGETS:
+    return None
+  return JSONResponse(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    content={"message": f"Staff can only move orders to {', '.join(sorted(STAFF_ORDER_TARGETS))}."}
+  )
+
+def _check_stall(stall_id: str, message: str = "You cannot update orders from other stalls."):
+  def check(data):
+    if data.get("stall_id") != stall_id:
+      raise OrderTransitionError(message, "rejected", status_code=status.HTTP_403_FORBIDDEN)
+  return check
+
 async def update_order_status_staff(order_id: str, status_data: UpdateOrderStatusSchema, id_token: str):
   try:
     staff_data, _ = await get_staff_details(id_token)
     if not staff_data:
       return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
 
-    stall_id = staff_data.get("stall_id")
+    target = status_data.status.upper()
+    target_error = _staff_target_error(target)
+    if target_error is not None:
+      return target_error
 
-    order_ref = db.collection("orders").document(order_id)
-    order_doc = order_ref.get()
+    try:
+      await asyncio.to_thread(
+        transition_order,
+        db.collection("orders").document(order_id),
+        target,
+        updates=_order_status_updates(target, staff_data.get("email")),
+        check=_check_stall(staff_data.get("stall_id")),
+        transitions=STAFF_ORDER_TRANSITIONS
+      )
+    except OrderTransitionError as e:
+      return JSONResponse(status_code=e.status_code, content={"message": str(e)})
 
-    if not order_doc.exists:
-      return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"message": "Order not found"})
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": f"Order status updated to {target}"})
 
-    order_data = order_doc.to_dict()
+  except Exception as e:
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": str(e)})
 
-    if order_data.get("stall_id") != stall_id:
-      return JSONResponse(
-        status_code=status.HTTP_403_FORBIDDEN,
-        content={"message": "You cannot update orders from other stalls."}
-      )
+# Up to three writes per order (order, pickup code release, the user's order
+# summary), under the 500-write transaction limit.
+BULK_ORDER_STATUS_CHUNK = 150
+
+def _transition_orders_chunk(order_ids: list, target: str, stall_id: str, staff_email: str) -> dict:
+  """
+    Moves one chunk of orders to `target` in a single transaction: one
+    batched read covers ownership and current status, then one commit.
+    Returns {order_id: (result, message)}.
+  """
+  transaction = db.transaction()
+  updates = _order_status_updates(target, staff_email)
+
+  @transactional
+  def transition_in_transaction(transaction):
+    refs = [db.collection("orders").document(order_id) for order_id in order_ids]
+    snapshots = {snapshot.id: snapshot for snapshot in transaction.get_all(refs)}
+    outcomes = {}
+
+    for order_id, ref in zip(order_ids, refs):
+      snapshot = snapshots.get(order_id)
+      if snapshot is None or not snapshot.exists:
+        outcomes[order_id] = ("not_found", "Order not found")
+        continue
+
+      data = snapshot.to_dict()
+      try:
+        _check_stall(stall_id)(data)
+        apply_transition(transaction, ref, data, target, updates, STAFF_ORDER_TRANSITIONS)
+        outcomes[order_id] = ("updated", None)
+      except OrderTransitionError as e:
+        outcomes[order_id] = ("forbidden" if e.status_code == status.HTTP_403_FORBIDDEN else e.reason, str(e))
+
+    return outcomes
+
+  return transition_in_transaction(transaction)
+
+async def bulk_update_order_status(bulk_data: BulkOrderStatusSchema, id_token: str):
+  """
+    Moves many orders of the staff's stall to one status (e.g. a batch off
+    the grill to READY) with the same checks and fields as the single-order
+    update. Orders that cannot move are reported, not fatal.
+  """
+  try:
+    staff_data, _ = await get_staff_details(id_token)
+    if not staff_data:
+      return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
 
-    order_ref.update({
-      "status": status_data.status,
-      "updated_at": firestore.SERVER_TIMESTAMP,
-      "updated_by": staff_data.get("email")
-    })
+    target = bulk_data.status.upper()
+    target_error = _staff_target_error(target)
+    if target_error is not None:
+      return target_error
+
+    order_ids = list(dict.fromkeys(order_id.strip() for order_id in bulk_data.order_ids if order_id.strip()))
+
+    outcomes = {}
+    for chunk in chunked(order_ids, BULK_ORDER_STATUS_CHUNK):
+      try:
+        outcomes.update(await asyncio.to_thread(
+          _transition_orders_chunk, chunk, target, staff_data.get("stall_id"), staff_data.get("email")
+        ))
+      except Exception as e:
+        for order_id in chunk:
+          outcomes[order_id] = ("failed", str(e))
+
+    results = []
+    summary = {}
+    for order_id in order_ids:
+      outcome, message = outcomes[order_id]
+      result = {"order_id": order_id, "status": outcome}
+      if message:
+        result["message"] = message
+      results.append(result)
+      summary[outcome] = summary.get(outcome, 0) + 1
 
-    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": f"Order status updated to {status_data.status}"})
+    return JSONResponse(
+      status_code=status.HTTP_200_OK,
+      content={
+        "message": f"Updated {summary.get('updated', 0)} of {len(order_ids)} orders to {target}.",
+        "summary": summary,
+        "results": results
+      }
+    )
 
   except Exception as e:
     return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": str(e)})
 
+def _claim_pickup(order_id: str, stall_id: str, code: str, staff_email: str):
+  def check(data):
+    _check_stall(stall_id, "Wrong stall")(data)
+    if data.get("status") not in ACTIVE_ORDER_STATUSES:
+      raise OrderTransitionError(f"Cannot verify. Order status is {data.get('status')}.", "invalid_transition")
+    if data.get("pickup_code") != code:
+      raise OrderTransitionError("Incorrect Pickup Code!", "rejected")
+
+  return transition_order(
+    db.collection("orders").document(order_id),
+    "CLAIMED",
+    updates={"picked_up_at": firestore.SERVER_TIMESTAMP, "handled_by": staff_email},
+    check=check
+  )
+
+def _claim_pickup_by_code(stall_id: str, code: str, staff_email: str):
+  """Claims the stall's active order holding `code`; returns its id, or None if there is none."""
+  order_id, from_index = find_active_order_id(stall_id, code)
+  if order_id is None:
+    return None
+
+  try:
+    _claim_pickup(order_id, stall_id, code, staff_email)
+    return order_id
+  except OrderTransitionError as e:
+    if not from_index or e.status_code == status.HTTP_403_FORBIDDEN:
+      raise
+    # Claimed or cancelled through another instance; the code may since
+    # belong to a newer order.
+    pickup_index.discard(stall_id, code, order_id)
+
+  order_id, _ = find_active_order_id(stall_id, code, use_index=False)
+  if order_id is None:
+    return None
+  _claim_pickup(order_id, stall_id, code, staff_email)
+  return order_id
+
 async def verify_order_pickup(verify_data: VerifyPickupSchema, id_token: str):
   try:
     staff_data, _ = await get_staff_details(id_token)
     if not staff_data:
       return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
 
-    order_ref = db.collection("orders").document(verify_data.order_id)
-    order_doc = order_ref.get()
+    stall_id = staff_data.get("stall_id")
+    staff_email = staff_data.get("email")
 
-    if not order_doc.exists:
-      return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"message": "Order not found"})
+    try:
+      if verify_data.order_id:
+        order_id = verify_data.order_id
+        await asyncio.to_thread(_claim_pickup, order_id, stall_id, verify_data.pickup_code, staff_email)
+      else:
+        # Without an order id the code alone identifies the order: codes
+        # are unique among a stall's active orders.
+        order_id = await asyncio.to_thread(_claim_pickup_by_code, stall_id, verify_data.pickup_code, staff_email)
+        if order_id is None:
+          return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"message": "No active order with this pickup code"})
+    except OrderTransitionError as e:
+      return JSONResponse(status_code=e.status_code, content={"message": str(e)})
 
-    data = order_doc.to_dict()
+    return JSONResponse(
+      status_code=status.HTTP_200_OK,
+      content={"message": "Order verified and delivered!", "status": "CLAIMED", "order_id": order_id}
+    )
 
-    if data.get("stall_id") != staff_data.get("stall_id"):
-      return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"message": "Wrong stall"})
+  except Exception as e:
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": str(e)})
 
-    current_status = data.get("status")
-    if current_status not in ["PAID", "READY"]:
-      return JSONResponse(
-        status_code=status.HTTP_400_BAD_REQUEST,
-        content={"message": f"Cannot verify. Order status is {current_status}."}
-      )
+# Three writes per pickup (order, code reservation, the user's order summary),
+# under the 500-write transaction limit.
+PICKUP_SYNC_CHUNK = 150
 
-    stored_code = data.get("pickup_code")
-    if stored_code != verify_data.pickup_code:
-      return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"message": "Incorrect Pickup Code!"})
+def _resolve_sync_entry(entry, stall_id: str, now: datetime):
+  """Returns (order_id, pickup_code, picked_up_at) or raises ValueError with the conflict reason."""
+  picked_up_at = min(entry.picked_up_at or now, now)
+  if picked_up_at.tzinfo is None:
+    picked_up_at = picked_up_at.replace(tzinfo=timezone.utc)
 
-    order_ref.update({
-      "status": "CLAIMED",
-      "picked_up_at": firestore.SERVER_TIMESTAMP,
-      "handled_by": staff_data.get("email")
-    })
+  if entry.token:
+    try:
+      # The counter accepted the token offline, so it only had to be valid then.
+      token = verify_pickup_token(entry.token, stall_id, at=picked_up_at.timestamp())
+    except PickupTokenError as e:
+      raise ValueError(e.reason)
+    return token["order_id"], token["code"], picked_up_at
+
+  if not entry.pickup_code:
+    raise ValueError("token or pickup_code required")
+
+  if entry.order_id:
+    return entry.order_id, entry.pickup_code, picked_up_at
+
+  order_id, _ = find_active_order_id(stall_id, entry.pickup_code, use_index=False)
+  if order_id is None:
+    raise ValueError("no active order with this pickup code")
+  return order_id, entry.pickup_code, picked_up_at
+
+def _plan_pickup_sync(entries: list, stall_id: str, now: datetime):
+  """
+    Resolves every entry to an order. Returns the report (entries that are
+    already settled carry a status) and the pickups left to claim.
+  """
+  report = []
+  to_claim = []
+  seen = set()
+
+  for position, entry in enumerate(entries):
+    result = {"index": position, "order_id": entry.order_id}
+    try:
+      order_id, code, picked_up_at = _resolve_sync_entry(entry, stall_id, now)
+    except ValueError as e:
+      report.append({**result, "status": "conflict", "reason": str(e)})
+      continue
+
+    result["order_id"] = order_id
+    if order_id in seen:
+      report.append({**result, "status": "duplicate"})
+      continue
+
+    seen.add(order_id)
+    report.append(result)
+    to_claim.append((order_id, code, picked_up_at))
+
+  return report, to_claim
+
+def _claim_synced_pickups(pickups: list, stall_id: str, handled_by: str) -> dict:
+  """
+    Claims one chunk of (order_id, pickup_code, picked_up_at) in a single
+    transaction. Returns {order_id: (result, reason)}.
+  """
+  transaction = db.transaction()
+
+  @transactional
+  def claim_in_transaction(transaction):
+    refs = [db.collection("orders").document(order_id) for order_id, _, _ in pickups]
+    snapshots = {snapshot.id: snapshot for snapshot in transaction.get_all(refs)}
+    outcomes = {}
+
+    for order_id, code, picked_up_at in pickups:
+      snapshot = snapshots.get(order_id)
+      data = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+
+      if data is None:
+        outcomes[order_id] = ("conflict", "order not found")
+      elif data.get("stall_id") != stall_id:
+        outcomes[order_id] = ("conflict", "wrong stall")
+      elif data.get("pickup_code") != code:
+        outcomes[order_id] = ("conflict", "pickup code does not match")
+      elif data.get("status") == "CLAIMED":
+        outcomes[order_id] = ("already_claimed", data.get("handled_by"))
+      elif data.get("status") not in ACTIVE_ORDER_STATUSES:
+        outcomes[order_id] = ("conflict", f"order status is {data.get('status')}")
+      else:
+        apply_transition(transaction, snapshot.reference, data, "CLAIMED", {
+          "picked_up_at": picked_up_at,
+          "pickup_synced_at": firestore.SERVER_TIMESTAMP,
+          "handled_by": handled_by
+        })
+        outcomes[order_id] = ("claimed", None)
+
+    return outcomes
+
+  return claim_in_transaction(transaction)
+
+async def sync_pickups(sync_data: PickupSyncSchema, id_token: str):
+  """
+    Applies pickups the counter recorded while offline, in chunked
+    transactions. Each entry is reported as claimed, already_claimed (by an
+    earlier sync or an online verify) or conflict with a reason, e.g. the
+    order was cancelled in the meantime.
+  """
+  try:
+    staff_data, _ = await get_staff_details(id_token)
+    if not staff_data:
+      return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
+
+    stall_id = staff_data.get("stall_id")
+    now = datetime.now(timezone.utc)
+
+    report, to_claim = await asyncio.to_thread(_plan_pickup_sync, sync_data.pickups, stall_id, now)
+
+    outcomes = {}
+    for chunk in chunked(to_claim, PICKUP_SYNC_CHUNK):
+      try:
+        outcomes.update(await asyncio.to_thread(_claim_synced_pickups, chunk, stall_id, staff_data.get("email")))
+      except Exception as e:
+        for order_id, _, _ in chunk:
+          outcomes[order_id] = ("failed", str(e))
+
+    summary = {}
+    for result in report:
+      if "status" not in result:
+        outcome, detail = outcomes[result["order_id"]]
+        result["status"] = outcome
+        if outcome == "already_claimed":
+          result["handled_by"] = detail
+        elif detail:
+          result["reason"] = detail
+      summary[result["status"]] = summary.get(result["status"], 0) + 1
 
     return JSONResponse(
       status_code=status.HTTP_200_OK,
-      content={"message": "Order verified and delivered!", "status": "CLAIMED"}
+      content={
+        "message": f"Synced {summary.get('claimed', 0)} of {len(report)} pickups.",
+        "summary": summary,
+        "conflicts": [result for result in report if result["status"] == "conflict"],
+        "results": report
+      }
     )
 
   except Exception as e:
@@ -721,7 +1661,6 @@ async def get_stall_resale_items(id_token: str):
     for doc in docs:
         data = doc.to_dict()
         data["resale_id"] = doc.id
-        data = serialize_firestore_data(data)
         items.append(data)
 
     return JSONResponse(status_code=200, content=items)
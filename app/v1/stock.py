@@ -0,0 +1,246 @@
+# app/stock.py
+
+import os
+import random
+from .firebase_init import db
+from .storage import transactional
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+# Stock for a menu item is split across sharded counters:
+# menu_items/{item_id}/stock_shards/{0..n-1} = {count}
+# A checkout takes units from randomly ordered shards in small
+# single-document transactions, so concurrent orders for the same item
+# rarely contend on the same document. Releases are blind increments.
+STOCK_SHARDS = int(os.getenv("STOCK_SHARDS", "10"))
+
+class OutOfStockError(Exception):
+  def __init__(self, item_name: str):
+    super().__init__(f"Sorry, {item_name} is out of stock.")
+    self.item_name = item_name
+
+def _menu_item_ref(college_id: str, stall_id: str, item_id: str):
+  return (
+    db.collection("colleges")
+    .document(college_id)
+    .collection("stalls")
+    .document(stall_id)
+    .collection("menu_items")
+    .document(item_id)
+  )
+
+def _shard_ref(item_ref, shard_id: int):
+  return item_ref.collection("stock_shards").document(str(shard_id))
+
+def set_stock(batch, item_ref, quantity: int, current_shards: int = 0) -> dict:
+  """
+    Queues shard writes that spread `quantity` over the item's shards and
+    returns the fields to store on the menu item itself, including the
+    quantity set (`stock_quantity`) so unchanged uploads can skip the reset.
+  """
+  shards = current_shards or STOCK_SHARDS
+  base, extra = divmod(quantity, shards)
+
+  for shard_id in range(shards):
+    batch.set(_shard_ref(item_ref, shard_id), {"count": base + (1 if shard_id < extra else 0)})
+
+  return {
+    "stock_tracked": True,
+    "stock_shards": shards,
+    "stock_quantity": quantity,
+    "stock_sold_out": quantity == 0,
+    "is_available": quantity > 0,
+  }
+
+def stock_changed(item_ref, stored: dict, quantity: int) -> bool:
+  """
+    Whether setting `quantity` would change a stored item's stock: it is not
+    tracked yet, the quantity differs from the one last set, or it sold out
+    and is being restocked. Items set before `stock_quantity` existed are
+    compared with their live count.
+  """
+  if not stored.get("stock_tracked"):
+    return True
+  if stored.get("stock_sold_out") and quantity > 0:
+    return True
+  if "stock_quantity" in stored:
+    return stored["stock_quantity"] != quantity
+  return get_stock(item_ref, stored.get("stock_shards") or STOCK_SHARDS) != quantity
+
+def get_stock(item_ref, shards: int) -> int:
+  refs = [_shard_ref(item_ref, shard_id) for shard_id in range(shards)]
+  return sum(doc.to_dict().get("count", 0) for doc in db.get_all(refs) if doc.exists)
+
+def get_stocks(items: list) -> dict:
+  """Units left for each (item_ref, shards), as {item path: count}, in one get_all."""
+  refs, owners = [], {}
+  for item_ref, shards in items:
+    for shard_id in range(shards):
+      shard_ref = _shard_ref(item_ref, shard_id)
+      refs.append(shard_ref)
+      owners[shard_ref.path] = item_ref.path
+
+  left = {item_ref.path: 0 for item_ref, _ in items}
+  for doc in db.get_all(refs):
+    if doc.exists:
+      left[owners[doc.reference.path]] += doc.to_dict().get("count", 0)
+  return left
+
+def _take_from_shard(shard_ref, wanted: int):
+  transaction = db.transaction()
+
+  @transactional
+  def take_in_transaction(transaction):
+    snapshot = shard_ref.get(transaction=transaction)
+    count = snapshot.to_dict().get("count", 0) if snapshot.exists else 0
+    taken = min(count, wanted)
+    if taken:
+      transaction.update(shard_ref, {"count": count - taken})
+    return taken, count - taken
+
+  return take_in_transaction(transaction)
+
+def _mark_sold_out_if_empty(item_ref, shards: int):
+  """
+    Sums the shards and flips the item to sold out in one transaction, so a
+    release committed in between makes it retry instead of hiding an item
+    that has stock again.
+  """
+  transaction = db.transaction()
+  refs = [_shard_ref(item_ref, shard_id) for shard_id in range(shards)]
+
+  @transactional
+  def mark_in_transaction(transaction):
+    left = sum(doc.to_dict().get("count", 0) for doc in transaction.get_all(refs) if doc.exists)
+    if left == 0:
+      transaction.update(item_ref, {
+        "is_available": False,
+        "stock_sold_out": True,
+        "updated_at": firestore.SERVER_TIMESTAMP
+      })
+
+  mark_in_transaction(transaction)
+
+def reserve_stock(item_ref, item_id: str, item_data: dict, quantity: int) -> list:
+  """
+    Takes `quantity` units from the item's shards and returns the
+    reservations [{item_id, shard, quantity}] to store on the order.
+    Raises OutOfStockError, after putting back any partial take, if there
+    is not enough stock.
+  """
+  shards = item_data.get("stock_shards") or STOCK_SHARDS
+  shard_ids = list(range(shards))
+  random.shuffle(shard_ids)
+
+  reservations = []
+  remaining = quantity
+  emptied_shard = False
+
+  for shard_id in shard_ids:
+    taken, left = _take_from_shard(_shard_ref(item_ref, shard_id), remaining)
+    if not taken:
+      continue
+
+    reservations.append({"item_id": item_id, "shard": shard_id, "quantity": taken})
+    remaining -= taken
+    emptied_shard = emptied_shard or left == 0
+    if remaining == 0:
+      break
+
+  if remaining:
+    batch = db.batch()
+    for reservation in reservations:
+      _queue_shard_increment(batch, item_ref, reservation)
+    if reservations:
+      batch.commit()
+    else:
+      _mark_sold_out_if_empty(item_ref, shards)
+    raise OutOfStockError(item_data.get("name", "this item"))
+
+  # Only worth counting every shard once one of them has run dry.
+  if emptied_shard:
+    _mark_sold_out_if_empty(item_ref, shards)
+
+  return reservations
+
+def _queue_shard_increment(writer, item_ref, reservation: dict):
+  writer.set(
+    _shard_ref(item_ref, reservation["shard"]),
+    {"count": firestore.Increment(reservation["quantity"])},
+    merge=True
+  )
+
+def queue_stock_release(writer, order_data: dict) -> list:
+  """
+    Queues the increments that give an order's reserved units back on a
+    batch or transaction. Returns the affected menu item refs, which should
+    be passed to restore_availability() once the writes are committed.
+  """
+  item_refs = {}
+  for reservation in order_data.get("stock_reservations", []):
+    item_id = reservation["item_id"]
+    if item_id not in item_refs:
+      item_refs[item_id] = _menu_item_ref(order_data.get("college_id"), order_data.get("stall_id"), item_id)
+    _queue_shard_increment(writer, item_refs[item_id], reservation)
+  return list(item_refs.values())
+
+def release_reservations(college_id: str, stall_id: str, reservations: list):
+  if not reservations:
+    return
+
+  batch = db.batch()
+  item_refs = queue_stock_release(batch, {
+    "college_id": college_id,
+    "stall_id": stall_id,
+    "stock_reservations": reservations
+  })
+  batch.commit()
+  restore_availability(item_refs)
+
+def restore_availability(item_refs: list):
+  """Flips items that were auto-marked sold out back to available."""
+  if not item_refs:
+    return
+
+  batch = db.batch()
+  writes = 0
+  for doc in db.get_all(item_refs):
+    if doc.exists and doc.to_dict().get("stock_sold_out"):
+      batch.update(doc.reference, {
+        "is_available": True,
+        "stock_sold_out": False,
+        "updated_at": firestore.SERVER_TIMESTAMP
+      })
+      writes += 1
+
+  if writes:
+    batch.commit()
+
+def release_order_stock(order_ref, reason: str) -> bool:
+  """
+    Releases an order's stock reservations exactly once. Returns True if
+    anything was released.
+  """
+  transaction = db.transaction()
+
+  @transactional
+  def release_in_transaction(transaction):
+    snapshot = order_ref.get(transaction=transaction)
+    if not snapshot.exists:
+      return []
+
+    order_data = snapshot.to_dict()
+    if order_data.get("stock_released") or not order_data.get("stock_reservations"):
+      return []
+
+    item_refs = queue_stock_release(transaction, order_data)
+    transaction.update(order_ref, {
+      "stock_released": True,
+      "stock_release_reason": reason
+    })
+    return item_refs
+
+  item_refs = release_in_transaction(transaction)
+  restore_availability(item_refs)
+  return bool(item_refs)
@@ -0,0 +1,36 @@
+# app/storage/__init__.py
+
+from ..lazy import lazy_import
+from .base import Storage
+from .firestore import FirestoreStorage
+
+firestore = lazy_import("firebase_admin.firestore")
+
+STORAGE_BACKENDS = ("firestore", "memory")
+
+def create_storage(backend: str, client_factory=None) -> Storage:
+  """
+    Builds the storage backend named by `backend`. The Firestore backend
+    needs `client_factory`, called once on first use to build the client.
+  """
+  backend = (backend or "firestore").lower()
+  if backend == "memory":
+    from .memory import MemoryStorage
+    return MemoryStorage()
+  if backend == "firestore":
+    return FirestoreStorage(client_factory or (lambda: firestore.client()))
+  raise ValueError(f"Unknown storage backend: {backend}. Expected one of {', '.join(STORAGE_BACKENDS)}.")
+
+def transactional(function):
+  """
+    Backend-neutral @firestore.transactional: the decorated function receives
+    the transaction first and its writes are committed atomically on return.
+  """
+
+  def wrapper(transaction, *args, **kwargs):
+    run_in_transaction = getattr(transaction, "run_in_transaction", None)
+    if run_in_transaction is not None:
+      return run_in_transaction(function, *args, **kwargs)
+    return firestore.transactional(function)(transaction, *args, **kwargs)
+
+  return wrapper
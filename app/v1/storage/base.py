@@ -0,0 +1,35 @@
+# app/storage/base.py
+
+class Storage:
+  """
+    The storage operations the app relies on. The shape follows the Firestore
+    client so call sites read the same on every backend:
+
+      db.collection("orders").document(order_id).get() / set / update / delete
+      doc_ref.collection("menu_items")                      (subcollections)
+      query.where(field, op, value).order_by(field).start_after(cursor).limit(n).stream()
+      db.batch(); batch.set/update/delete; batch.commit()
+      db.transaction() with @storage.transactional
+      db.get_all(refs)
+
+    Writes accept the Firestore sentinels (SERVER_TIMESTAMP, Increment,
+    ArrayUnion, ArrayRemove, DELETE_FIELD) and dotted field paths in update().
+  """
+
+  def collection(self, collection_path: str):
+    raise NotImplementedError
+
+  def collection_group(self, collection_id: str):
+    raise NotImplementedError
+
+  def document(self, document_path: str):
+    raise NotImplementedError
+
+  def batch(self):
+    raise NotImplementedError
+
+  def transaction(self, **kwargs):
+    raise NotImplementedError
+
+  def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+    raise NotImplementedError
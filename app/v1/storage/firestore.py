@@ -0,0 +1,41 @@
+# app/storage/firestore.py
+
+import threading
+from .base import Storage
+
+class FirestoreStorage(Storage):
+  """
+    Cloud Firestore backend. The client is built on first use, so importing
+    the app needs neither credentials nor a network connection.
+  """
+
+  def __init__(self, client_factory):
+    self._client_factory = client_factory
+    self._client = None
+    self._lock = threading.Lock()
+
+  @property
+  def client(self):
+    if self._client is None:
+      with self._lock:
+        if self._client is None:
+          self._client = self._client_factory()
+    return self._client
+
+  def collection(self, collection_path: str):
+    return self.client.collection(collection_path)
+
+  def collection_group(self, collection_id: str):
+    return self.client.collection_group(collection_id)
+
+  def document(self, document_path: str):
+    return self.client.document(document_path)
+
+  def batch(self):
+    return self.client.batch()
+
+  def transaction(self, **kwargs):
+    return self.client.transaction(**kwargs)
+
+  def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+    return self.client.get_all(references, field_paths=field_paths, transaction=transaction, **kwargs)
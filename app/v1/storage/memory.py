@@ -0,0 +1,382 @@
+# app/storage/memory.py
+
+import copy
+import uuid
+import threading
+from datetime import timezone
+from google.api_core import exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import transforms
+from .base import Storage
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+# Ordering by the document itself (FieldPath.document_id()).
+DOCUMENT_ID = "__name__"
+
+def _now():
+  return DatetimeWithNanoseconds.now(timezone.utc)
+
+def _resolve_path(data: dict, field_path: str):
+  value = data
+  for part in field_path.split("."):
+    if not isinstance(value, dict) or part not in value:
+      return False, None
+    value = value[part]
+  return True, value
+
+def _apply_transform(current, value):
+  if value is transforms.SERVER_TIMESTAMP:
+    return _now()
+  if isinstance(value, transforms.Increment):
+    return (current if isinstance(current, (int, float)) else 0) + value.value
+  if isinstance(value, transforms.ArrayUnion):
+    result = list(current) if isinstance(current, list) else []
+    result.extend(item for item in value.values if item not in result)
+    return result
+  if isinstance(value, transforms.ArrayRemove):
+    return [item for item in (current or []) if item not in value.values]
+  if isinstance(value, dict):
+    base = current if isinstance(current, dict) else {}
+    return {key: _apply_transform(base.get(key), item) for key, item in value.items()}
+  if isinstance(value, list):
+    return [_apply_transform(None, item) for item in value]
+  return value
+
+def _merge(target: dict, updates: dict):
+  for key, value in updates.items():
+    if value is transforms.DELETE_FIELD:
+      target.pop(key, None)
+    elif isinstance(value, dict) and isinstance(target.get(key), dict):
+      _merge(target[key], value)
+    else:
+      target[key] = _apply_transform(target.get(key), value)
+
+def _set_path(target: dict, field_path: str, value):
+  parts = field_path.split(".")
+  for part in parts[:-1]:
+    if not isinstance(target.get(part), dict):
+      target[part] = {}
+    target = target[part]
+  if value is transforms.DELETE_FIELD:
+    target.pop(parts[-1], None)
+  else:
+    target[parts[-1]] = _apply_transform(target.get(parts[-1]), value)
+
+def _matches(data: dict, field: str, op: str, expected) -> bool:
+  found, value = _resolve_path(data, field)
+  if op == "!=":
+    return found and value != expected
+  if op == "not-in":
+    return found and value not in expected
+  if not found:
+    return False
+  if op == "==":
+    return value == expected
+  if op == "in":
+    return value in expected
+  if op == "array_contains":
+    return isinstance(value, list) and expected in value
+  if op == "array_contains_any":
+    return isinstance(value, list) and any(item in value for item in expected)
+  try:
+    if op == "<":
+      return value < expected
+    if op == "<=":
+      return value <= expected
+    if op == ">":
+      return value > expected
+    if op == ">=":
+      return value >= expected
+  except TypeError:
+    return False
+  raise ValueError(f"Unsupported operator: {op}")
+
+def _order_value(entry, field: str):
+  ref, data = entry
+  return ref.path if field == DOCUMENT_ID else _resolve_path(data, field)[1]
+
+def _is_after(entry, orders, cursor) -> bool:
+  """Whether the entry sorts strictly after the cursor values."""
+  for (field, direction), expected in zip(orders, cursor):
+    if field == DOCUMENT_ID and not isinstance(expected, str):
+      expected = expected.path
+    value = _order_value(entry, field)
+    if value != expected:
+      return value < expected if direction == DESCENDING else value > expected
+  return False
+
+class MemoryDocumentSnapshot:
+  def __init__(self, reference, data):
+    self.reference = reference
+    self._data = data
+
+  @property
+  def id(self):
+    return self.reference.id
+
+  @property
+  def exists(self):
+    return self._data is not None
+
+  def to_dict(self):
+    return copy.deepcopy(self._data) if self._data is not None else None
+
+  def get(self, field_path: str):
+    found, value = _resolve_path(self._data or {}, field_path)
+    if not found:
+      raise KeyError(field_path)
+    return copy.deepcopy(value)
+
+class MemoryDocumentReference:
+  def __init__(self, client, collection_path: str, document_id: str):
+    self._client = client
+    self._collection_path = collection_path
+    self.id = document_id
+
+  @property
+  def path(self):
+    return f"{self._collection_path}/{self.id}"
+
+  @property
+  def parent(self):
+    return MemoryCollectionReference(self._client, self._collection_path)
+
+  def __eq__(self, other):
+    return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+  def __hash__(self):
+    return hash(self.path)
+
+  def collection(self, name: str):
+    return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+  def get(self, field_paths=None, transaction=None, **kwargs):
+    return self._client._snapshot(self)
+
+  def set(self, data: dict, merge: bool = False):
+    self._client._write([("set", self, data, merge)])
+
+  def create(self, data: dict):
+    self._client._write([("create", self, data, False)])
+
+  def update(self, data: dict):
+    self._client._write([("update", self, data, False)])
+
+  def delete(self):
+    self._client._write([("delete", self, None, False)])
+
+class MemoryQuery:
+  def __init__(self, client, collection_path: str, filters=(), orders=(), limit=None, all_descendants=False, start_after=None):
+    self._client = client
+    self._collection_path = collection_path
+    self._filters = tuple(filters)
+    self._orders = tuple(orders)
+    self._limit = limit
+    self._all_descendants = all_descendants
+    self._start_after = start_after
+
+  def _copy(self, **changes):
+    state = {
+      "filters": self._filters,
+      "orders": self._orders,
+      "limit": self._limit,
+      "all_descendants": self._all_descendants,
+      "start_after": self._start_after,
+    }
+    state.update(changes)
+    return MemoryQuery(self._client, self._collection_path, **state)
+
+  def where(self, field_path=None, op_string=None, value=None, filter=None):
+    if filter is not None:
+      field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+    return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+  def order_by(self, field_path: str, direction: str = ASCENDING):
+    return self._copy(orders=self._orders + ((field_path, direction),))
+
+  def limit(self, count: int):
+    return self._copy(limit=count)
+
+  def start_after(self, document_fields_or_snapshot):
+    """
+      Cursor over the order_by fields, like Firestore's: a snapshot, a dict
+      of field -> value or a list of values (a prefix of the orders).
+      `__name__` values may be references or document paths.
+    """
+    cursor = document_fields_or_snapshot
+    if isinstance(cursor, MemoryDocumentSnapshot):
+      cursor = {**cursor.to_dict(), DOCUMENT_ID: cursor.reference}
+    if isinstance(cursor, dict):
+      cursor = [cursor[field] if field in cursor else _resolve_path(cursor, field)[1] for field, _ in self._orders[:len(cursor)]]
+    return self._copy(start_after=tuple(cursor))
+
+  def select(self, field_paths):
+    return self
+
+  def stream(self, transaction=None, **kwargs):
+    return iter(self._client._run_query(self))
+
+  def get(self, transaction=None, **kwargs):
+    return list(self.stream(transaction=transaction))
+
+class MemoryCollectionReference(MemoryQuery):
+  def __init__(self, client, collection_path: str):
+    super().__init__(client, collection_path)
+
+  @property
+  def id(self):
+    return self._collection_path.rsplit("/", 1)[-1]
+
+  def document(self, document_id: str = None):
+    return MemoryDocumentReference(self._client, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+  def add(self, data: dict, document_id: str = None):
+    ref = self.document(document_id)
+    ref.create(data)
+    return _now(), ref
+
+class MemoryWriteBatch:
+  def __init__(self, client):
+    self._client = client
+    self._writes = []
+
+  def set(self, ref, data: dict, merge: bool = False):
+    self._writes.append(("set", ref, data, merge))
+
+  def create(self, ref, data: dict):
+    self._writes.append(("create", ref, data, False))
+
+  def update(self, ref, data: dict):
+    self._writes.append(("update", ref, data, False))
+
+  def delete(self, ref):
+    self._writes.append(("delete", ref, None, False))
+
+  def commit(self):
+    writes, self._writes = self._writes, []
+    self._client._write(writes)
+    return []
+
+class MemoryTransaction(MemoryWriteBatch):
+  def get(self, ref_or_query):
+    if isinstance(ref_or_query, MemoryDocumentReference):
+      return iter([self._client._snapshot(ref_or_query)])
+    return ref_or_query.stream()
+
+  def get_all(self, references):
+    return self._client.get_all(references)
+
+  def _rollback(self):
+    self._writes = []
+
+  def run_in_transaction(self, function, *args, **kwargs):
+    """
+      Runs function(self, ...) under the storage lock, committing its writes
+      on success. Holding the lock gives the isolation Firestore's
+      pessimistic transactions do, without retries.
+    """
+    with self._client._lock:
+      try:
+        result = function(self, *args, **kwargs)
+      except BaseException:
+        self._rollback()
+        raise
+      self.commit()
+      return result
+
+class MemoryStorage(Storage):
+  """
+    In-process backend over nested dicts, {collection_path: {doc_id: data}},
+    with Firestore semantics for the operations in Storage: documents and
+    subcollections, where/order_by/limit queries, collection groups,
+    batches, transactions, get_all and the server-side transforms.
+    Stored documents are replaced rather than mutated on write, so
+    snapshots can share them and only to_dict() has to copy.
+  """
+
+  def __init__(self):
+    self._collections = {}
+    self._lock = threading.RLock()
+
+  def collection(self, name: str):
+    return MemoryCollectionReference(self, name)
+
+  def collection_group(self, name: str):
+    return MemoryQuery(self, name, all_descendants=True)
+
+  def document(self, path: str):
+    collection_path, _, document_id = path.rpartition("/")
+    return MemoryDocumentReference(self, collection_path, document_id)
+
+  def batch(self):
+    return MemoryWriteBatch(self)
+
+  def transaction(self, **kwargs):
+    return MemoryTransaction(self)
+
+  def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+    return iter([self._snapshot(ref) for ref in references])
+
+  def _snapshot(self, ref):
+    with self._lock:
+      data = self._collections.get(ref._collection_path, {}).get(ref.id)
+      return MemoryDocumentSnapshot(ref, data)
+
+  def _write(self, writes: list):
+    with self._lock:
+      # Validate first so a failing write leaves the batch unapplied.
+      for kind, ref, _, _ in writes:
+        existing = self._collections.get(ref._collection_path, {}).get(ref.id)
+        if kind == "update" and existing is None:
+          raise exceptions.NotFound(f"No document to update: {ref.path}")
+        if kind == "create" and existing is not None:
+          raise exceptions.AlreadyExists(f"Document already exists: {ref.path}")
+
+      for kind, ref, data, merge in writes:
+        documents = self._collections.setdefault(ref._collection_path, {})
+        if kind == "delete":
+          documents.pop(ref.id, None)
+        elif kind == "update":
+          current = copy.deepcopy(documents[ref.id])
+          for field_path, value in data.items():
+            _set_path(current, field_path, value)
+          documents[ref.id] = current
+        elif kind == "set" and merge:
+          current = copy.deepcopy(documents.get(ref.id, {}))
+          _merge(current, data)
+          documents[ref.id] = current
+        else:
+          current = {}
+          _merge(current, data)
+          documents[ref.id] = current
+
+  def _run_query(self, query: MemoryQuery):
+    with self._lock:
+      if query._all_descendants:
+        sources = [
+          (path, documents)
+          for path, documents in self._collections.items()
+          if path.rsplit("/", 1)[-1] == query._collection_path
+        ]
+      else:
+        sources = [(query._collection_path, self._collections.get(query._collection_path, {}))]
+
+      matched = [
+        (MemoryDocumentReference(self, path, document_id), data)
+        for path, documents in sources
+        for document_id, data in documents.items()
+        if all(_matches(data, field, op, value) for field, op, value in query._filters)
+      ]
+
+      for field, direction in reversed(query._orders):
+        matched = [entry for entry in matched if field == DOCUMENT_ID or _resolve_path(entry[1], field)[0]]
+        matched.sort(key=lambda entry: _order_value(entry, field), reverse=direction == DESCENDING)
+
+      if query._start_after is not None:
+        matched = [entry for entry in matched if _is_after(entry, query._orders, query._start_after)]
+
+      if query._limit is not None:
+        matched = matched[:query._limit]
+
+      return [MemoryDocumentSnapshot(ref, data) for ref, data in matched]
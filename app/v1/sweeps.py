@@ -0,0 +1,136 @@
+# app/sweeps.py
+
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+from .firebase_init import db
+from .stock import queue_stock_release, restore_availability
+from .orders import OrderTransitionError, transition_order, transition_refund
+from .user import find_refund, issue_refund
+
+# Periodic clean-up of orders that nothing else will move on. Orders are
+# created against Razorpay's orders API, whose checkouts never send an
+# expiry event, so a PENDING order the student walked away from would hold
+# its stock reservation forever. Each sweep is idempotent (every change is a
+# checked transition), so running it on every instance is safe.
+#
+# Refunds are recorded PENDING in the cancel transaction and only then
+# requested from Razorpay; if the process dies in between, or the outcome
+# cannot be written back, the refund would stay PENDING. Once it has been
+# PENDING for REFUND_RETRY_AFTER_MINUTES it is looked up on the payment and
+# recorded, or requested again if Razorpay has none for the order.
+PENDING_ORDER_TTL_MINUTES = int(os.getenv("PENDING_ORDER_TTL_MINUTES", "20"))
+REFUND_RETRY_AFTER_MINUTES = int(os.getenv("REFUND_RETRY_AFTER_MINUTES", "5"))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+SWEEP_ENABLED = os.getenv("SWEEP_ENABLED", "true").lower() == "true"
+SWEEP_BATCH_SIZE = 100
+
+_sweep_task = None
+
+def _expire_order(order_ref) -> list:
+  """Moves one PENDING order to EXPIRED and gives its stock back in the same transaction."""
+  item_refs = []
+
+  def release_stock(transaction, data):
+    # The transaction may be retried, so only the last attempt's refs count.
+    item_refs.clear()
+    if data.get("stock_released") or not data.get("stock_reservations"):
+      return {}
+    item_refs.extend(queue_stock_release(transaction, data))
+    return {"stock_released": True, "stock_release_reason": "expired"}
+
+  transition_order(order_ref, "EXPIRED", before_write=release_stock)
+  return item_refs
+
+def expire_pending_orders(now: datetime = None) -> int:
+  """Expires PENDING orders created more than PENDING_ORDER_TTL_MINUTES ago; returns how many."""
+  cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=PENDING_ORDER_TTL_MINUTES)
+  query = (
+    db.collection("orders")
+    .where("status", "==", "PENDING")
+    .where("created_at", "<", cutoff)
+    .limit(SWEEP_BATCH_SIZE)
+  )
+
+  expired = 0
+  for snapshot in query.stream():
+    try:
+      item_refs = _expire_order(snapshot.reference)
+    except OrderTransitionError:
+      # Paid or cancelled since the query ran.
+      continue
+    restore_availability(item_refs)
+    expired += 1
+  return expired
+
+def retry_pending_refunds(now: datetime = None) -> int:
+  """Settles refunds left PENDING for over REFUND_RETRY_AFTER_MINUTES; returns how many."""
+  cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=REFUND_RETRY_AFTER_MINUTES)
+  query = (
+    db.collection("orders")
+    .where("refund.status", "==", "PENDING")
+    .where("updated_at", "<", cutoff)
+    .limit(SWEEP_BATCH_SIZE)
+  )
+
+  settled = 0
+  for snapshot in query.stream():
+    data = snapshot.to_dict()
+    refund = data.get("refund") or {}
+    payment_id = data.get("razorpay_payment_id")
+    if not payment_id:
+      continue
+
+    existing = find_refund(snapshot.id, payment_id)
+    if existing is None:
+      issue_refund(
+        snapshot.id, payment_id, refund.get("amount", 0), refund.get("type"),
+        reason=refund.get("reason") or "User Cancelled"
+      )
+    else:
+      try:
+        transition_refund(snapshot.reference, "INITIATED", {"razorpay_refund_id": existing.get("id")})
+      except OrderTransitionError:
+        # Settled by a webhook since the query ran.
+        continue
+    settled += 1
+  return settled
+
+SWEEPS = (
+  ("expire_pending_orders", expire_pending_orders),
+  ("retry_pending_refunds", retry_pending_refunds),
+)
+
+def run_sweeps() -> dict:
+  results = {}
+  for name, sweep in SWEEPS:
+    try:
+      results[name] = sweep()
+    except Exception as e:
+      print(f"Sweep {name} failed: {e}")
+      results[name] = None
+  return results
+
+async def _run_sweeps():
+  while True:
+    await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+    await asyncio.to_thread(run_sweeps)
+
+def start_sweeps():
+  global _sweep_task
+  if _sweep_task is not None or not SWEEP_ENABLED:
+    return
+  _sweep_task = asyncio.create_task(_run_sweeps())
+
+async def stop_sweeps():
+  global _sweep_task
+  if _sweep_task is None:
+    return
+
+  _sweep_task.cancel()
+  try:
+    await _sweep_task
+  except asyncio.CancelledError:
+    pass
+
+  _sweep_task = None
@@ -0,0 +1,266 @@
+# app/tracing.py
+
+import os
+import sys
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+
+# TRACE_EXPORTER picks where finished spans go: "none" (tracing off),
+# "stdout", "file" (JSON lines at TRACE_FILE) or any name registered with
+# register_exporter(). TRACE_SAMPLE_RATIO applies to requests that arrive
+# without a sampled W3C traceparent header.
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+SERVICE_NAME = "greenplate-backend"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+  __slots__ = (
+    "trace_id", "span_id", "parent_id", "name", "kind",
+    "start_ns", "end_ns", "attributes", "error"
+  )
+
+  def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: str = "internal", attributes: dict = None):
+    self.trace_id = trace_id
+    self.span_id = _new_span_id()
+    self.parent_id = parent_id
+    self.name = name
+    self.kind = kind
+    self.start_ns = time.time_ns()
+    self.end_ns = None
+    self.attributes = attributes or {}
+    self.error = None
+
+  def set_attribute(self, key: str, value):
+    self.attributes[key] = value
+
+  def record_exception(self, error: BaseException):
+    self.error = f"{type(error).__name__}: {error}"[:500]
+
+  @property
+  def traceparent(self) -> str:
+    return f"00-{self.trace_id}-{self.span_id}-01"
+
+  def end(self):
+    if self.end_ns is not None:
+      return
+    self.end_ns = time.time_ns()
+    if _exporter is not None:
+      _exporter.export(self)
+
+  def to_dict(self) -> dict:
+    return {
+      "service": SERVICE_NAME,
+      "trace_id": self.trace_id,
+      "span_id": self.span_id,
+      "parent_span_id": self.parent_id,
+      "name": self.name,
+      "kind": self.kind,
+      "start_time_unix_nano": self.start_ns,
+      "end_time_unix_nano": self.end_ns,
+      "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+      "attributes": self.attributes,
+      "status": "ERROR" if self.error else "OK",
+      "error": self.error,
+    }
+
+def _new_trace_id() -> str:
+  return f"{random.getrandbits(128):032x}"
+
+def _new_span_id() -> str:
+  return f"{random.getrandbits(64):016x}"
+
+def parse_traceparent(header: str):
+  """
+    Returns (trace_id, parent_span_id, sampled) from a W3C traceparent
+    header, or None if it is missing or malformed.
+  """
+  parts = (header or "").strip().split("-")
+  if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+    return None
+
+  trace_id, span_id, flags = parts[1].lower(), parts[2].lower(), parts[3]
+  if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+    return None
+  try:
+    int(trace_id, 16), int(span_id, 16)
+    sampled = bool(int(flags, 16) & 0x01)
+  except ValueError:
+    return None
+  if trace_id == "0" * 32 or span_id == "0" * 16:
+    return None
+
+  return trace_id, span_id, sampled
+
+class SpanExporter:
+  """Receives every finished, sampled span."""
+
+  def export(self, span: Span):
+    raise NotImplementedError
+
+  def shutdown(self):
+    pass
+
+class StdoutExporter(SpanExporter):
+  def __init__(self):
+    self._lock = threading.Lock()
+
+  def export(self, span: Span):
+    line = orjson.dumps(span.to_dict(), default=str) + b"\n"
+    with self._lock:
+      sys.stdout.buffer.write(line)
+      sys.stdout.flush()
+
+class FileExporter(SpanExporter):
+  """Appends spans as JSON lines; buffered and flushed on shutdown."""
+
+  def __init__(self, path: str = None):
+    self._lock = threading.Lock()
+    self._file = open(path or TRACE_FILE, "ab")
+
+  def export(self, span: Span):
+    line = orjson.dumps(span.to_dict(), default=str) + b"\n"
+    with self._lock:
+      self._file.write(line)
+
+  def shutdown(self):
+    with self._lock:
+      self._file.flush()
+      self._file.close()
+
+_exporter_factories = {
+  "stdout": StdoutExporter,
+  "file": FileExporter,
+}
+
+_exporter = None
+
+def register_exporter(name: str, factory):
+  """Makes a SpanExporter factory selectable through TRACE_EXPORTER."""
+  _exporter_factories[name.lower()] = factory
+
+def configure_tracing(exporter: str = None, sample_ratio: float = None):
+  """
+    Installs the exporter named by `exporter` (default TRACE_EXPORTER).
+    Passing "none" turns tracing off.
+  """
+  global _exporter, TRACE_SAMPLE_RATIO
+
+  shutdown_tracing()
+  if sample_ratio is not None:
+    TRACE_SAMPLE_RATIO = sample_ratio
+
+  name = (exporter or TRACE_EXPORTER).lower()
+  if name == "none":
+    return
+  if name not in _exporter_factories:
+    raise ValueError(f"Unknown trace exporter: {name}")
+  _exporter = _exporter_factories[name]()
+
+def shutdown_tracing():
+  global _exporter
+  if _exporter is not None:
+    _exporter.shutdown()
+    _exporter = None
+
+def tracing_enabled() -> bool:
+  return _exporter is not None
+
+def current_span():
+  return _current_span.get()
+
+def start_detached_span(name: str, attributes: dict = None, kind: str = "internal"):
+  """
+    Starts a child of the current span without making it current. The caller
+    must call span.end(); used for work that outlives the calling frame, such
+    as lazily consumed Firestore streams. Returns None when not tracing.
+  """
+  parent = _current_span.get()
+  if parent is None or _exporter is None:
+    return None
+  return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+@contextmanager
+def start_span(name: str, attributes: dict = None, kind: str = "internal"):
+  """
+    Opens a child of the current span for the duration of the block. Outside
+    a sampled trace this yields None and records nothing.
+  """
+  span = start_detached_span(name, attributes, kind)
+  if span is None:
+    yield None
+    return
+
+  token = _current_span.set(span)
+  try:
+    yield span
+  except Exception as e:
+    span.record_exception(e)
+    raise
+  finally:
+    _current_span.reset(token)
+    span.end()
+
+def _start_request_span(traceparent: str):
+  parent = parse_traceparent(traceparent)
+  if parent is not None:
+    trace_id, parent_id, sampled = parent
+  else:
+    trace_id, parent_id = _new_trace_id(), None
+    sampled = random.random() < TRACE_SAMPLE_RATIO
+
+  if not sampled:
+    return None
+  return Span("HTTP request", trace_id, parent_id, kind="server")
+
+class TracingMiddleware:
+  """
+    Opens a server span per HTTP request, continuing the caller's trace when
+    a W3C traceparent header is present, and echoes the traceparent of the
+    request span back on the response.
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or _exporter is None:
+      await self.app(scope, receive, send)
+      return
+
+    span = _start_request_span(Headers(scope=scope).get("traceparent"))
+    if span is None:
+      await self.app(scope, receive, send)
+      return
+
+    span.attributes.update({
+      "http.method": scope["method"],
+      "http.target": scope["path"],
+    })
+
+    async def send_wrapper(message):
+      if message["type"] == "http.response.start":
+        span.set_attribute("http.status_code", message["status"])
+        MutableHeaders(scope=message).append("traceparent", span.traceparent)
+      await send(message)
+
+    token = _current_span.set(span)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    except Exception as e:
+      span.record_exception(e)
+      raise
+    finally:
+      _current_span.reset(token)
+      route = getattr(scope.get("route"), "path", None)
+      if route:
+        span.set_attribute("http.route", route)
+      span.name = f"{scope['method']} {route or scope['path']}"
+      span.end()
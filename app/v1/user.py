@@ -1,19 +1,37 @@
 #app/user.py
 
 import os
-import secrets
-import razorpay
-from fastapi.responses import JSONResponse
+import asyncio
+from .responses import JSONResponse
 from starlette import status
-from firebase_admin import auth
 from .firebase_init import db, firestore
+from .storage import transactional
+from .lazy import lazy_import
 from datetime import datetime, timedelta
 from .schema import CreateOrderSchema, UpdateUserProfileSchema, VerifyPaymentSchema
-
-razorpay_client = razorpay.Client(auth=(
-    os.environ.get("RAZORPAY_KEY_ID"),
-    os.environ.get("RAZORPAY_KEY_SECRET")
-))
+from .stock import (
+  OutOfStockError, reserve_stock, release_reservations, release_order_stock,
+  queue_stock_release, restore_availability
+)
+from .orders import OrderTransitionError, apply_transition, check_transition, transition_order, transition_refund
+from .pickup import allocate_pickup_code, issue_pickup_token, index as pickup_index
+from .archive import ARCHIVE_CURSOR_HEADER, archived_order_page, parse_archive_cursor
+from .order_summary import record_new_order, recent_orders
+
+auth = lazy_import("firebase_admin.auth")
+razorpay = lazy_import("razorpay")
+
+_razorpay_client = None
+
+def get_razorpay_client():
+  """Builds the Razorpay client on first use."""
+  global _razorpay_client
+  if _razorpay_client is None:
+    _razorpay_client = razorpay.Client(auth=(
+      os.environ.get("RAZORPAY_KEY_ID"),
+      os.environ.get("RAZORPAY_KEY_SECRET")
+    ))
+  return _razorpay_client
 
 async def get_user_details(id_token: str):
   try:
@@ -29,12 +47,6 @@ async def get_user_details(id_token: str):
   except Exception:
     return None, None
 
-def serialize_firestore_data(data: dict):
-    for k, v in data.items():
-        if isinstance(v, datetime):
-            data[k] = v.isoformat()
-    return data
-
 async def update_user_profile(profile_data: UpdateUserProfileSchema, id_token: str):
   try:
     user_data, user_uid = await get_user_details(id_token)
@@ -80,7 +92,7 @@ async def verify_payment_and_update_order(payment_data: VerifyPaymentSchema, id_
           "razorpay_signature": payment_data.razorpay_signature,
         }
         try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
+            get_razorpay_client().utility.verify_payment_signature(params_dict)
         except Exception as e:
             return JSONResponse(
                 status_code=400,
@@ -90,30 +102,35 @@ async def verify_payment_and_update_order(payment_data: VerifyPaymentSchema, id_
         internal_order_id = payment_data.internal_order_id
 
         order_ref = db.collection("orders").document(internal_order_id)
-        order_doc = order_ref.get()
 
-        if not order_doc.exists:
+        def allocate_code(transaction, order_data):
+            stall_id = order_data.get("stall_id")
+            pickup_code = allocate_pickup_code(transaction, stall_id, internal_order_id)
+            return {
+                "pickup_code": pickup_code,
+                "pickup_token": issue_pickup_token(internal_order_id, stall_id, pickup_code),
+            }
+
+        # The Razorpay webhook may mark the order PAID concurrently; the
+        # transition is transactional, so only one of them allocates a code.
+        try:
+            previous, changes = transition_order(
+                order_ref, "PAID",
+                updates={"razorpay_payment_id": payment_data.razorpay_payment_id},
+                before_write=allocate_code
+            )
+        except OrderTransitionError as e:
+            if e.reason == "unchanged":
+                return JSONResponse(
+                    status_code=200,
+                    content={"message": "Payment already verified"}
+                )
             return JSONResponse(
                 status_code=400,
-                content={"message": "Order not found"}
+                content={"message": str(e)}
             )
 
-        current_status = order_doc.to_dict().get("status")
-
-        if current_status == "PAID":
-          return JSONResponse(
-            status_code=200,
-            content={"message": "Payment already verified"}
-          )
-
-        pickup_code = str(1000 + secrets.randbelow(9000))
-
-        order_ref.update({
-            "razorpay_payment_id": payment_data.razorpay_payment_id,
-            "status": "PAID",
-          "pickup_code": pickup_code,
-            "updated_at": firestore.SERVER_TIMESTAMP
-        })
+        pickup_index.add(previous.get("stall_id"), changes["pickup_code"], internal_order_id)
 
         return JSONResponse(
             status_code=200,
@@ -167,7 +184,6 @@ async def get_user_menu(id_token: str):
             for item_doc in menu_items_docs:
                 item = item_doc.to_dict()
                 item["item_id"] = item_doc.id
-                item = serialize_firestore_data(item)
                 item.pop("created_at", None)
                 item.pop("updated_at", None)
 
@@ -219,6 +235,8 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
     stall_doc = db.collection("colleges").document(college_id).collection("stalls").document(stall_id).get()
     stall_name = stall_doc.to_dict().get("name", "Unknown Stall")
 
+    stock_requests = []
+
     for cart_item in order_data.items:
       item_doc = menu_ref.document(cart_item.item_id).get()
 
@@ -242,6 +260,9 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
           "quantity": quantity
         })
 
+        if item_data.get("stock_tracked"):
+          stock_requests.append((item_doc.reference, cart_item.item_id, item_data, quantity))
+
       else:
         return JSONResponse(
           status_code=status.HTTP_400_BAD_REQUEST,
@@ -254,6 +275,17 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
         content={"message": "Invalid order total."}
       )
 
+    stock_reservations = []
+    for item_ref, item_id, item_data, quantity in stock_requests:
+      try:
+        stock_reservations.extend(reserve_stock(item_ref, item_id, item_data, quantity))
+      except OutOfStockError as e:
+        release_reservations(college_id, stall_id, stock_reservations)
+        return JSONResponse(
+          status_code=status.HTTP_400_BAD_REQUEST,
+          content={"message": str(e)}
+        )
+
     user_snapshot = {
       "name": user_data.get("name", "Unknown Student"),
       "roll_number": user_data.get("roll_number", "N/A"),
@@ -284,7 +316,18 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
       "updated_at": firestore.SERVER_TIMESTAMP
     }
 
-    new_order_ref.set(firestore_order_data)
+    if stock_reservations:
+      firestore_order_data["stock_reservations"] = stock_reservations
+      firestore_order_data["stock_released"] = False
+
+    try:
+      batch = db.batch()
+      batch.set(new_order_ref, firestore_order_data)
+      record_new_order(batch, internal_order_id, firestore_order_data)
+      batch.commit()
+    except Exception:
+      release_reservations(college_id, stall_id, stock_reservations)
+      raise
 
     data = {
       "amount": int(total_amount * 100),
@@ -298,7 +341,12 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
       }
     }
 
-    order = razorpay_client.order.create(data=data)
+    try:
+      order = get_razorpay_client().order.create(data=data)
+    except Exception:
+      release_order_stock(new_order_ref, "payment_order_failed")
+      transition_order(new_order_ref, "FAILED")
+      raise
 
     new_order_ref.update({"razorpay_order_id": order['id']})
 
@@ -320,7 +368,7 @@ async def create_payment_order(order_data: CreateOrderSchema, id_token: str):
       content={"message": f"Payment Error: {str(e)}"}
     )
 
-async def get_user_orders(id_token: str):
+async def get_user_orders(id_token: str, include_archive: bool = False, before: str = None):
   try:
     user_data, user_uid = await get_user_details(id_token)
     if not user_data:
@@ -329,37 +377,60 @@ async def get_user_orders(id_token: str):
         content={"message": "Invalid or expired token."}
       )
 
-    docs = (
-       db.collection("orders")
-       .where("user_id","==",user_uid)
-       .order_by("created_at",direction=firestore.Query.DESCENDING)
-       .stream()
-    )
-
-    orders = []
-    for doc in docs:
-      data = doc.to_dict()
+    try:
+      cursor = parse_archive_cursor(before)
+    except ValueError:
+      return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"message": "Invalid archive cursor."}
+      )
 
-      visible_code = data.get("pickup_code") if data.get("status") in ["PAID", "READY"] else None
+    # By default the screen is served from the user's order summary (one
+    # read). include_archive asks for the full history: every order in
+    # `orders`, then pages of archived ones; a `before` cursor asks for the
+    # next archive page only.
+    docs = []
+    if cursor is None and include_archive:
+      docs = [
+        (doc.id, doc.to_dict(), False) for doc in (
+          db.collection("orders")
+          .where("user_id","==",user_uid)
+          .order_by("created_at",direction=firestore.Query.DESCENDING)
+          .stream()
+        )
+      ]
+    elif cursor is None:
+      docs = [(order_id, entry, False) for order_id, entry in await asyncio.to_thread(recent_orders, user_uid)]
+
+    next_cursor = None
+    if include_archive or cursor is not None:
+      archived, next_cursor = await asyncio.to_thread(
+        archived_order_page, [("user_id", "==", user_uid)], before=cursor
+      )
+      docs.extend((doc.id, doc.to_dict(), True) for doc in archived)
 
-      refund_data = data.get("refund")
-      if refund_data:
-        refund_data = serialize_firestore_data(refund_data)
+    orders = []
+    for order_id, data, is_archived in docs:
+      is_active = data.get("status") in ["PAID", "READY"]
+      visible_code = data.get("pickup_code") if is_active else None
 
       orders.append({
-         "id": doc.id,
-         "items": data["items"],
-         "cafeteriaName": data.get("stall_name", "Unknown Stall"),
-         "status": normalize_order_status(data["status"]),
-         "qrCode": visible_code,
+        "id": order_id,
+        "items": data["items"],
+        "cafeteriaName": data.get("stall_name", "Unknown Stall"),
+        "status": normalize_order_status(data["status"]),
+        "qrCode": visible_code,
+        "pickupToken": data.get("pickup_token") if is_active else None,
         "total_amount": data.get("total_amount", 0),
-        "refund": refund_data,
-        "refund_policy": data.get("refund_policy")
+        "refund": data.get("refund"),
+        "refund_policy": data.get("refund_policy"),
+        "archived": is_archived
       })
-      
+
     return JSONResponse(
       status_code=status.HTTP_200_OK,
-      content=orders
+      content=orders,
+      headers={ARCHIVE_CURSOR_HEADER: next_cursor} if next_cursor else None
     )
 
   except Exception as e:
@@ -376,7 +447,9 @@ def normalize_order_status(status:str):
     "CLAIMED": "Claimed",
     "READY": "Ready",
     "COMPLETED": "Completed",
-    "CANCELLED": "Cancelled"
+    "CANCELLED": "Cancelled",
+    "EXPIRED": "Expired",
+    "FAILED": "Payment Failed"
   }.get(status, "Unknown")
 
 def calculate_refund(order: dict):
@@ -399,105 +472,96 @@ def calculate_refund(order: dict):
 
   return 0, "NO_REFUND"
 
-async def cancel_order(order_id: str, id_token: str):
-  try:
-    user_data, user_uid = await get_user_details(id_token)
-    if not user_data:
-      return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
-
-    now = datetime.now()
-
-    week_start = user_data.get("cancellation_week_start")
-    current_count = user_data.get("cancellations_this_week", 0)
-
-    if week_start:
-      if isinstance(week_start, str):
-        week_start = datetime.fromisoformat(week_start)
-    else:
-      week_start = now
-
-    if (now.replace(tzinfo=None) - week_start.replace(tzinfo=None)).days >= 7:
-      current_count = 0
-      week_start = now
-      db.collection("users").document(user_uid).update({
-        "cancellation_week_start": firestore.SERVER_TIMESTAMP,
-        "cancellations_this_week": 0
-      })
-
-    if current_count >= 20:
-      return JSONResponse(
-        status_code=status.HTTP_400_BAD_REQUEST,
-        content={"message": "Weekly cancellation limit reached."}
-      )
-
-    order_ref = db.collection("orders").document(order_id)
-    order_doc = order_ref.get()
-
-    if not order_doc.exists:
-      return JSONResponse(status_code=404, content={"message": "Order not found"})
+WEEKLY_CANCELLATION_LIMIT = 20
+
+class CancellationError(Exception):
+  def __init__(self, message: str, status_code: int = 400):
+    super().__init__(message)
+    self.status_code = status_code
+
+def _cancellation_window(user_data: dict, now: datetime):
+  """Returns (week_start, cancellations so far) for the user's current 7-day window."""
+  week_start = user_data.get("cancellation_week_start")
+  current_count = user_data.get("cancellations_this_week", 0)
+
+  if week_start:
+    if isinstance(week_start, str):
+      week_start = datetime.fromisoformat(week_start)
+  else:
+    week_start = now
+
+  if (now.replace(tzinfo=None) - week_start.replace(tzinfo=None)).days >= 7:
+    return now, 0
+  return week_start, current_count
+
+def _cancel_in_transaction(order_id: str, user_uid: str, now: datetime):
+  """
+    Checks and applies a cancellation in one transaction: the order and
+    user are read together, then the order update, the weekly counter, the
+    resale listing and any stock release are committed at once. The refund
+    is left PENDING for the caller to issue after the commit. Returns
+    (order data before cancelling, refund amount, refund type, whether a
+    refund is due, resale created, menu item refs whose stock was released).
+  """
+  order_ref = db.collection("orders").document(order_id)
+  user_ref = db.collection("users").document(user_uid)
+  transaction = db.transaction()
+
+  @transactional
+  def cancel(transaction):
+    snapshots = {snapshot.id: snapshot for snapshot in transaction.get_all([order_ref, user_ref])}
+    order_doc = snapshots.get(order_id)
+
+    if order_doc is None or not order_doc.exists:
+      raise CancellationError("Order not found", status_code=404)
 
     order_data = order_doc.to_dict()
 
     if order_data.get("user_id") != user_uid:
-      return JSONResponse(status_code=403, content={"message": "You do not own this order"})
+      raise CancellationError("You do not own this order", status_code=403)
 
     current_status = order_data.get("status")
+    try:
+      check_transition(current_status, "CANCELLED")
+    except OrderTransitionError:
+      raise CancellationError(f"Cannot cancel order with status: {current_status}")
 
-    if current_status in ["CLAIMED", "COMPLETED", "CANCELLED"]:
-      return JSONResponse(
-        status_code=400,
-        content={"message": f"Cannot cancel order with status: {current_status}"}
-      )
+    user_doc = snapshots.get(user_uid)
+    user_data = user_doc.to_dict() if user_doc is not None and user_doc.exists else {}
+    week_start, current_count = _cancellation_window(user_data, now)
+
+    if current_count >= WEEKLY_CANCELLATION_LIMIT:
+      raise CancellationError("Weekly cancellation limit reached.")
 
     total_amount = order_data.get("total_amount", 0)
     refund_amount = 0
     refund_type = "NO_REFUND"
 
     if current_status == "READY":
-        refund_amount = int(total_amount * 0.70)
-        refund_type = "PARTIAL_REFUND"
+      refund_amount = int(total_amount * 0.70)
+      refund_type = "PARTIAL_REFUND"
     elif current_status in ["PAID", "RESERVED"]:
-        refund_amount = total_amount
-        refund_type = "FULL_REFUND"
+      refund_amount = total_amount
+      refund_type = "FULL_REFUND"
 
-    payment_id = order_data.get("razorpay_payment_id")
-    existing_refund = order_data.get("refund", {})
+    existing_refund = order_data.get("refund") or {}
     refund_status = existing_refund.get("status", "NOT_APPLICABLE")
-    refund_id = existing_refund.get("razorpay_refund_id")
-
-    if refund_amount > 0 and payment_id and refund_status not in ["INITIATED", "COMPLETED"]:
-      try:
-        refund_response = razorpay_client.payment.refund(
-          payment_id,
-          {
-            "amount": int(refund_amount * 100),
-            "speed": "normal",
-            "notes": {
-              "order_id": order_id,
-              "type": refund_type,
-              "reason": "User Cancelled"
-            }
-          }
-        )
-        refund_id = refund_response.get("id")
-        refund_status = "INITIATED"
-      except Exception as e:
-        print("[Refund Error]", e)
-        refund_status = "FAILED"
+    refund_due = (
+      refund_amount > 0
+      and bool(order_data.get("razorpay_payment_id"))
+      and refund_status not in ["INITIATED", "COMPLETED"]
+    )
+    if refund_due:
+      refund_status = "PENDING"
 
     resale_created = False
-    
     if current_status == "READY":
-      college_id = order_data.get("college_id")
-      stall_id = order_data.get("stall_id")
-
       discounted_price = int(total_amount * 0.70)
-
-      resale_item = {
+      transaction.create(db.collection("resale_items").document(), {
         "original_order_id": order_id,
         "original_user_id": user_uid,
-        "college_id": college_id,
-        "stall_id": stall_id,
+        "college_id": order_data.get("college_id"),
+        "stall_id": order_data.get("stall_id"),
         "stall_name": order_data.get("stall_name"),
         "items": order_data.get("items", []),
         "original_price": total_amount,
@@ -505,17 +569,19 @@ async def cancel_order(order_id: str, id_token: str):
         "max_price": discounted_price,
         "status": "AVAILABLE",
         "created_at": firestore.SERVER_TIMESTAMP
-      }
-
-      db.collection("resale_items").add(resale_item)
+      })
       resale_created = True
 
-    batch = db.batch()
+    # Units from a READY order were already cooked and go to the resale feed.
+    released_item_refs = []
+    stock_updates = {}
+    if current_status in ["PENDING", "PAID"] and not order_data.get("stock_released"):
+      released_item_refs = queue_stock_release(transaction, order_data)
+      if released_item_refs:
+        stock_updates = {"stock_released": True, "stock_release_reason": "cancelled"}
 
-    retained_amount = total_amount - refund_amount
-
-    batch.update(order_ref, {
-      "status": "CANCELLED",
+    apply_transition(transaction, order_ref, order_data, "CANCELLED", {
+      **stock_updates,
       "cancelled_at": firestore.SERVER_TIMESTAMP,
       "cancellation_reason": "User requested",
       "refund": {
@@ -523,29 +589,98 @@ async def cancel_order(order_id: str, id_token: str):
         "amount": refund_amount,
         "type": refund_type,
         "status": refund_status,
-        "razorpay_refund_id": refund_id
+        "razorpay_refund_id": existing_refund.get("razorpay_refund_id")
       },
       "staff_payout": {
-        "amount": retained_amount,
-        "status": "PENDING" 
-      },
-      "updated_at": firestore.SERVER_TIMESTAMP
+        "amount": total_amount - refund_amount,
+        "status": "PENDING"
+      }
     })
 
-    user_ref = db.collection("users").document(user_uid)
-    batch.update(user_ref, {
+    transaction.set(user_ref, {
       "cancellations_this_week": current_count + 1,
       "cancellation_week_start": week_start
-    })
+    }, merge=True)
 
-    batch.commit()
+    return order_data, refund_amount, refund_type, refund_due, resale_created, released_item_refs
+
+  return cancel(transaction)
+
+def issue_refund(order_id: str, payment_id: str, refund_amount: int, refund_type: str, reason: str = "User Cancelled"):
+  """
+    Asks Razorpay for the refund of an order whose refund.status is PENDING
+    and records the outcome; returns the refund id.
+  """
+  order_ref = db.collection("orders").document(order_id)
+  try:
+    refund_response = get_razorpay_client().payment.refund(
+      payment_id,
+      {
+        "amount": int(refund_amount * 100),
+        "speed": "normal",
+        "notes": {
+          "order_id": order_id,
+          "type": refund_type,
+          "reason": reason
+        }
+      }
+    )
+  except Exception as e:
+    print("[Refund Error]", e)
+    try:
+      transition_refund(order_ref, "FAILED", {"failure_reason": str(e)})
+    except Exception as record_error:
+      # Left PENDING; sweeps.retry_pending_refunds asks Razorpay again.
+      print(f"[Refund Error] Could not record failure for order {order_id}: {record_error}")
+    return None
+
+  refund_id = refund_response.get("id")
+  try:
+    transition_refund(order_ref, "INITIATED", {"razorpay_refund_id": refund_id})
+  except OrderTransitionError as e:
+    # The refund.processed webhook got there first.
+    print(f"ℹ️ Refund {refund_id} for order {order_id}: {e}")
+  except Exception as e:
+    # Left PENDING; the sweep finds this refund on the payment and records it.
+    print(f"[Refund Error] Could not record refund {refund_id} for order {order_id}: {e}")
+  return refund_id
+
+def find_refund(order_id: str, payment_id: str):
+  """The Razorpay refund already issued for this order on `payment_id`, or None."""
+  refunds = get_razorpay_client().payment.fetch_multiple_refund(payment_id)
+  return next(
+    (refund for refund in refunds.get("items", []) if (refund.get("notes") or {}).get("order_id") == order_id),
+    None
+  )
+
+async def cancel_order(order_id: str, id_token: str):
+  try:
+    user_data, user_uid = await get_user_details(id_token)
+    if not user_data:
+      return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Unauthorized"})
+
+    try:
+      order_data, refund_amount, refund_type, refund_due, resale_created, released_item_refs = await asyncio.to_thread(
+        _cancel_in_transaction, order_id, user_uid, datetime.now()
+      )
+    except CancellationError as e:
+      return JSONResponse(status_code=e.status_code, content={"message": str(e)})
+
+    # External calls stay outside the transaction, which may be retried.
+    refund_id = (order_data.get("refund") or {}).get("razorpay_refund_id")
+    if refund_due:
+      refund_id = await asyncio.to_thread(
+        issue_refund, order_id, order_data.get("razorpay_payment_id"), refund_amount, refund_type
+      )
+
+    await asyncio.to_thread(restore_availability, released_item_refs)
 
     msg = "Order cancelled."
     if resale_created:
       msg += " Item added to discounted feed."
 
     return JSONResponse(status_code=200, content={
-        "message": msg, 
+        "message": msg,
         "resale_created": resale_created,
         "refund_id": refund_id,
         "refund_amount": refund_amount
@@ -553,6 +688,7 @@ async def cancel_order(order_id: str, id_token: str):
 
   except Exception as e:
     return JSONResponse(status_code=500, content={"message": str(e)})
+
 async def buy_resale_item(resale_id: str, id_token: str):
   try:
     user_data, user_uid = await get_user_details(id_token)
@@ -566,7 +702,7 @@ async def buy_resale_item(resale_id: str, id_token: str):
 
     transaction = db.transaction()
 
-    @firestore.transactional
+    @transactional
     def reserve_item_transaction(transaction, resale_ref):
       snapshot = resale_ref.get(transaction=transaction)
 
@@ -638,11 +774,14 @@ async def buy_resale_item(resale_id: str, id_token: str):
         }
       }
 
-      razorpay_order = razorpay_client.order.create(data=payment_payload)
+      razorpay_order = get_razorpay_client().order.create(data=payment_payload)
 
       firestore_order_data["razorpay_order_id"] = razorpay_order['id']
 
-      new_order_ref.set(firestore_order_data)
+      batch = db.batch()
+      batch.set(new_order_ref, firestore_order_data)
+      record_new_order(batch, internal_order_id, firestore_order_data)
+      batch.commit()
 
       return JSONResponse(
         status_code=200,
@@ -690,7 +829,6 @@ async def get_discounted_feed(id_token: str):
           continue
 
       data["resale_id"] = doc.id
-      data = serialize_firestore_data(data)
       feed_items.append(data)
 
     return JSONResponse(status_code=200, content=feed_items)
@@ -0,0 +1,134 @@
+# app/warmup.py
+
+import os
+import time
+import asyncio
+from .firebase_init import db, firebase_credentials
+from .storage.firestore import FirestoreStorage
+from .user import get_razorpay_client
+from .lazy import lazy_import
+
+auth = lazy_import("firebase_admin.auth")
+token_gen = lazy_import("firebase_admin._token_gen")
+
+# Everything below is otherwise set up by the first request that needs it:
+# the Firestore gRPC channel, the Firebase public certs used to verify ID
+# tokens and the Razorpay HTTPS connection. The lifespan warms them in
+# parallel and GET /v1/ready reports ready once that is done.
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "15"))
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+# Read (never written) to open the Firestore channel; a missing doc is fine.
+WARMUP_DOCUMENT = "_warmup/ping"
+
+class SkipWarmup(Exception):
+  """Raised by a warm-up step that has nothing to do in this environment."""
+
+def _warm_firestore():
+  if not isinstance(db, FirestoreStorage):
+    raise SkipWarmup("storage backend is not firestore")
+  db.document(WARMUP_DOCUMENT).get()
+
+def _warm_firebase_certs():
+  if not firebase_credentials:
+    raise SkipWarmup("FIREBASE_SERVICE_ACCOUNT not set")
+  # The token verifier's cache-control session keeps the certs until they
+  # expire, so verify_id_token() on the first request skips the fetch.
+  token_verifier = auth._get_client(None)._token_verifier
+  token_verifier.request(token_gen.ID_TOKEN_CERT_URI, method="GET")
+
+def _warm_razorpay():
+  if not os.environ.get("RAZORPAY_KEY_ID"):
+    raise SkipWarmup("RAZORPAY_KEY_ID not set")
+
+  client = get_razorpay_client()
+  session = getattr(client, "session", None)
+  if session is None:
+    raise SkipWarmup("client has no HTTP session")
+  # Any response leaves a pooled TLS connection behind for the first order.
+  session.head(client.base_url, timeout=WARMUP_TIMEOUT_SECONDS)
+
+WARMUP_STEPS = {
+  "firestore": _warm_firestore,
+  "firebase_certs": _warm_firebase_certs,
+  "razorpay": _warm_razorpay,
+}
+
+# {dependency: {"status": pending|ok|skipped|error, "duration_ms", "error"}}
+_results = {}
+_warmup_task = None
+_finished = False
+
+def _reset():
+  global _finished
+  _finished = False
+  _results.clear()
+  for name in WARMUP_STEPS:
+    _results[name] = {"status": "pending", "duration_ms": None, "error": None}
+
+async def _run_step(name: str, step):
+  start = time.perf_counter()
+  try:
+    await asyncio.to_thread(step)
+    _results[name].update(status="ok")
+  except SkipWarmup as e:
+    _results[name].update(status="skipped", error=str(e))
+  except Exception as e:
+    print(f"Warm-up of {name} failed: {e}")
+    _results[name].update(status="error", error=str(e))
+  finally:
+    _results[name]["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+async def _run_warmup():
+  global _finished
+  try:
+    await asyncio.wait_for(
+      asyncio.gather(*(_run_step(name, step) for name, step in WARMUP_STEPS.items())),
+      timeout=WARMUP_TIMEOUT_SECONDS
+    )
+  except asyncio.TimeoutError:
+    for result in _results.values():
+      if result["status"] == "pending":
+        result.update(status="error", error=f"timed out after {WARMUP_TIMEOUT_SECONDS}s")
+  finally:
+    _finished = True
+
+def start_warmup():
+  global _warmup_task, _finished
+  if _warmup_task is not None:
+    return
+
+  _reset()
+  if not WARMUP_ENABLED:
+    for result in _results.values():
+      result.update(status="skipped", error="WARMUP_ENABLED is false")
+    _finished = True
+    return
+
+  _warmup_task = asyncio.create_task(_run_warmup())
+
+async def stop_warmup():
+  global _warmup_task
+  if _warmup_task is None:
+    return
+
+  _warmup_task.cancel()
+  try:
+    await _warmup_task
+  except asyncio.CancelledError:
+    pass
+
+  _warmup_task = None
+
+def readiness() -> tuple:
+  """
+    Returns (ready, body) for GET /v1/ready. Not ready until every warm-up step
+    has finished; "degraded" means a step failed or timed out, in which case
+    that dependency is set up lazily by the first request as before.
+  """
+  dependencies = {name: dict(result) for name, result in _results.items()}
+  if not _finished:
+    return False, {"status": "warming_up", "dependencies": dependencies}
+
+  failed = any(result["status"] == "error" for result in dependencies.values())
+  return True, {"status": "degraded" if failed else "ready", "dependencies": dependencies}
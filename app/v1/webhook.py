@@ -3,13 +3,74 @@
 import os
 import hmac
 import hashlib
-import secrets
 from fastapi import APIRouter, Request, HTTPException
-from firebase_admin import firestore
 from .firebase_init import db
+from .pickup import allocate_pickup_code, issue_pickup_token, index as pickup_index
+from .storage import transactional
+from .orders import OrderTransitionError, transition_order, transition_refund
+from .order_summary import record_order, with_changes
+from .user import issue_refund
+from .lazy import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
 
 router = APIRouter()
 
+# Orders that closed without a payment. A capture arriving after that is
+# refunded in full; any other capture the order did not take (e.g. a second
+# payment for an order already PAID) is kept in payment_reconciliation.
+UNPAID_CLOSED_STATUSES = ("CANCELLED", "EXPIRED", "FAILED")
+RECONCILIATION_COLLECTION = "payment_reconciliation"
+
+def _record_untaken_payment(order_ref, payment: dict):
+  """
+    Records a captured payment the order could not take, in one transaction.
+    Returns the amount to refund when it was recorded on the order with a
+    PENDING refund, else None (already recorded, or sent to reconciliation).
+  """
+  payment_id = payment.get("id")
+  transaction = db.transaction()
+
+  @transactional
+  def record_in_transaction(transaction):
+    snapshot = order_ref.get(transaction=transaction)
+    data = snapshot.to_dict() if snapshot.exists else {}
+
+    if data.get("razorpay_payment_id") == payment_id:
+      return None
+
+    if data.get("status") in UNPAID_CLOSED_STATUSES and not data.get("razorpay_payment_id"):
+      amount = payment.get("amount", 0) / 100
+      changes = {
+        "razorpay_payment_id": payment_id,
+        "razorpay_payment_data": payment,
+        "late_payment": True,
+        "refund": {
+          "eligible": True,
+          "amount": amount,
+          "type": "FULL_REFUND",
+          "status": "PENDING",
+          "reason": f"Payment captured after the order was {data.get('status')}"
+        },
+        "updated_at": firestore.SERVER_TIMESTAMP
+      }
+      transaction.update(order_ref, changes)
+      record_order(transaction, order_ref.id, with_changes(data, changes))
+      return amount
+
+    transaction.set(db.collection(RECONCILIATION_COLLECTION).document(payment_id), {
+      "payment_id": payment_id,
+      "order_id": order_ref.id,
+      "order_status": data.get("status"),
+      "order_payment_id": data.get("razorpay_payment_id"),
+      "payment": payment,
+      "resolved": False,
+      "created_at": firestore.SERVER_TIMESTAMP
+    })
+    return None
+
+  return record_in_transaction(transaction)
+
 @router.post("/webhook/razorpay", tags=["webhook"])
 async def razorpay_webhook(request: Request):
   signature = request.headers.get('X-Razorpay-Signature')
@@ -48,31 +109,9 @@ async def razorpay_webhook(request: Request):
     if internal_order_id:
       order_ref = db.collection('orders').document(internal_order_id)
 
-      transaction = db.transaction()
-
-      @firestore.transactional
-      def update_in_transaction(transaction, order_ref):
-        snapshot = order_ref.get(transaction=transaction)
-        if not snapshot.exists:
-          print(f"❌ Order {internal_order_id} not found!")
-          return
-
-        current_data = snapshot.to_dict()
-
-        if current_data.get("status") == "PAID":
-          print(f"ℹ️ Order {internal_order_id} was already PAID. Skipping update.")
-          return
-
-        pickup_code = str(1000 + secrets.randbelow(9000))
-
-        transaction.update(order_ref, {
-          "status": "PAID",
-          "razorpay_payment_id": payment_id,
-          "razorpay_payment_data": payment,
-          "pickup_code": pickup_code,
-          "updated_at": firestore.SERVER_TIMESTAMP
-        })
-        print(f"✅ SUCCESS: Generated Pickup Code {pickup_code} for Order {internal_order_id}")
+      def mark_paid(transaction, current_data):
+        stall_id = current_data.get("stall_id")
+        pickup_code = allocate_pickup_code(transaction, stall_id, internal_order_id)
 
         if is_resale and resale_item_id:
           resale_ref = db.collection("resale_items").document(resale_item_id)
@@ -81,10 +120,31 @@ async def razorpay_webhook(request: Request):
             "sold_to_order_id": internal_order_id,
             "sold_at": firestore.SERVER_TIMESTAMP
           })
-          print(f"✅ SUCCESS: Marked Resale Item {resale_item_id} as SOLD")
+
+        return {
+          "pickup_code": pickup_code,
+          "pickup_token": issue_pickup_token(internal_order_id, stall_id, pickup_code),
+        }
 
       try:
-        update_in_transaction(transaction, order_ref)
+        previous, changes = transition_order(
+          order_ref, "PAID",
+          updates={"razorpay_payment_id": payment_id, "razorpay_payment_data": payment},
+          before_write=mark_paid
+        )
+        pickup_index.add(previous.get("stall_id"), changes["pickup_code"], internal_order_id)
+        print(f"✅ SUCCESS: Generated Pickup Code {changes['pickup_code']} for Order {internal_order_id}")
+        if is_resale and resale_item_id:
+          print(f"✅ SUCCESS: Marked Resale Item {resale_item_id} as SOLD")
+      except OrderTransitionError as e:
+        print(f"ℹ️ Order {internal_order_id} not marked PAID: {e}")
+        try:
+          refund_amount = _record_untaken_payment(order_ref, payment)
+          if refund_amount:
+            issue_refund(internal_order_id, payment_id, refund_amount, "FULL_REFUND", reason="Order closed before payment")
+            print(f"↩️ Refunding payment {payment_id} captured after order {internal_order_id} closed")
+        except Exception as record_error:
+          print(f"❌ Could not record payment {payment_id} for order {internal_order_id}: {record_error}")
       except Exception as e:
         print(f"❌ Transaction failed: {e}")
 
@@ -102,20 +162,16 @@ async def razorpay_webhook(request: Request):
       if order_id:
         order_ref = db.collection('orders').document(order_id)
 
-        snapshot = order_ref.get()
-        if snapshot.exists:
-          if snapshot.to_dict().get("refund", {}).get("status") == "COMPLETED":
-            print("ℹ️ Refund already completed, skipping")
-            return
-
-        order_ref.update({
-          "refund.status": "COMPLETED",
-          "refund.processed_at": firestore.SERVER_TIMESTAMP,
-          "refund.razorpay_refund_id": refund_entity.get('id'),
-          "refund.bank_ref": refund_entity.get('acquirer_data', {}).get('rrn'),
-          "updated_at": firestore.SERVER_TIMESTAMP
-        })
-        print(f"✅ REFUND COMPLETE: Order {order_id} refunded successfully.")
+        try:
+          transition_refund(order_ref, "COMPLETED", {
+            "processed_at": firestore.SERVER_TIMESTAMP,
+            "razorpay_refund_id": refund_entity.get('id'),
+            "bank_ref": refund_entity.get('acquirer_data', {}).get('rrn'),
+          })
+        except OrderTransitionError as e:
+          print(f"ℹ️ Refund for order {order_id} not recorded: {e}")
+        else:
+          print(f"✅ REFUND COMPLETE: Order {order_id} refunded successfully.")
       else:
         print(f"⚠️ Refund processed but no order_id found in notes. Payment ID: {payment_id}")
 
@@ -129,12 +185,14 @@ async def razorpay_webhook(request: Request):
       order_id = notes.get('order_id')
 
       if order_id:
-        db.collection('orders').document(order_id).update({
-          "refund.status": "FAILED",
-          "refund.failure_reason": refund_entity.get('status_details', {}).get('description', 'Unknown Error'),
-          "updated_at": firestore.SERVER_TIMESTAMP
-        })
-        print(f"❌ REFUND FAILED: Order {order_id}")
+        try:
+          transition_refund(db.collection('orders').document(order_id), "FAILED", {
+            "failure_reason": refund_entity.get('status_details', {}).get('description', 'Unknown Error'),
+          })
+        except OrderTransitionError as e:
+          print(f"ℹ️ Refund failure for order {order_id} not recorded: {e}")
+        else:
+          print(f"❌ REFUND FAILED: Order {order_id}")
     except Exception as e:
       print(f"❌ Error handling refund failure: {e}")
 
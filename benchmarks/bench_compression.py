@@ -0,0 +1,85 @@
+#benchmarks/bench_compression.py
+#
+# Bytes saved and CPU cost of CompressionMiddleware per route payload, for
+# gzip/brotli settings and for repeat responses served from the body cache.
+#
+#   python -m benchmarks.bench_compression [--repeat 50] [--json]
+
+import argparse
+import json
+import time
+from app.v1.compression import CompressionMiddleware, brotli
+from app.v1.responses import JSONResponse
+from app.v1.serializers import serialize_firestore_data
+from benchmarks.payloads import make_college_menu, make_order_queue, make_order
+
+ROUTES = {
+  "GET /v1/user/menu": lambda: make_college_menu(),
+  "GET /v1/staff/orders": lambda: serialize_firestore_data(make_order_queue()),
+  "GET /v1/user/orders": lambda: [serialize_firestore_data(make_order(i)) for i in range(50)],
+}
+
+def _settings():
+  settings = [("gzip", {"gzip_level": 1}), ("gzip", {"gzip_level": 6}), ("gzip", {"gzip_level": 9})]
+  if brotli:
+    settings += [("br", {"brotli_quality": 1}), ("br", {"brotli_quality": 4}), ("br", {"brotli_quality": 9})]
+  return settings
+
+def _timed(fn, repeat: int) -> float:
+  best = float("inf")
+  for _ in range(5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+      fn()
+    best = min(best, (time.perf_counter() - start) / repeat)
+  return best
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=50)
+  parser.add_argument("--json", action="store_true", help="print machine-readable results")
+  args = parser.parse_args()
+
+  results = []
+  for route, build in ROUTES.items():
+    body = JSONResponse(build()).body
+
+    for encoding, options in _settings():
+      middleware = CompressionMiddleware(None, **options)
+      compressed = middleware.compress(encoding, body)
+      cold = _timed(lambda: middleware.compress(encoding, body), args.repeat)
+
+      # Every response renders a fresh bytes object, so hash it from scratch each time.
+      middleware.cache.get_or_compress(encoding, body, lambda raw: middleware.compress(encoding, raw))
+      fresh_bodies = iter([bytes(bytearray(body)) for _ in range(args.repeat * 5)])
+      warm = _timed(
+        lambda: middleware.cache.get_or_compress(
+          encoding, next(fresh_bodies), lambda raw: middleware.compress(encoding, raw)
+        ),
+        args.repeat
+      )
+
+      level = options.get("gzip_level", options.get("brotli_quality"))
+      results.append({
+        "route": route,
+        "encoding": f"{encoding}-{level}",
+        "raw_bytes": len(body),
+        "compressed_bytes": len(compressed),
+        "saved_percent": round(100 * (1 - len(compressed) / len(body)), 1),
+        "compress_us": round(cold * 1e6, 1),
+        "cached_us": round(warm * 1e6, 1),
+      })
+
+  if args.json:
+    print(json.dumps(results, indent=2))
+    return
+
+  print(f"{'route':<22} {'encoding':<8} {'raw':>8} {'comp':>8} {'saved':>7} {'cpu us':>9} {'cached us':>10}")
+  for r in results:
+    print(
+      f"{r['route']:<22} {r['encoding']:<8} {r['raw_bytes']:>8} {r['compressed_bytes']:>8} "
+      f"{r['saved_percent']:>6}% {r['compress_us']:>9} {r['cached_us']:>10}"
+    )
+
+if __name__ == "__main__":
+  main()
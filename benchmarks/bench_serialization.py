@@ -0,0 +1,89 @@
+#benchmarks/bench_serialization.py
+#
+# Compares the old per-module serializer + stdlib JSONResponse with the shared
+# recursive serializer + orjson JSONResponse on order and menu payloads.
+#
+#   python -m benchmarks.bench_serialization [--orders 50] [--items 40] [--repeat 200]
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+from starlette.responses import JSONResponse as StdlibJSONResponse
+from app.v1.serializers import serialize_firestore_data
+from app.v1.responses import JSONResponse
+from benchmarks.payloads import make_order, make_menu_item
+
+def legacy_serialize(data: dict):
+  for key, value in data.items():
+    if isinstance(value, datetime):
+      data[key] = value.isoformat()
+  return data
+
+def legacy_order(order: dict) -> dict:
+  order = legacy_serialize(dict(order))
+  order["refund"] = legacy_serialize(dict(order["refund"]))
+  # razorpay_payment_data has no timestamps in this fixture, so it passes through.
+  return order
+
+def bench(label: str, fn, repeat: int, baseline=None):
+  seconds = min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat
+  line = f"{label:<48} {seconds * 1e6:10.1f} us/response"
+  if baseline:
+    line += f"   {baseline / seconds:5.2f}x"
+  print(line)
+  return seconds
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--orders", type=int, default=50)
+  parser.add_argument("--items", type=int, default=40)
+  parser.add_argument("--repeat", type=int, default=200)
+  args = parser.parse_args()
+
+  orders = [make_order(i) for i in range(args.orders)]
+  menu = [make_menu_item(i) for i in range(args.items)]
+
+  print(f"order history: {args.orders} orders, "
+        f"{len(JSONResponse([serialize_firestore_data(o) for o in orders]).body)} bytes")
+  base = bench(
+    "legacy serializer + stdlib json",
+    lambda: StdlibJSONResponse([legacy_order(o) for o in orders]).body,
+    args.repeat
+  )
+  bench(
+    "serialize_firestore_data + orjson",
+    lambda: JSONResponse([serialize_firestore_data(o) for o in orders]).body,
+    args.repeat, base
+  )
+  bench(
+    "orjson with serializer as default hook",
+    lambda: JSONResponse(orders).body,
+    args.repeat, base
+  )
+
+  print(f"\nstall menu: {args.items} items, "
+        f"{len(JSONResponse([serialize_firestore_data(i) for i in menu]).body)} bytes")
+  base = bench(
+    "legacy serializer + stdlib json",
+    lambda: StdlibJSONResponse([legacy_serialize(dict(i)) for i in menu]).body,
+    args.repeat
+  )
+  bench(
+    "serialize_firestore_data + orjson",
+    lambda: JSONResponse([serialize_firestore_data(i) for i in menu]).body,
+    args.repeat, base
+  )
+  bench(
+    "orjson with serializer as default hook",
+    lambda: JSONResponse(menu).body,
+    args.repeat, base
+  )
+
+  # Same output either way, modulo key order and float formatting.
+  assert json.loads(JSONResponse(orders).body) == json.loads(
+    JSONResponse([serialize_firestore_data(o) for o in orders]).body
+  )
+
+if __name__ == "__main__":
+  main()
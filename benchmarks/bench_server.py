@@ -0,0 +1,144 @@
+#benchmarks/bench_server.py
+#
+# HTTP throughput and latency of the server process itself: the previous
+# Docker command (`uvicorn app.v1.app:app --workers 2`, default loop/parser)
+# against the production profile in main.py (uvloop/httptools when installed,
+# CPU-quota workers, keep-alive/backlog tuning). Both serve the app on the
+# in-memory storage backend with warm-up disabled, and concurrent keep-alive
+# clients hit the cheap routes so the server, not the backends, is measured.
+#
+#   python -m benchmarks.bench_server [--clients 64] [--duration 10] [--json]
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from benchmarks.loadtest import _percentile
+
+ROUTES = ("/v1/health", "/v1/ready")
+
+def _free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+def _env(port: int) -> dict:
+  env = dict(os.environ)
+  env.update({
+    "PYTHONWARNINGS": "ignore",
+    "STORAGE_BACKEND": "memory",
+    "WARMUP_ENABLED": "false",
+    "HOST": "127.0.0.1",
+    "PORT": str(port),
+  })
+  return env
+
+def _command(profile: str, port: int) -> list:
+  if profile == "baseline":
+    return [
+      sys.executable, "-m", "uvicorn", "app.v1.app:app",
+      "--host", "127.0.0.1", "--port", str(port), "--workers", "2", "--log-level", "warning",
+    ]
+  return [sys.executable, "main.py"]
+
+def _wait_ready(port: int, timeout: float = 30.0):
+  deadline = time.perf_counter() + timeout
+  while time.perf_counter() < deadline:
+    try:
+      with urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/ready", timeout=1) as response:
+        if response.status == 200:
+          return
+    except OSError:
+      time.sleep(0.05)
+  raise TimeoutError("server did not become ready in time")
+
+async def _drive(port: int, clients: int, duration: float) -> dict:
+  import httpx
+
+  samples = {route: [] for route in ROUTES}
+  errors = 0
+  limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+  async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def worker(index: int):
+      nonlocal errors
+      count = index
+      while time.perf_counter() < deadline:
+        route = ROUTES[count % len(ROUTES)]
+        count += 1
+        sent = time.perf_counter()
+        response = await client.get(route)
+        samples[route].append(time.perf_counter() - sent)
+        if response.status_code != 200:
+          errors += 1
+
+    await asyncio.gather(*(worker(index) for index in range(clients)))
+    elapsed = time.perf_counter() - start
+
+  total = sum(len(values) for values in samples.values())
+  routes = {}
+  for route, values in samples.items():
+    values.sort()
+    routes[route] = {
+      "requests": len(values),
+      "p50_ms": round(_percentile(values, 50) * 1000, 3),
+      "p99_ms": round(_percentile(values, 99) * 1000, 3),
+    }
+  return {"throughput_rps": round(total / elapsed, 1), "errors": errors, "routes": routes}
+
+def measure(profile: str, clients: int, duration: float) -> dict:
+  port = _free_port()
+  process = subprocess.Popen(
+    _command(profile, port), env=_env(port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+  )
+  try:
+    _wait_ready(port)
+    # Short warm-up so every worker has imported the app and served a request.
+    asyncio.run(_drive(port, clients, min(1.0, duration)))
+    return asyncio.run(_drive(port, clients, duration))
+  finally:
+    process.terminate()
+    process.wait()
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--clients", type=int, default=64, help="concurrent keep-alive clients")
+  parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+  parser.add_argument("--json", action="store_true", help="print machine-readable results")
+  args = parser.parse_args()
+
+  from main import server_options
+
+  options = server_options()
+  results = {
+    "production_profile": {key: options[key] for key in ("workers", "loop", "http", "timeout_keep_alive", "backlog")},
+    "baseline": measure("baseline", args.clients, args.duration),
+    "production": measure("production", args.clients, args.duration),
+  }
+
+  if args.json:
+    print(json.dumps(results, indent=2))
+    return
+
+  print(f"production profile: {results['production_profile']}")
+  print(f"{'profile':<12}{'rps':>10}{'errors':>8}" + "".join(f"{route + ' p50/p99 ms':>34}" for route in ROUTES))
+  for profile in ("baseline", "production"):
+    result = results[profile]
+    print(
+      f"{profile:<12}{result['throughput_rps']:>10}{result['errors']:>8}"
+      + "".join(
+        f"{str(result['routes'][route]['p50_ms']) + ' / ' + str(result['routes'][route]['p99_ms']):>34}"
+        for route in ROUTES
+      )
+    )
+
+if __name__ == "__main__":
+  main()
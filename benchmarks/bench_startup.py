@@ -0,0 +1,143 @@
+#benchmarks/bench_startup.py
+#
+# Cold-start cost of the API: import time of app.v1.app and time from process
+# start to the first served request (GET /v1/health under uvicorn). Runs with
+# the SDKs loaded lazily, as deployed, and with them imported up front for
+# comparison. --profile lists the slowest imports from `python -X importtime`.
+#
+#   python -m benchmarks.bench_startup [--runs 5] [--json] [--profile]
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+HEAVY_MODULES = (
+  "google.generativeai",
+  "firebase_admin.auth",
+  "firebase_admin.firestore",
+  "razorpay",
+  "sendgrid",
+)
+
+def _preload(eager: bool) -> str:
+  return "".join(f"import {name}; " for name in HEAVY_MODULES) if eager else ""
+
+def _free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+def _env() -> dict:
+  env = dict(os.environ)
+  env["PYTHONWARNINGS"] = "ignore"
+  return env
+
+def measure_import(eager: bool) -> float:
+  code = (
+    "import time; start = time.perf_counter(); "
+    f"{_preload(eager)}import app.v1.app; "
+    "print(time.perf_counter() - start)"
+  )
+  output = subprocess.run(
+    [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=_env()
+  ).stdout
+  return float(output.strip().splitlines()[-1])
+
+def measure_first_request(eager: bool, timeout: float = 30.0) -> float:
+  port = _free_port()
+  code = (
+    f"{_preload(eager)}import uvicorn; "
+    f"uvicorn.run('app.v1.app:app', host='127.0.0.1', port={port}, log_level='warning')"
+  )
+  url = f"http://127.0.0.1:{port}/v1/health"
+
+  start = time.perf_counter()
+  process = subprocess.Popen(
+    [sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=_env()
+  )
+  try:
+    while time.perf_counter() - start < timeout:
+      try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+          if response.status == 200:
+            return time.perf_counter() - start
+      except OSError:
+        time.sleep(0.005)
+    raise TimeoutError("server did not answer /v1/health in time")
+  finally:
+    process.terminate()
+    process.wait()
+
+def import_profile(limit: int = 20) -> list:
+  """Slowest imports (cumulative) up to three levels deep under app.v1.app."""
+  stderr = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", "import app.v1.app"],
+    capture_output=True, text=True, env=_env()
+  ).stderr
+
+  entries = []
+  for line in stderr.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line:
+      continue
+    self_us, cumulative_us, name = line[len("import time:"):].split("|")
+    depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+    if depth <= 3:
+      entries.append({
+        "module": name.strip(),
+        "depth": depth,
+        "self_ms": round(int(self_us) / 1000, 1),
+        "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+      })
+
+  entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+  return entries[:limit]
+
+def _summary(samples: list) -> dict:
+  return {
+    "median_ms": round(statistics.median(samples) * 1000, 1),
+    "min_ms": round(min(samples) * 1000, 1),
+    "max_ms": round(max(samples) * 1000, 1),
+  }
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--json", action="store_true", help="print machine-readable results")
+  parser.add_argument("--profile", action="store_true", help="include the slowest imports")
+  args = parser.parse_args()
+
+  results = {}
+  for mode, eager in (("lazy", False), ("eager", True)):
+    results[mode] = {
+      "import_app": _summary([measure_import(eager) for _ in range(args.runs)]),
+      "process_start_to_first_request": _summary([measure_first_request(eager) for _ in range(args.runs)]),
+    }
+
+  if args.profile:
+    results["import_profile"] = import_profile()
+
+  if args.json:
+    print(json.dumps(results, indent=2))
+    return
+
+  print(f"{'mode':<8}{'import app (ms)':>18}{'first request (ms)':>22}")
+  for mode in ("lazy", "eager"):
+    print(
+      f"{mode:<8}"
+      f"{results[mode]['import_app']['median_ms']:>18}"
+      f"{results[mode]['process_start_to_first_request']['median_ms']:>22}"
+    )
+
+  if args.profile:
+    print("\nslowest imports (cumulative ms):")
+    for entry in results["import_profile"]:
+      print(f"  {entry['cumulative_ms']:>8}  {'  ' * entry['depth']}{entry['module']}")
+
+if __name__ == "__main__":
+  main()
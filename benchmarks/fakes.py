@@ -0,0 +1,95 @@
+#benchmarks/fakes.py
+#
+# Stand-ins for Firebase Auth, Razorpay and Gemini so the real app can be
+# driven end to end without network access; storage uses the in-memory
+# backend (STORAGE_BACKEND=memory). install() must run before app.v1.app is
+# imported.
+
+import os
+import uuid
+import types
+
+class FakeAuth:
+  """verify_id_token() for tokens minted with issue_token()."""
+
+  def __init__(self):
+    self._tokens = {}
+
+  def issue_token(self, uid: str, email: str = None) -> str:
+    token = f"token-{uid}"
+    self._tokens[token] = {"uid": uid, "email": email or f"{uid}@example.edu"}
+    return token
+
+  def verify_id_token(self, id_token: str, *args, **kwargs):
+    decoded = self._tokens.get(id_token)
+    if decoded is None:
+      raise ValueError("Invalid token")
+    return dict(decoded)
+
+class _FakeRazorpayOrders:
+  def create(self, data: dict):
+    return {
+      "id": f"order_{uuid.uuid4().hex[:14]}",
+      "amount": data["amount"],
+      "currency": data.get("currency", "INR"),
+      "receipt": data.get("receipt"),
+      "notes": data.get("notes", {}),
+      "status": "created",
+    }
+
+class _FakeRazorpayPayments:
+  def __init__(self):
+    self.refunds = {}
+
+  def refund(self, payment_id: str, data: dict):
+    refund = {"id": f"rfnd_{uuid.uuid4().hex[:14]}", "payment_id": payment_id, **data}
+    self.refunds.setdefault(payment_id, []).append(refund)
+    return refund
+
+  def fetch_multiple_refund(self, payment_id: str, data: dict = None):
+    items = self.refunds.get(payment_id, [])
+    return {"entity": "collection", "count": len(items), "items": items}
+
+class _FakeRazorpayUtility:
+  def verify_payment_signature(self, params: dict):
+    return True
+
+class FakeRazorpayClient:
+  def __init__(self):
+    self.order = _FakeRazorpayOrders()
+    self.payment = _FakeRazorpayPayments()
+    self.utility = _FakeRazorpayUtility()
+
+class FakeGenerativeModel:
+  RESPONSE = '[{"name": "Masala Dosa", "price": 60}, {"name": "Filter Coffee", "price": 20}]'
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def generate_content(self, contents, stream: bool = False):
+    response = types.SimpleNamespace(text=self.RESPONSE)
+    return iter([response]) if stream else response
+
+def install():
+  """
+    Switches the app to the in-memory storage backend and replaces its
+    external clients with fakes. Returns (db, auth). Must run before
+    app.v1.app is imported; the Razorpay client is swapped on the imported
+    modules by patch_app().
+  """
+  os.environ["STORAGE_BACKEND"] = "memory"
+
+  from firebase_admin import auth
+  import google.generativeai as genai
+  from app.v1.firebase_init import db
+
+  fake_auth = FakeAuth()
+  auth.verify_id_token = fake_auth.verify_id_token
+  genai.GenerativeModel = FakeGenerativeModel
+
+  return db, fake_auth
+
+def patch_app():
+  """Points the imported app modules at the fake Razorpay client."""
+  from app.v1 import user
+  user._razorpay_client = FakeRazorpayClient()
@@ -0,0 +1,306 @@
+#benchmarks/loadtest.py
+#
+# End-to-end load test of app.v1.app on the in-memory storage backend, with
+# fakes for Firebase Auth, Razorpay and Gemini (benchmarks/fakes.py). Virtual
+# users run a weighted mix of journeys concurrently for a fixed duration:
+#
+#   browse  - GET /v1/user/menu
+#   pickup  - create order -> Razorpay webhook -> staff verifies pickup
+#   cancel  - create order -> student cancels
+#
+# Results (throughput and p50/p95/p99 per route) are printed as JSON and can
+# be saved as a baseline and compared against on a later run:
+#
+#   python -m benchmarks.loadtest [--users 50] [--duration 20] [--output base.json]
+#   python -m benchmarks.loadtest --compare base.json
+
+import os
+import io
+import json
+import hmac
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import contextlib
+from datetime import datetime, timedelta, timezone
+from benchmarks import fakes
+
+COLLEGE_ID = "loadtest-college"
+WEBHOOK_SECRET = "loadtest-webhook-secret"
+
+def _boot():
+  os.environ["RAZORPAY_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+  os.environ.setdefault("RAZORPAY_KEY_ID", "rzp_test_loadtest")
+
+  db, fake_auth = fakes.install()
+  from app.v1 import app as app_module
+  fakes.patch_app()
+  app_module.limiter.enabled = False
+  return app_module.app, db, fake_auth
+
+def seed(db, fake_auth, stalls: int, items_per_stall: int, users: int, stock_units: int) -> dict:
+  from app.v1.stock import set_stock
+
+  college_ref = db.collection("colleges").document(COLLEGE_ID)
+  college_ref.set({"name": "Load Test College", "domains": ["example.edu"]})
+
+  created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+  stall_fixtures = []
+
+  for s in range(stalls):
+    stall_id = f"stall-{s}"
+    stall_ref = college_ref.collection("stalls").document(stall_id)
+    stall_ref.set({"name": f"Stall {s}", "status": "active", "isVerified": True})
+
+    batch = db.batch()
+    item_ids = []
+    for i in range(items_per_stall):
+      item_id = f"{stall_id}-item-{i}"
+      item_ref = stall_ref.collection("menu_items").document(item_id)
+      item = {
+        "name": f"Item {s}-{i}",
+        "price": 20 + (i % 10) * 10,
+        "category": ["Snacks", "Meals", "Beverages"][i % 3],
+        "is_available": True,
+        "created_at": created_at + timedelta(minutes=i),
+        "updated_at": created_at + timedelta(minutes=i),
+      }
+      if stock_units:
+        item.update(set_stock(batch, item_ref, stock_units))
+      batch.set(item_ref, item)
+      item_ids.append(item_id)
+    batch.commit()
+
+    staff_uid = f"staff-{s}"
+    db.collection("staffs").document(staff_uid).set({
+      "email": f"{staff_uid}@example.edu",
+      "name": f"Staff {s}",
+      "role": "manager",
+      "status": "active",
+      "stall_id": stall_id,
+      "college_id": COLLEGE_ID,
+    })
+
+    stall_fixtures.append({
+      "stall_id": stall_id,
+      "item_ids": item_ids,
+      "staff_token": fake_auth.issue_token(staff_uid),
+    })
+
+  user_tokens = []
+  for u in range(users):
+    uid = f"student-{u}"
+    db.collection("users").document(uid).set({
+      "name": f"Student {u}",
+      "roll_number": f"R{u:05d}",
+      "phone": "9999999999",
+      "college_id": COLLEGE_ID,
+    })
+    user_tokens.append(fake_auth.issue_token(uid))
+
+  return {"stalls": stall_fixtures, "user_tokens": user_tokens}
+
+class Recorder:
+  def __init__(self):
+    self.samples = {}
+    self.errors = {}
+
+  def record(self, route: str, status_code: int, seconds: float):
+    self.samples.setdefault(route, []).append(seconds)
+    if status_code >= 400:
+      self.errors[route] = self.errors.get(route, 0) + 1
+
+def _percentile(sorted_values: list, percent: float) -> float:
+  if not sorted_values:
+    return 0.0
+  index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1))
+  return sorted_values[index]
+
+async def _request(client, recorder: Recorder, route: str, method: str, url: str, **kwargs):
+  start = time.perf_counter()
+  response = await client.request(method, url, **kwargs)
+  recorder.record(route, response.status_code, time.perf_counter() - start)
+  return response
+
+def _auth(token: str) -> dict:
+  return {"Authorization": f"Bearer {token}"}
+
+async def browse(client, recorder, fixtures, rng, db):
+  token = rng.choice(fixtures["user_tokens"])
+  await _request(client, recorder, "GET /v1/user/menu", "GET", "/v1/user/menu", headers=_auth(token))
+
+async def _create_order(client, recorder, fixtures, rng):
+  token = rng.choice(fixtures["user_tokens"])
+  stall = rng.choice(fixtures["stalls"])
+  items = [
+    {"item_id": item_id, "quantity": rng.randint(1, 3)}
+    for item_id in rng.sample(stall["item_ids"], k=min(len(stall["item_ids"]), rng.randint(1, 4)))
+  ]
+  response = await _request(
+    client, recorder, "POST /v1/user/order/create", "POST", "/v1/user/order/create",
+    headers=_auth(token),
+    json={"stall_id": stall["stall_id"], "items": items}
+  )
+  if response.status_code != 200:
+    return None
+  return token, stall, response.json()
+
+async def pickup(client, recorder, fixtures, rng, db):
+  created = await _create_order(client, recorder, fixtures, rng)
+  if created is None:
+    return
+  _, stall, order = created
+
+  payment_id = f"pay_{rng.getrandbits(48):012x}"
+  body = json.dumps({
+    "event": "payment.captured",
+    "payload": {"payment": {"entity": {
+      "id": payment_id,
+      "amount": order["amount"],
+      "notes": {"internal_order_id": order["internal_order_id"]},
+    }}},
+  }).encode()
+  signature = hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+  await _request(
+    client, recorder, "POST /webhook/razorpay", "POST", "/webhook/razorpay",
+    content=body,
+    headers={"X-Razorpay-Signature": signature, "Content-Type": "application/json"}
+  )
+
+  # The student reads the code off their app; the harness reads it directly.
+  pickup_code = db.collection("orders").document(order["internal_order_id"]).get().to_dict().get("pickup_code")
+  if not pickup_code:
+    return
+
+  await _request(
+    client, recorder, "POST /v1/staff/orders/verify-pickup", "POST", "/v1/staff/orders/verify-pickup",
+    headers=_auth(stall["staff_token"]),
+    json={"order_id": order["internal_order_id"], "pickup_code": pickup_code}
+  )
+
+async def cancel(client, recorder, fixtures, rng, db):
+  created = await _create_order(client, recorder, fixtures, rng)
+  if created is None:
+    return
+  token, _, order = created
+
+  await _request(
+    client, recorder, "POST /v1/user/order/{order_id}/cancel", "POST",
+    f"/v1/user/order/{order['internal_order_id']}/cancel",
+    headers=_auth(token)
+  )
+
+SCENARIOS = {"browse": browse, "pickup": pickup, "cancel": cancel}
+
+def _parse_mix(value: str) -> dict:
+  mix = {}
+  for part in value.split(","):
+    name, _, weight = part.partition("=")
+    name = name.strip()
+    if name not in SCENARIOS:
+      raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+    mix[name] = float(weight or 1)
+  return mix
+
+async def _virtual_user(client, recorder, fixtures, mix: dict, deadline: float, seed: int, db):
+  rng = random.Random(seed)
+  names, weights = list(mix), list(mix.values())
+  while time.perf_counter() < deadline:
+    await SCENARIOS[rng.choices(names, weights)[0]](client, recorder, fixtures, rng, db)
+
+async def run(app, db, fixtures, users: int, duration: float, mix: dict, seed: int) -> dict:
+  import httpx
+
+  recorder = Recorder()
+  transport = httpx.ASGITransport(app=app)
+  async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+      _virtual_user(client, recorder, fixtures, mix, deadline, seed + index, db)
+      for index in range(users)
+    ))
+    elapsed = time.perf_counter() - start
+
+  routes = {}
+  total = 0
+  for route, samples in sorted(recorder.samples.items()):
+    samples.sort()
+    total += len(samples)
+    routes[route] = {
+      "requests": len(samples),
+      "errors": recorder.errors.get(route, 0),
+      "throughput_rps": round(len(samples) / elapsed, 2),
+      "p50_ms": round(_percentile(samples, 50) * 1000, 3),
+      "p95_ms": round(_percentile(samples, 95) * 1000, 3),
+      "p99_ms": round(_percentile(samples, 99) * 1000, 3),
+    }
+
+  return {
+    "elapsed_s": round(elapsed, 3),
+    "requests": total,
+    "throughput_rps": round(total / elapsed, 2),
+    "routes": routes,
+  }
+
+def compare(current: dict, baseline: dict) -> dict:
+  """Percent change per route metric versus a saved baseline (positive = slower/more)."""
+  changes = {}
+  for route, metrics in current["routes"].items():
+    previous = baseline.get("routes", {}).get(route)
+    if not previous:
+      continue
+    changes[route] = {
+      key: round((metrics[key] - previous[key]) / previous[key] * 100, 1)
+      for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+      if previous.get(key)
+    }
+  return changes
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+  parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+  parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("browse=6,pickup=3,cancel=1"))
+  parser.add_argument("--stalls", type=int, default=8)
+  parser.add_argument("--items", type=int, default=25, help="menu items per stall")
+  parser.add_argument("--students", type=int, default=500)
+  parser.add_argument("--stock", type=int, default=0, help="track sharded stock with this many units per item")
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--output", help="write the JSON result to this file")
+  parser.add_argument("--compare", help="baseline JSON file to compare against")
+  parser.add_argument("--verbose", action="store_true", help="keep the app's print() output")
+  args = parser.parse_args()
+
+  app, db, fake_auth = _boot()
+  fixtures = seed(db, fake_auth, args.stalls, args.items, args.students, args.stock)
+
+  output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+  with output:
+    result = asyncio.run(run(app, db, fixtures, args.users, args.duration, args.mix, args.seed))
+
+  result["config"] = {
+    "users": args.users,
+    "duration_s": args.duration,
+    "mix": args.mix,
+    "stalls": args.stalls,
+    "items_per_stall": args.items,
+    "students": args.students,
+    "stock": args.stock,
+    "seed": args.seed,
+  }
+
+  if args.compare:
+    with open(args.compare) as f:
+      result["change_vs_baseline_pct"] = compare(result, json.load(f))
+
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(result, f, indent=2)
+
+  print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,88 @@
+#benchmarks/payloads.py
+#
+# Realistic Firestore-shaped payloads shared by the benchmark scripts.
+
+from datetime import datetime, timezone, timedelta
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+def _ts(offset_minutes: int = 0):
+  base = datetime(2026, 1, 20, 12, 30, tzinfo=timezone.utc) + timedelta(minutes=offset_minutes)
+  return DatetimeWithNanoseconds(
+    base.year, base.month, base.day, base.hour, base.minute, base.second,
+    nanosecond=123456789, tzinfo=timezone.utc
+  )
+
+def make_order(i: int) -> dict:
+  return {
+    "id": f"order{i:016d}",
+    "user_id": "Xr4pB0yq9LZk2mN7sT1u",
+    "user_details": {"name": "Aarav Sharma", "roll_number": "22CS1042", "phone": "+919876543210"},
+    "stall_id": "stall_main_canteen",
+    "stall_name": "Main Canteen",
+    "college_id": "college_demo",
+    "items": [
+      {"item_id": f"item{j}", "name": f"Veg Thali {j}", "price": 60 + j, "quantity": 1 + j % 3}
+      for j in range(3)
+    ],
+    "total_amount": 245,
+    "status": "CANCELLED",
+    "pickup_code": "4821",
+    "refund_policy": {"ready_refund_percent": 50, "cancellation_allowed": True},
+    "refund": {
+      "status": "COMPLETED",
+      "amount": 245,
+      "type": "FULL_REFUND",
+      "razorpay_refund_id": "rfnd_N1a2b3c4d5e6f7",
+      "processed_at": _ts(30),
+    },
+    "razorpay_payment_data": {
+      "id": "pay_N1a2b3c4d5e6f7",
+      "amount": 24500,
+      "currency": "INR",
+      "method": "upi",
+      "notes": {"internal_order_id": f"order{i:016d}", "stall_id": "stall_main_canteen"},
+      "acquirer_data": {"rrn": "512345678901", "upi_transaction_id": "AXL0123456789"},
+      "created_at": 1768912200,
+    },
+    "created_at": _ts(),
+    "updated_at": _ts(31),
+    "cancelled_at": _ts(20),
+  }
+
+def make_menu_item(i: int) -> dict:
+  return {
+    "item_id": f"menuitem{i:012d}",
+    "name": f"Paneer Butter Masala {i}",
+    "price": 120 + i,
+    "description": "Cottage cheese in rich tomato gravy",
+    "image_ref": f"images/paneer-butter-masala-{i}.jpg",
+    "is_available": True,
+    "created_at": _ts(i),
+    "updated_at": _ts(i + 1),
+  }
+
+def make_college_menu(stalls: int = 8, items_per_stall: int = 25) -> dict:
+  return {
+    "college_id": "college_demo",
+    "stalls": [
+      {
+        "stall_id": f"stall{s:04d}",
+        "stall_name": f"Food Court Stall {s}",
+        "menu_items": [
+          {key: value for key, value in make_menu_item(i).items() if key not in ("created_at", "updated_at")}
+          for i in range(items_per_stall)
+        ],
+      }
+      for s in range(stalls)
+    ],
+  }
+
+def make_order_queue(orders: int = 30) -> dict:
+  queue = []
+  for i in range(orders):
+    order = make_order(i)
+    order["status"] = "PAID"
+    order.pop("refund")
+    order.pop("cancelled_at")
+    queue.append(order)
+  return {"stall_id": "stall_main_canteen", "count": len(queue), "orders": queue}
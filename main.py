@@ -1,6 +1,94 @@
 #main.py
+#
+# Production entry point (the Docker image runs `python main.py`). Picks uvloop
+# and httptools when installed, sizes workers from the container's CPU quota
+# and drains in-flight requests, including SSE menu scans, on SIGTERM.
 
+import os
+import math
+import logging
+import logging.config
+import importlib.util
 import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+
+APP = "app.v1.app:app"
+
+# Keep idle connections open longer than the load balancer in front does
+# (60s on most), so it never reuses a socket the server is closing.
+KEEP_ALIVE_SECONDS = int(os.getenv("SERVER_KEEP_ALIVE_SECONDS", "75"))
+# Accept queue for connection bursts of short API calls (capped by the
+# kernel's net.core.somaxconn).
+BACKLOG = int(os.getenv("SERVER_BACKLOG", "4096"))
+# Time given to in-flight requests and streams after SIGTERM before they are
+# cancelled; Cloud Run kills the container 10s after SIGTERM.
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("SERVER_GRACEFUL_SHUTDOWN_SECONDS", "8"))
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def cgroup_cpu_limit():
+    """CPUs allowed by the cgroup (v2 cpu.max or v1 cfs quota), or None if unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+def worker_count() -> int:
+    """
+    WEB_CONCURRENCY if set, otherwise one worker per CPU the container may
+    use: the cgroup quota rounded up, capped by the CPUs it is pinned to.
+    """
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+def server_options() -> dict:
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "8080")),
+        "workers": worker_count(),
+        "loop": "uvloop" if _installed("uvloop") else "asyncio",
+        "http": "httptools" if _installed("httptools") else "h11",
+        "timeout_keep_alive": KEEP_ALIVE_SECONDS,
+        "backlog": BACKLOG,
+        "timeout_graceful_shutdown": GRACEFUL_SHUTDOWN_SECONDS,
+        "access_log": os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true",
+    }
 
 if __name__ == "__main__":
-    uvicorn.run("app.v1.app:app", host="0.0.0.0", port=8080)
+    options = server_options()
+    # uvicorn only sets up its loggers inside run(); apply the same config
+    # first so the startup line goes through its handler and format.
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logging.getLogger("uvicorn.error").info(
+        "Starting %s with %d worker(s), loop=%s, http=%s",
+        APP, options["workers"], options["loop"], options["http"],
+    )
+    uvicorn.run(APP, **options)
@@ -0,0 +1,11 @@
+# tests/conftest.py
+#
+# Tests run against the in-memory storage backend; it must be selected
+# before any app module is imported.
+
+import os
+import sys
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,186 @@
+# tests/test_mailer.py
+#
+# The mail outbox against a local fake SendGrid server, reached through
+# SENDGRID_API_HOST like a real deployment would point at the API.
+
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.v1 import mailer
+from app.v1.firebase_init import db
+
+class FakeSendGrid:
+  """POST /v3/mail/send: records each request and answers with the next queued status (default 202)."""
+
+  def __init__(self):
+    self.requests = []
+    self.statuses = []
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        fake.requests.append({"path": self.path, "auth": self.headers.get("Authorization"), "body": json.loads(body)})
+        status = fake.statuses.pop(0) if fake.statuses else 202
+        payload = b"" if status == 202 else json.dumps({"errors": [{"message": "fake error"}]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.host = f"http://127.0.0.1:{self.server.server_address[1]}"
+    self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+  def __enter__(self):
+    self.thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def recipients(self) -> list:
+    return [
+      to["email"]
+      for request in self.requests
+      for personalization in request["body"]["personalizations"]
+      for to in personalization["to"]
+    ]
+
+class Clock:
+  def __init__(self):
+    self.now = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+  def __call__(self):
+    return self.now
+
+  def advance(self, seconds: float):
+    self.now += timedelta(seconds=seconds)
+
+@pytest.fixture
+def sendgrid_fake(monkeypatch):
+  with FakeSendGrid() as fake:
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+    monkeypatch.setenv("SENDGRID_FROM_EMAIL", "noreply@greenplate.test")
+    monkeypatch.setattr(mailer, "SENDGRID_API_HOST", fake.host)
+    monkeypatch.setattr(mailer, "_sendgrid_client", None)
+    yield fake
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(mailer, "_utcnow", clock)
+  return clock
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+  for doc in db.collection(mailer.OUTBOX_COLLECTION).stream():
+    doc.reference.delete()
+
+def _outbox(message_id: str) -> dict:
+  return db.collection(mailer.OUTBOX_COLLECTION).document(message_id).get().to_dict()
+
+def test_sends_batches_through_one_client(sendgrid_fake, clock, monkeypatch):
+  created = []
+  client_class = mailer.sendgrid.SendGridAPIClient
+
+  def counting_client(*args, **kwargs):
+    created.append(args)
+    return client_class(*args, **kwargs)
+
+  monkeypatch.setattr(mailer.sendgrid, "SendGridAPIClient", counting_client)
+
+  first = [mailer.queue_staff_password_setup_email(f"a{i}@college.test", f"https://reset/{i}") for i in range(3)]
+  assert mailer.process_outbox_once() == 3
+
+  second = mailer.queue_staff_password_setup_email("b@college.test", "https://reset/b")
+  assert mailer.process_outbox_once() == 1
+
+  assert len(created) == 1
+  assert len(sendgrid_fake.requests) == 2
+  assert sendgrid_fake.requests[0]["path"] == "/v3/mail/send"
+  assert sendgrid_fake.requests[0]["auth"] == "Bearer SG.test"
+  assert sendgrid_fake.recipients() == ["a0@college.test", "a1@college.test", "a2@college.test", "b@college.test"]
+  assert sendgrid_fake.requests[0]["body"]["personalizations"][1]["substitutions"] == {"-reset_link-": "https://reset/1"}
+  assert all(_outbox(message_id)["status"] == "SENT" for message_id in first + [second])
+
+def test_retries_with_backoff_until_max_attempts(sendgrid_fake, clock, monkeypatch):
+  monkeypatch.setattr(mailer, "MAIL_MAX_ATTEMPTS", 3)
+  monkeypatch.setattr(mailer.random, "uniform", lambda low, high: 1.0)
+  sendgrid_fake.statuses = [500, 503, 500]
+
+  message_id = mailer.queue_staff_password_setup_email("c@college.test", "https://reset/c")
+
+  for attempt in (1, 2):
+    assert mailer.process_outbox_once() == 1
+    message = _outbox(message_id)
+    assert message["status"] == "PENDING"
+    assert message["attempts"] == attempt
+    delay = mailer.MAIL_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)
+    assert message["next_attempt_at"] == clock.now + timedelta(seconds=delay)
+
+    # Not due again until the backoff has passed.
+    clock.advance(delay - 1)
+    assert mailer.process_outbox_once() == 0
+    clock.advance(1)
+
+  assert mailer.process_outbox_once() == 1
+  message = _outbox(message_id)
+  assert message["status"] == "FAILED"
+  assert message["attempts"] == 3
+  assert len(sendgrid_fake.requests) == 3
+
+  clock.advance(mailer.MAIL_BACKOFF_MAX_SECONDS)
+  assert mailer.process_outbox_once() == 0
+
+def test_permanent_failure_is_isolated_to_one_recipient(sendgrid_fake, clock):
+  sendgrid_fake.statuses = [400, 202, 400]
+
+  good = mailer.queue_staff_password_setup_email("good@college.test", "https://reset/good")
+  bad = mailer.queue_staff_password_setup_email("bad@college.test", "https://reset/bad")
+  assert mailer.process_outbox_once() == 2
+
+  assert _outbox(good)["status"] == "SENT"
+  assert _outbox(bad)["status"] == "FAILED"
+  assert _outbox(bad)["attempts"] == 1
+  assert len(sendgrid_fake.requests) == 3
+
+def test_permanent_failure_is_not_retried(sendgrid_fake, clock):
+  sendgrid_fake.statuses = [400]
+
+  message_id = mailer.queue_staff_password_setup_email("rejected@college.test", "https://reset/r")
+  assert mailer.process_outbox_once() == 1
+
+  message = _outbox(message_id)
+  assert message["status"] == "FAILED"
+  assert message["attempts"] == 1
+  assert "400" in message["last_error"]
+
+  clock.advance(mailer.MAIL_BACKOFF_MAX_SECONDS)
+  assert mailer.process_outbox_once() == 0
+  assert len(sendgrid_fake.requests) == 1
+
+def test_expired_lease_is_reclaimed(sendgrid_fake, clock):
+  message_id = mailer.queue_staff_password_setup_email("d@college.test", "https://reset/d")
+
+  # A worker claims the message and dies before sending it.
+  assert len(mailer._claim_due_messages(10)) == 1
+  assert _outbox(message_id)["claimed_by"] == mailer.WORKER_ID
+
+  # The lease keeps other workers off it until it runs out.
+  clock.advance(mailer.MAIL_LEASE_SECONDS - 1)
+  assert mailer.process_outbox_once() == 0
+  assert sendgrid_fake.requests == []
+
+  clock.advance(1)
+  assert mailer.process_outbox_once() == 1
+  assert _outbox(message_id)["status"] == "SENT"
+  assert sendgrid_fake.recipients() == ["d@college.test"]